@@ -0,0 +1,91 @@
+import hashlib
+import zlib
+
+# Texts longer than this, in characters, are stored out of line
+BLOB_THRESHOLD_CHARS = 4000
+
+# Number of characters of an out-of-line text kept in its row
+PREVIEW_CHARS = 500
+
+# zlib level: large research dumps compress well even at a fast setting
+COMPRESSION_LEVEL = 6
+
+INSERT_BLOB_SQL = "INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)"
+
+SELECT_BLOB_SQL = "SELECT data FROM blobs WHERE hash = ?"
+
+# Blobs no task result or memory entry refers to any more
+PRUNE_BLOBS_SQL = """
+    DELETE FROM blobs
+    WHERE hash NOT IN (SELECT result_blob FROM tasks WHERE result_blob IS NOT NULL)
+    AND hash NOT IN (SELECT content_blob FROM agent_memory WHERE content_blob IS NOT NULL)
+"""
+
+def content_hash(text: str) -> str:
+    """Returns the key of a text in the blob store."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def preview(text: str, max_chars: int = PREVIEW_CHARS) -> str:
+    """Returns the beginning of a text with a note of how much was left out."""
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}\n[... {len(text) - max_chars} more characters stored out of line ...]"
+
+def offload(text: str, threshold: int = BLOB_THRESHOLD_CHARS) -> tuple:
+    """
+    Moves a large text to the blob store.
+
+    The caller queues the returned writes together with the row that refers to
+    the text, in a single WriteBuffer.add_many call, so the blob and the row are
+    always written in the same transaction. Identical texts are stored once.
+
+    Args:
+        text (str): The text.
+        threshold (int): The size in characters above which the text is moved.
+
+    Returns:
+        tuple: The text to store in the row, i.e. the text itself or its preview,
+            the blob's hash, or None if the text was small enough to keep inline,
+            and the list of (sql, params) writes that store the blob.
+    """
+    if text is None or len(text) <= threshold:
+        return text, None, []
+    blob_hash = content_hash(text)
+    writes = [(INSERT_BLOB_SQL, (blob_hash, len(text), zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)))]
+    return preview(text), blob_hash, writes
+
+def load_blob(db_conn, blob_hash: str) -> str:
+    """
+    Loads and decompresses a text from the blob store.
+
+    Args:
+        db_conn (sqlite3.Connection): The database connection.
+        blob_hash (str): The blob's hash.
+
+    Returns:
+        str: The text, or None if there is no such blob.
+    """
+    row = db_conn.execute(SELECT_BLOB_SQL, (blob_hash,)).fetchone()
+    return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+def resolve(db_conn, text: str, blob_hash: str) -> str:
+    """
+    Returns the full text of a row, loading it from the blob store if it was moved there.
+
+    Args:
+        db_conn (sqlite3.Connection): The database connection.
+        text (str): The text stored in the row.
+        blob_hash (str): The hash stored next to it, or None.
+
+    Returns:
+        str: The full text. If the blob is missing, the stored preview.
+    """
+    if blob_hash is None:
+        return text
+    full_text = load_blob(db_conn, blob_hash)
+    return text if full_text is None else full_text
+
+def prune_blobs(db_conn) -> int:
+    """Deletes the blobs nothing refers to any more and returns how many were deleted."""
+    with db_conn:
+        return db_conn.execute(PRUNE_BLOBS_SQL).rowcount
@@ -0,0 +1,71 @@
+import json
+import time
+from collections import namedtuple
+from agents.blob_store import prune_blobs, resolve
+from agents.tracing import tracer
+
+# The saved progress of a project: its plan, the IDs of its task rows, the
+# results of its completed tasks by index, and the orchestrator's state, e.g.
+# the number of Critic refinement rounds started
+Checkpoint = namedtuple("Checkpoint", ["tasks", "task_ids", "finished", "state"])
+
+SELECT_CHECKPOINT_TASKS_SQL = """
+    SELECT id, task_index, spec, status, result, result_blob FROM tasks
+    WHERE project_id = ?
+    ORDER BY task_index, id
+"""
+
+SELECT_CHECKPOINT_STATE_SQL = "SELECT state FROM checkpoints WHERE project_id = ?"
+
+UPSERT_CHECKPOINT_STATE_SQL = """
+    INSERT INTO checkpoints (project_id, state, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (project_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+"""
+
+def load_checkpoint(db_conn, project_id: str):
+    """
+    Loads the saved progress of a project.
+
+    Args:
+        db_conn (sqlite3.Connection): The database connection.
+        project_id (str): The project ID.
+
+    Returns:
+        Checkpoint: The checkpoint, or None if the project has no complete saved plan,
+            e.g. because it never started or was started before plans were saved.
+    """
+    with tracer.span("db.load_checkpoint", trace_id=project_id):
+        rows = db_conn.execute(SELECT_CHECKPOINT_TASKS_SQL, (project_id,)).fetchall()
+        if not rows or any(spec is None or task_index != i for i, (_, task_index, spec, _, _, _) in enumerate(rows)):
+            return None
+
+        tasks = [json.loads(spec) for _, _, spec, _, _, _ in rows]
+        task_ids = [task_id for task_id, _, _, _, _, _ in rows]
+        finished = {
+            index: resolve(db_conn, result, result_blob)
+            for index, (_, _, _, status, result, result_blob) in enumerate(rows) if status == 'completed'
+        }
+        row = db_conn.execute(SELECT_CHECKPOINT_STATE_SQL, (project_id,)).fetchone()
+        state = json.loads(row[0]) if row else {}
+    return Checkpoint(tasks, task_ids, finished, state)
+
+def save_checkpoint_state(db_conn, project_id: str, **state):
+    """
+    Saves the orchestrator's state for a project, merged into the state saved before.
+
+    Args:
+        db_conn (sqlite3.Connection): The database connection.
+        project_id (str): The project ID.
+        **state: The values to save; they must be JSON-serializable.
+    """
+    row = db_conn.execute(SELECT_CHECKPOINT_STATE_SQL, (project_id,)).fetchone()
+    merged = dict(json.loads(row[0]) if row else {}, **state)
+    with db_conn:
+        db_conn.execute(UPSERT_CHECKPOINT_STATE_SQL, (project_id, json.dumps(merged), time.time()))
+
+def clear_checkpoint(db_conn, project_id: str):
+    """Deletes the task rows and saved state of a project, so it can start over."""
+    with db_conn:
+        db_conn.execute("DELETE FROM tasks WHERE project_id = ?", (project_id,))
+        db_conn.execute("DELETE FROM checkpoints WHERE project_id = ?", (project_id,))
+    prune_blobs(db_conn)
@@ -0,0 +1,168 @@
+import ast
+import hashlib
+import re
+import sqlite3
+import textwrap
+import threading
+import time
+from typing import Optional
+from agents.storage import configure_connection
+from agents.tracing import tracer
+
+CODE_FENCE_RE = re.compile(r"```[ \t]*([\w+-]*)[ \t]*\n(.*?)(?:```|$)", re.DOTALL)
+PYTHON_FENCE_LANGUAGES = ("", "python", "python3", "py")
+
+# Output of a run that failed, which is never cached
+FAILED_RUN_MARKERS = ("Traceback (most recent call last)", "An error occurred:")
+
+# AICodeSandbox reports a non-zero exit or stderr output as "Error (exit code N): ..." or "Error: ..."
+FAILED_RUN_PREFIX = "Error"
+
+class CodeCompileError(ValueError):
+    """Raised when the generated code does not compile, even after asking for a fix."""
+
+def is_failed_run(output: str) -> bool:
+    """Returns whether the output of a sandbox run reports a failure."""
+    return output.lstrip().startswith(FAILED_RUN_PREFIX) or any(marker in output for marker in FAILED_RUN_MARKERS)
+
+def extract_code(text: str) -> str:
+    """
+    Extracts the Python code from an LLM response.
+
+    If the response contains Markdown code fences, the Python (or untagged)
+    blocks are joined in order; otherwise the whole response is taken as code.
+
+    Args:
+        text (str): The LLM response.
+
+    Returns:
+        str: The code.
+    """
+    blocks = [body for language, body in CODE_FENCE_RE.findall(text) if language.lower() in PYTHON_FENCE_LANGUAGES]
+    code = "\n\n".join(blocks) if blocks else text
+    return textwrap.dedent(code).strip() + "\n"
+
+def check_code(code: str) -> Optional[str]:
+    """
+    Compiles code in-process to catch syntax errors before it is sent to a sandbox.
+
+    Args:
+        code (str): The Python code.
+
+    Returns:
+        str: A description of the first syntax error, or None if the code compiles.
+    """
+    try:
+        compile(code, "<programmer>", "exec", dont_inherit=True)
+    except (SyntaxError, ValueError) as e:
+        if isinstance(e, SyntaxError) and e.lineno:
+            line = (e.text or "").rstrip()
+            return f"{type(e).__name__}: {e.msg} (line {e.lineno}): {line.strip()}"
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def code_fingerprint(code: str) -> str:
+    """
+    Returns a hash of code that ignores comments, blank lines and formatting.
+
+    The code must compile.
+    """
+    return hashlib.sha256(ast.dump(ast.parse(code)).encode("utf-8")).hexdigest()
+
+def inputs_fingerprint(*inputs: str) -> str:
+    """Returns a hash of the data a program's output depends on, e.g. the results of upstream tasks."""
+    digest = hashlib.sha256()
+    for value in inputs:
+        digest.update(str(value).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ExecutionCache:
+    """
+    A persistent cache of program outputs, backed by SQLite.
+
+    Entries are keyed by the normalized code's fingerprint and the
+    fingerprint of its inputs, so a rerun of the same program on the same
+    data is answered without a sandbox. Only successful runs are cached, and
+    entries expire after a time-to-live.
+    """
+
+    def __init__(self, db_path: str = 'execution_cache.db', ttl: Optional[float] = 7 * 24 * 3600):
+        """
+        Initializes the ExecutionCache instance.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            ttl (float, optional): The number of seconds after which an entry expires.
+                None keeps entries forever.
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = configure_connection(sqlite3.connect(db_path, check_same_thread=False))
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS execution_cache (
+                code_hash TEXT,
+                inputs_hash TEXT,
+                output TEXT,
+                created_at REAL,
+                PRIMARY KEY (code_hash, inputs_hash)
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, code: str, inputs: str = "") -> Optional[str]:
+        """
+        Returns the cached output of a program, or None if there is no fresh entry.
+
+        Args:
+            code (str): The program; it must compile.
+            inputs (str): The fingerprint of the program's inputs.
+
+        Returns:
+            str: The output, or None.
+        """
+        code_hash = code_fingerprint(code)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output, created_at FROM execution_cache WHERE code_hash = ? AND inputs_hash = ?",
+                (code_hash, inputs)
+            ).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, code: str, inputs: str, output: str):
+        """
+        Stores the output of a successful run.
+
+        Args:
+            code (str): The program; it must compile.
+            inputs (str): The fingerprint of the program's inputs.
+            output (str): The program's output. Failed runs are ignored.
+        """
+        if is_failed_run(output):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO execution_cache (code_hash, inputs_hash, output, created_at) VALUES (?, ?, ?, ?)",
+                (code_fingerprint(code), inputs, output, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def lookup_output(execution_cache: Optional[ExecutionCache], code: str, inputs: str) -> Optional[str]:
+    """Returns the cached output of a program, recording the lookup in the metrics."""
+    if execution_cache is None:
+        return None
+    output = execution_cache.get(code, inputs)
+    tracer.metrics.inc("execution_cache_lookups_total", result="hit" if output is not None else "miss")
+    return output
@@ -0,0 +1,175 @@
+import threading
+from collections import deque
+
+# Rough number of characters per token for the local models we run
+CHARS_PER_TOKEN = 4
+
+# Token budget for the memory context given to each agent
+AGENT_TOKEN_BUDGETS = {
+    'Manager': 500,
+    'Researcher': 600,
+    'Writer': 1500,
+    'Programmer': 800,
+    'Critic': 1000,
+}
+DEFAULT_TOKEN_BUDGET = 1000
+
+# Token budget for the search results the Researcher sees per search
+SEARCH_OBSERVATION_TOKENS = 600
+
+# Research larger than this is summarized piece by piece before the report is written
+WRITER_MAP_REDUCE_TOKENS = 1500
+
+# The size of the pieces of research the Writer summarizes in parallel
+WRITER_MAP_CHUNK_TOKENS = 1000
+
+# Token budget for the research a Writer is given. Research above
+# WRITER_MAP_REDUCE_TOKENS is condensed before the report is written, so this
+# only bounds the number of map calls, not the size of the Writer's prompt.
+RESEARCH_TOKEN_BUDGET = 16 * WRITER_MAP_CHUNK_TOKENS
+
+CONTEXT_HEADER = "Recent Memory Entries (most recent first):\n"
+
+SELECT_NEW_ENTRIES_SQL = """
+    SELECT id, timestamp, agent_name, action, COALESCE(summary, content)
+    FROM agent_memory
+    WHERE project_id = ? AND id > ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a text without running a tokenizer.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """
+    Shortens a text to roughly max_tokens by keeping its beginning and end.
+
+    Args:
+        text (str): The text to shorten.
+        max_tokens (int): The approximate maximum number of tokens to keep.
+
+    Returns:
+        str: The text itself if it fits, otherwise its head and tail around an omission marker.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    marker = f"\n[... {len(text) - max_chars} characters omitted ...]\n"
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    return text[:head] + marker + text[-tail:]
+
+class ContextBuilder:
+    """
+    Builds token-budgeted memory contexts incrementally.
+
+    The builder caches the formatted recent entries of each project and only
+    reads entries newer than the last one it has seen, so building a context
+    for a new task does not re-read and re-format the whole history. Entries
+    are formatted from their stored summary when one exists.
+    """
+
+    def __init__(self, max_cached_entries: int = 100):
+        """
+        Initializes the ContextBuilder instance.
+
+        Args:
+            max_cached_entries (int): The number of recent entries cached per project.
+        """
+        self.max_cached_entries = max_cached_entries
+        self._projects = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self, conn, project_id: str) -> deque:
+        """Appends the project's entries written since the last refresh to its cache."""
+        last_id, entries = self._projects.get(project_id, (0, None))
+        if entries is None:
+            entries = deque(maxlen=self.max_cached_entries)
+
+        rows = conn.execute(
+            SELECT_NEW_ENTRIES_SQL, (project_id, last_id, self.max_cached_entries)
+        ).fetchall()
+        for entry_id, timestamp, agent_name, action, content in reversed(rows):
+            line = f"- [{timestamp}] {agent_name} {action}: {content}\n"
+            entries.append((entry_id, line, estimate_tokens(line)))
+            last_id = entry_id
+
+        self._projects[project_id] = (last_id, entries)
+        return entries
+
+    def recent_ids(self, conn, project_id: str, limit: int = 10) -> list:
+        """
+        Returns the IDs of the entries a context with the given limit would draw from.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            project_id (str): The ID of the project.
+            limit (int): The maximum number of memory entries.
+
+        Returns:
+            list: The IDs of the most recent entries of the project.
+        """
+        with self._lock:
+            entries = list(self._refresh(conn, project_id))
+        return [entry_id for entry_id, _, _ in entries[-limit:]]
+
+    def build(self, conn, project_id: str, limit: int = 10, agent_name: str = None, token_budget: int = None) -> str:
+        """
+        Builds the memory context for a project within a token budget.
+
+        The most recent entries are kept first; older entries are dropped once
+        the budget is spent, and an entry that does not fit on its own is truncated.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            project_id (str): The ID of the project.
+            limit (int): The maximum number of memory entries to include.
+            agent_name (str, optional): The agent the context is for, used to pick the budget.
+            token_budget (int, optional): The token budget, overriding the agent's default.
+
+        Returns:
+            str: A formatted string of recent memory entries.
+        """
+        if token_budget is None:
+            token_budget = AGENT_TOKEN_BUDGETS.get(agent_name, DEFAULT_TOKEN_BUDGET)
+
+        with self._lock:
+            entries = list(self._refresh(conn, project_id))
+
+        if not entries:
+            return "No recent memory entries found."
+
+        remaining = token_budget - estimate_tokens(CONTEXT_HEADER)
+        selected = []
+        for _, line, tokens in reversed(entries[-limit:]):
+            if tokens > remaining:
+                if not selected:
+                    selected.append(truncate_text(line, max(remaining, 0)).rstrip("\n") + "\n")
+                break
+            selected.append(line)
+            remaining -= tokens
+
+        return CONTEXT_HEADER + "".join(reversed(selected))
+
+    def invalidate(self, project_id: str = None):
+        """
+        Drops the cached entries of a project, or of every project.
+
+        Args:
+            project_id (str, optional): The ID of the project. None clears the whole cache.
+        """
+        with self._lock:
+            if project_id is None:
+                self._projects.clear()
+            else:
+                self._projects.pop(project_id, None)
@@ -1,25 +1,14 @@
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from agents.prompts import layered_prompt
+from agents.registry import registry
+from agents.structured import StructuredOutputChain, parse_feedback
 
-def run_critic(report: str, llm):
-    """
-    Runs the critic agent to evaluate a report and suggest improvements.
-
-    Args:
-        report (str): The report to be evaluated.
-        llm: The language model instance.
-
-    Returns:
-        dict: A dictionary containing suggestions for new tasks.
-    """
+def _build_critic_chain(llm):
+    """Builds the structured-output chain that turns a report into proposed tasks."""
     # Define the prompt template for the critic agent
-    critic_template = \"\"\"
-    You are a critic agent. Your role is to evaluate a given report, identify its weaknesses,
+    critic_instructions = """
+    You are a critic agent. Your role is to evaluate the report given at the end, identify its weaknesses,
     and propose concrete, actionable tasks to improve it. These tasks will be sent to other agents.
 
-    The report is as follows:
-    {report}
-
     Please provide your feedback in the form of a JSON object with a single key "tasks".
     This key should contain a list of dictionaries, where each dictionary represents a new task.
     Each task should have the following keys:
@@ -42,18 +31,51 @@ def run_critic(report: str, llm):
             }}
         ]
     }}
-    \"\"\"
+    """
 
-    prompt = PromptTemplate(
-        template=critic_template,
-        input_variables=["report"],
+    prompt = layered_prompt(
+        critic_instructions,
+        task="""
+        The report is as follows:
+        {report}
+        """,
     )
 
-    # Create the chain with a JSON output parser
-    parser = JsonOutputParser()
-    chain = prompt | llm | parser
+    # Create the chain, repairing or re-prompting for malformed feedback
+    return StructuredOutputChain(prompt, llm, parse_feedback, name="critic")
+
+def run_critic(report: str, llm):
+    """
+    Runs the critic agent to evaluate a report and suggest improvements.
+
+    Args:
+        report (str): The report to be evaluated.
+        llm: The language model instance.
+
+    Returns:
+        dict: A dictionary containing suggestions for new tasks.
+    """
+    chain = registry.get("critic_chain", lambda: _build_critic_chain(llm), llm)
 
     # Invoke the chain
-    response = chain.invoke({{"report": report}})
+    response = chain.invoke({"report": report})
+
+    return response
+
+async def arun_critic(report: str, llm):
+    """
+    Asynchronously runs the critic agent to evaluate a report and suggest improvements.
+
+    Args:
+        report (str): The report to be evaluated.
+        llm: The language model instance.
+
+    Returns:
+        dict: A dictionary containing suggestions for new tasks.
+    """
+    chain = registry.get("critic_chain", lambda: _build_critic_chain(llm), llm)
+
+    # Invoke the chain without blocking the event loop
+    response = await chain.ainvoke({"report": report})
 
     return response
@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from agents.tracing import tracer
+
+# Lower values are served first: the plan and the report are on the critical
+# path, while research fans out into many calls that can wait their turn
+AGENT_PRIORITIES = {
+    'Manager': 0,
+    'Writer': 0,
+    'Critic': 1,
+    'Programmer': 1,
+    'Researcher': 2,
+}
+DEFAULT_PRIORITY = 1
+
+_current_agent = contextvars.ContextVar("llm_request_agent", default=None)
+
+@contextlib.contextmanager
+def request_priority(agent_name: str):
+    """Gives the LLM calls made inside the block the priority of the given agent."""
+    token = _current_agent.set(agent_name)
+    try:
+        yield
+    finally:
+        _current_agent.reset(token)
+
+_current_session = contextvars.ContextVar("llm_prompt_session", default=None)
+
+@contextlib.contextmanager
+def prompt_session(*key):
+    """
+    Sends the LLM calls made inside the block to the same host where possible.
+
+    Calls in one session, e.g. one agent's calls within a project, share
+    their prompt's prefix. Ollama keeps the KV cache of recent prompts and
+    only prefills the part after the longest cached prefix, so keeping a
+    session on one host saves most of the prefill.
+    """
+    token = _current_session.set(key)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+class _Waiter:
+    """A request waiting for a slot on one of the hosts."""
+    __slots__ = ("agent", "session", "enqueued", "host", "cancelled", "_event", "_future", "_loop")
+
+    def __init__(self, agent: str, session: tuple = None, loop=None):
+        self.agent = agent
+        self.session = session
+        self.enqueued = time.perf_counter()
+        self.host = None
+        self.cancelled = False
+        self._loop = loop
+        self._event = None if loop else threading.Event()
+        self._future = loop.create_future() if loop else None
+
+    def grant(self, host: str):
+        self.host = host
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(self.host)
+
+class LLMGateway:
+    """
+    Limits and prioritizes the requests sent to one or more Ollama hosts.
+
+    Every host serves at most max_in_flight requests at a time; further
+    requests wait in a priority queue ordered by AGENT_PRIORITIES and then by
+    arrival. A request is routed to the host with the fewest requests in
+    flight, so several Ollama servers can share the load.
+
+    The limit applies per process. Ollama batches the requests it serves at
+    the same time, so max_in_flight times the number of worker processes
+    should match the server's OLLAMA_NUM_PARALLEL.
+    """
+
+    def __init__(self, hosts: list, max_in_flight: int = 4, metrics=None, max_sessions: int = 1024):
+        """
+        Initializes the LLMGateway instance.
+
+        Args:
+            hosts (list): The base URLs of the Ollama servers.
+            max_in_flight (int): The maximum number of requests in flight per host.
+            metrics (MetricsRegistry, optional): Where to record the queue metrics. Defaults to the tracer's.
+            max_sessions (int): The number of recent prompt sessions whose host is remembered.
+        """
+        if not hosts:
+            raise ValueError("At least one Ollama host is required.")
+        self.hosts = list(hosts)
+        self.max_in_flight = max_in_flight
+        self.metrics = metrics or tracer.metrics
+        self._in_flight = {host: 0 for host in self.hosts}
+        self._waiting = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self._session_hosts = OrderedDict()
+
+    def _free_host(self, session: tuple = None):
+        """Returns the host for a request of the given session, or None if every host is busy. Must hold the lock."""
+        preferred = self._session_hosts.get(session) if session is not None else None
+        if preferred is not None and self._in_flight[preferred] < self.max_in_flight:
+            return preferred
+        host = min(self.hosts, key=lambda h: self._in_flight[h])
+        return host if self._in_flight[host] < self.max_in_flight else None
+
+    def _remember_host(self, session: tuple, host: str):
+        """Records the host a session was sent to, forgetting the least recent sessions. Must hold the lock."""
+        if len(self.hosts) == 1 or session is None:
+            return
+        self.metrics.inc("llm_gateway_session_routing_total", result="kept" if self._session_hosts.get(session) == host else "moved")
+        self._session_hosts[session] = host
+        self._session_hosts.move_to_end(session)
+        while len(self._session_hosts) > self.max_sessions:
+            self._session_hosts.popitem(last=False)
+
+    def _dispatch(self):
+        """Hands free slots to the waiting requests, highest priority first. Must hold the lock."""
+        while self._waiting:
+            waiter = self._waiting[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._waiting)
+                continue
+            host = self._free_host(waiter.session)
+            if host is None:
+                break
+            heapq.heappop(self._waiting)
+            self._remember_host(waiter.session, host)
+            self._in_flight[host] += 1
+            self.metrics.set_gauge("llm_gateway_in_flight", self._in_flight[host], host=host)
+            self.metrics.observe("llm_gateway_wait_seconds", time.perf_counter() - waiter.enqueued, agent=waiter.agent or "unknown")
+            waiter.grant(host)
+        self.metrics.set_gauge("llm_gateway_queue_depth", sum(1 for entry in self._waiting if not entry[2].cancelled))
+
+    def _enqueue(self, loop=None) -> _Waiter:
+        agent = _current_agent.get()
+        waiter = _Waiter(agent, _current_session.get(), loop)
+        with self._lock:
+            heapq.heappush(self._waiting, (AGENT_PRIORITIES.get(agent, DEFAULT_PRIORITY), next(self._order), waiter))
+            self._dispatch()
+        return waiter
+
+    def acquire(self) -> str:
+        """
+        Waits for a free slot and returns the host to send the request to.
+
+        The request's priority comes from the enclosing request_priority block,
+        and its preferred host from the enclosing prompt_session block.
+        Every acquire must be followed by a release of the returned host.
+        """
+        waiter = self._enqueue()
+        waiter._event.wait()
+        return waiter.host
+
+    async def aacquire(self) -> str:
+        """Asynchronously waits for a free slot and returns the host to send the request to."""
+        waiter = self._enqueue(asyncio.get_running_loop())
+        try:
+            return await waiter._future
+        except asyncio.CancelledError:
+            # Give back a slot that was granted while the request was being cancelled
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.host
+            if granted is not None:
+                self.release(granted)
+            raise
+
+    def release(self, host: str):
+        """Frees the slot of a finished request on a host."""
+        with self._lock:
+            self._in_flight[host] -= 1
+            self.metrics.set_gauge("llm_gateway_in_flight", self._in_flight[host], host=host)
+            self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Holds a slot for the duration of the block and yields its host."""
+        host = self.acquire()
+        try:
+            yield host
+        finally:
+            self.release(host)
+
+    def warm_up(self, model: str, keep_alive: str = None, timeout: float = 300.0) -> list:
+        """
+        Loads the model on every host, so the first real request does not pay for it.
+
+        Args:
+            model (str): The name of the model.
+            keep_alive (str, optional): How long the hosts keep the model loaded, e.g. "30m" or "-1".
+            timeout (float): The number of seconds to wait for each host.
+
+        Returns:
+            list: The hosts that could not be warmed up.
+        """
+        failed = []
+        payload = {"model": model}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        for host in self.hosts:
+            # A generate request without a prompt only loads the model
+            request = urllib.request.Request(
+                f"{host}/api/generate", data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                with tracer.span("llm.warm_up", host=host, model=model):
+                    with urllib.request.urlopen(request, timeout=timeout) as response:
+                        response.read()
+            except Exception as e:
+                print(f"Could not warm up {model} on {host}: {e}")
+                failed.append(host)
+        return failed
@@ -0,0 +1,289 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from agents.storage import DEFAULT_DB_PATH, get_connection
+
+# A research project waiting for or being processed by a worker. `status` is
+# one of "queued", "running", "completed" or "failed".
+Job = namedtuple("Job", [
+    "id", "project_id", "query", "status", "worker", "attempts", "error",
+    "created_at", "started_at", "heartbeat_at", "finished_at",
+])
+
+JOB_COLUMNS = ", ".join(Job._fields)
+
+class JobQueue:
+    """
+    A durable queue of research projects, stored in the jobs table.
+
+    Any number of processes can submit and claim jobs concurrently; claiming
+    takes the database write lock so every job is handed to exactly one
+    worker. Jobs whose worker stops sending heartbeats are put back in the
+    queue, up to max_attempts times.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, stale_after: float = 120.0, max_attempts: int = 3):
+        """
+        Initializes the JobQueue instance.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            stale_after (float): The number of seconds without a heartbeat after which
+                a running job is considered abandoned.
+            max_attempts (int): The number of times a job is started before an
+                abandoned job is marked as failed instead of requeued.
+        """
+        self.db_path = db_path
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+
+    def _get_connection(self):
+        """Returns the calling thread's database connection."""
+        return get_connection(self.db_path)
+
+    def submit(self, query: str, project_id: str = None) -> str:
+        """
+        Adds a research project to the queue.
+
+        Args:
+            query (str): The user's research query.
+            project_id (str, optional): The project ID. Defaults to a new UUID.
+
+        Returns:
+            str: The project ID.
+        """
+        project_id = project_id or str(uuid.uuid4())
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (project_id, query, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (project_id, query, time.time())
+            )
+        return project_id
+
+    def claim(self, worker_id: str):
+        """
+        Takes the oldest queued job and marks it as running.
+
+        Args:
+            worker_id (str): Identifies the claiming worker.
+
+        Returns:
+            Job: The claimed job, or None if the queue is empty.
+        """
+        conn = self._get_connection()
+        now = time.time()
+        # Take the write lock up front so no other worker can claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._recover_stale(conn, now)
+            row = conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                    error = NULL, started_at = ?, heartbeat_at = ?
+                WHERE id = ?
+                """,
+                (worker_id, now, now, row[0])
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return Job(*row)._replace(status="running", worker=worker_id, attempts=row[5] + 1, error=None, started_at=now, heartbeat_at=now)
+
+    def _recover_stale(self, conn, now: float):
+        """Requeues, or fails after max_attempts, the running jobs whose worker went silent."""
+        cutoff = now - self.stale_after
+        conn.execute(
+            """
+            UPDATE jobs SET status = 'failed', error = 'Worker stopped responding.', finished_at = ?
+            WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+            """,
+            (now, cutoff, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+            (cutoff,)
+        )
+
+    def heartbeat(self, job_ids: list):
+        """
+        Records that a worker is still processing the given jobs.
+
+        Args:
+            job_ids (list): The IDs of the jobs.
+        """
+        if not job_ids:
+            return
+        conn = self._get_connection()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                [(now, job_id) for job_id in job_ids]
+            )
+
+    def complete(self, job_id: int):
+        """Marks a job as completed."""
+        self._finish(job_id, "completed", None)
+
+    def fail(self, job_id: int, error: str):
+        """Marks a job as failed with the given error message."""
+        self._finish(job_id, "failed", error)
+
+    def _finish(self, job_id: int, status: str, error: str):
+        """Records the final status of a job."""
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def retry(self, project_id: str) -> bool:
+        """
+        Puts a finished project back in the queue, e.g. after it or some of its tasks failed.
+
+        The worker that claims it resumes the project from its checkpoint, so
+        only the tasks that did not complete are run again.
+
+        Args:
+            project_id (str): The project ID.
+
+        Returns:
+            bool: Whether the project was requeued; False if it is still queued or running.
+        """
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', worker = NULL, attempts = 0, error = NULL, finished_at = NULL
+                WHERE project_id = ? AND status IN ('completed', 'failed')
+                """,
+                (project_id,)
+            )
+        return cursor.rowcount > 0
+
+    def get(self, project_id: str):
+        """
+        Returns the job of a project.
+
+        Args:
+            project_id (str): The project ID.
+
+        Returns:
+            Job: The job, or None if there is no job for the project.
+        """
+        row = self._get_connection().execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE project_id = ?", (project_id,)
+        ).fetchone()
+        return Job(*row) if row else None
+
+    def recent(self, limit: int = 20) -> list:
+        """
+        Returns the most recently submitted jobs.
+
+        Args:
+            limit (int): The maximum number of jobs to return.
+
+        Returns:
+            list: The jobs, newest first.
+        """
+        rows = self._get_connection().execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [Job(*row) for row in rows]
+
+    def counts(self) -> dict:
+        """Returns the number of jobs in each status."""
+        rows = self._get_connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+class Worker:
+    """
+    Processes jobs from a JobQueue, several at a time, until it is stopped.
+
+    Each claimed job runs on a thread of the worker's pool while the main
+    loop keeps claiming jobs for free threads and sends heartbeats for the
+    running ones.
+    """
+
+    def __init__(self, job_queue: JobQueue, run_project, concurrency: int = 4, poll_interval: float = 1.0, heartbeat_interval: float = 15.0, worker_id: str = None):
+        """
+        Initializes the Worker instance.
+
+        Args:
+            job_queue (JobQueue): The queue to take jobs from.
+            run_project (callable): Called as run_project(project_id, query) to process a job.
+                The job fails if it raises. A job that is retried after its worker stopped
+                responding is passed to run_project again, which should resume it.
+            concurrency (int): The maximum number of jobs processed at the same time.
+            poll_interval (float): The number of seconds to wait between checks for new jobs.
+            heartbeat_interval (float): The number of seconds between heartbeats.
+            worker_id (str, optional): Identifies the worker in the jobs table.
+                Defaults to the host name and process ID.
+        """
+        self.job_queue = job_queue
+        self.run_project = run_project
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _process(self, job: Job):
+        """Runs a job and records its outcome."""
+        try:
+            self.run_project(job.project_id, job.query)
+            self.job_queue.complete(job.id)
+        except Exception as e:
+            print(f"Job {job.project_id} failed: {e}")
+            self.job_queue.fail(job.id, str(e))
+
+    def run(self, stop_event: threading.Event = None):
+        """
+        Processes jobs until stop_event is set, then waits for the running jobs to finish.
+
+        Args:
+            stop_event (threading.Event, optional): Stops the worker when set.
+                Without it the worker runs forever.
+        """
+        stop_event = stop_event or threading.Event()
+        running = {}
+        last_heartbeat = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not stop_event.is_set():
+                # Fill every free thread with a queued job
+                while len(running) < self.concurrency:
+                    job = self.job_queue.claim(self.worker_id)
+                    if job is None:
+                        break
+                    running[executor.submit(self._process, job)] = job
+
+                if running:
+                    done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+                else:
+                    stop_event.wait(self.poll_interval)
+
+                if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                    self.job_queue.heartbeat([job.id for job in running.values()])
+                    last_heartbeat = time.monotonic()
+
+            # Keep the remaining jobs alive until they finish
+            while running:
+                done, _ = wait(running, timeout=self.heartbeat_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                self.job_queue.heartbeat([job.id for job in running.values()])
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.outputs import Generation
+from agents.storage import configure_connection
+
+# Set while the cache is bypassed for the calls made in the current context
+_bypass = ContextVar("llm_cache_bypass", default=False)
+
+class LLMResponseCache(BaseCache):
+    """
+    A persistent, content-addressed cache for LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of the LLM string (which LangChain derives from
+    the model name and its sampling parameters) and the fully rendered prompt.
+    Entries expire after a time-to-live, and the least recently used entries
+    are evicted once the cache grows beyond its maximum size.
+
+    Pass an instance as the `cache` argument of an LLM, e.g. Ollama(cache=...).
+    """
+
+    def __init__(self, db_path: str = 'llm_cache.db', ttl: Optional[float] = 7 * 24 * 3600, max_entries: Optional[int] = 10000):
+        """
+        Initializes the LLMResponseCache instance.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            ttl (float, optional): The number of seconds after which an entry expires.
+                None keeps entries until they are evicted.
+            max_entries (int, optional): The maximum number of entries to keep.
+                None disables size-based eviction.
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = configure_connection(sqlite3.connect(db_path, check_same_thread=False))
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT,
+                prompt TEXT,
+                response TEXT,
+                created_at REAL,
+                last_accessed REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache (last_accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        """Returns the content address of a prompt for a given LLM configuration."""
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def bypass(self):
+        """
+        Bypasses cache lookups for the LLM calls made inside the with-block.
+
+        Responses generated while bypassed are still stored, so the cache is
+        refreshed with the new result.
+        """
+        token = _bypass.set(True)
+        try:
+            yield
+        finally:
+            _bypass.reset(token)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Looks up a cached response for the prompt and LLM string."""
+        if _bypass.get():
+            return None
+
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                # The entry has expired
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE llm_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+
+        return [Generation(**generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Stores the response for the prompt and LLM string, evicting old entries if needed."""
+        key = self._key(prompt, llm_string)
+        response = json.dumps([
+            {"text": generation.text, "generation_info": generation.generation_info}
+            for generation in return_val
+        ])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (key, llm_string, prompt, response, created_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, llm_string, prompt, response, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Deletes expired entries and the least recently used ones above max_entries."""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    """
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_accessed ASC LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,)
+                )
+
+    def clear(self, **kwargs) -> None:
+        """Deletes every cached response and resets the hit/miss counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses and stored entries, and the hit rate.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Closes the cache database."""
+        with self._lock:
+            self._conn.close()
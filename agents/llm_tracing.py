@@ -0,0 +1,66 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from agents.context import estimate_tokens
+from agents.tracing import Tracer, get_tracer
+
+class LLMTracingHandler(BaseCallbackHandler):
+    """
+    A LangChain callback handler that records a span for every LLM call.
+
+    Each span carries the prompt and completion token counts and, when the
+    call is streamed, the time to the first token. Ollama reports exact
+    counts; for other models they are estimated from the text.
+    """
+
+    def __init__(self, tracer: Tracer = None):
+        """
+        Initializes the LLMTracingHandler instance.
+
+        Args:
+            tracer (Tracer, optional): The tracer to record to. Defaults to the process-wide tracer.
+        """
+        self.tracer = tracer or get_tracer()
+        self._runs = {}
+
+    def on_llm_start(self, serialized: dict, prompts: list, *, run_id, **kwargs):
+        """Starts the span of an LLM call."""
+        model = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name")
+        self._runs[run_id] = self.tracer.start_span(
+            "llm", model=model, prompt_tokens=sum(estimate_tokens(prompt) for prompt in prompts)
+        )
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs):
+        """Records the time to the first streamed token."""
+        span = self._runs.get(run_id)
+        if span is not None and "ttft" not in span.attributes:
+            span.set(ttft=span.elapsed())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        """Ends the span of an LLM call and records its token metrics."""
+        span = self._runs.pop(run_id, None)
+        if span is None:
+            return
+
+        generations = [g for batch in response.generations for g in batch]
+        completion_tokens = sum(estimate_tokens(g.text) for g in generations)
+        prompt_tokens = span.attributes["prompt_tokens"]
+        for generation in generations:
+            info = generation.generation_info or {}
+            if "eval_count" in info:
+                completion_tokens = info["eval_count"]
+            if "prompt_eval_count" in info:
+                prompt_tokens = info["prompt_eval_count"]
+        span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        span.end()
+
+        model = span.attributes["model"]
+        metrics = self.tracer.metrics
+        metrics.inc("llm_prompt_tokens_total", prompt_tokens, model=model)
+        metrics.inc("llm_completion_tokens_total", completion_tokens, model=model)
+        if "ttft" in span.attributes:
+            metrics.observe("llm_time_to_first_token_seconds", span.attributes["ttft"], model=model)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs):
+        """Ends the span of a failed LLM call."""
+        span = self._runs.pop(run_id, None)
+        if span is not None:
+            span.end(error)
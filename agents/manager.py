@@ -1,74 +1,500 @@
 import json
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from agents.researcher import run_researcher
-from agents.writer import run_writer
-from agents.programmer import run_programmer
+import asyncio
+import difflib
+import contextlib
+import re
+import sqlite3
+import time
+from agents.prompts import layered_prompt
+from agents.researcher import run_researcher, arun_researcher
+from agents.writer import run_writer, arun_writer
+from agents.programmer import run_programmer, arun_programmer
+from agents.critic import run_critic, arun_critic
 from agents.tools import SandboxExecutor
 from agents.memory import AgentMemory
+from agents.streaming import TaskEventEmitter
+from agents.scheduler import resolve_dependencies, ancestors, dependents, run_task_graph, arun_task_graph
+from agents.tracing import tracer
+from agents.registry import registry
+from agents.structured import StructuredOutputChain, parse_plan
+from agents.gateway import prompt_session, request_priority
+from agents.search_results import Chunk, SearchSession, chunk_text, iter_chunks
+from agents.context import RESEARCH_TOKEN_BUDGET
+from agents.checkpoint import Checkpoint, save_checkpoint_state
+from agents.blob_store import offload
+from agents.code_execution import inputs_fingerprint
 
-def decompose_task(user_query, llm):
-    """
-    Decomposes a user's query into a structured list of tasks using an LLM.
-
-    Args:
-        user_query (str): The user's research query.
-        llm (Ollama): The Ollama LLM instance.
-
-    Returns:
-        list: A list of dictionaries, where each dictionary represents a task.
-    """
+def _build_manager_chain(llm):
+    """Builds the structured-output chain that turns a query into a validated plan."""
     # Define the prompt template for the manager agent
-    manager_template = """
+    manager_instructions = """
     You are a manager agent responsible for breaking down a user's research request into a series of tasks for a team of agents.
-    Based on the user's query, create a list of tasks to be executed by the following agents:
+    Based on the user's query given at the end, create a list of tasks to be executed by the following agents:
     - Researcher: This agent gathers information from the internet using the Tavily Search API.
     - Writer: This agent writes a cohesive report based on the gathered information.
     - Critic: This agent reviews the report and provides feedback.
     - Programmer: This agent can write and execute Python code for specific tasks.
 
-    The user's query is: {user_query}
-
     Return a JSON object with a single key "tasks", which is a list of dictionaries.
     Each dictionary should have the following keys:
+    - "id": A short unique identifier for the task (e.g., "t1").
     - "agent": The name of the agent assigned to the task (e.g., "Researcher", "Writer").
     - "description": A clear and concise description of the task.
     - "tools": A list of tools the agent should use (e.g., ["Tavily Search API"]). For the Writer and Critic agent, this can be an empty list.
+    - "depends_on": A list of the ids of the tasks whose results this task needs. Independent tasks should have an empty list so they can run in parallel.
 
     Example:
     {{
         "tasks": [
             {{
+                "id": "t1",
                 "agent": "Researcher",
                 "description": "Gather information about the European solar panel market in 2024.",
-                "tools": ["Tavily Search API"]
+                "tools": ["Tavily Search API"],
+                "depends_on": []
+            }},
+            {{
+                "id": "t2",
+                "agent": "Researcher",
+                "description": "Gather information about the main competitors in the European solar panel market.",
+                "tools": ["Tavily Search API"],
+                "depends_on": []
             }},
             {{
+                "id": "t3",
                 "agent": "Writer",
                 "description": "Write a SWOT analysis of the European solar panel market based on the research.",
-                "tools": []
+                "tools": [],
+                "depends_on": ["t1", "t2"]
             }}
         ]
     }}
     """
 
-    prompt = PromptTemplate(
-        template=manager_template,
-        input_variables=["user_query"],
+    prompt = layered_prompt(
+        manager_instructions,
+        task="The user's query is: {user_query}",
     )
 
-    # Create the chain
-    chain = prompt | llm | JsonOutputParser()
+    # Create the chain, repairing or re-prompting for malformed plans
+    return StructuredOutputChain(prompt, llm, parse_plan, name="manager")
+
+def decompose_task(user_query, llm):
+    """
+    Decomposes a user's query into a structured list of tasks using an LLM.
+
+    Args:
+        user_query (str): The user's research query.
+        llm (Ollama): The Ollama LLM instance.
+
+    Returns:
+        list: A list of dictionaries, where each dictionary represents a task.
+
+    Raises:
+        StructuredOutputError: If the LLM did not return a valid plan within the retries.
+    """
+    chain = registry.get("manager_chain", lambda: _build_manager_chain(llm), llm)
 
     # Invoke the chain
-    response = chain.invoke({"user_query": user_query})
+    # Every plan starts with the same instructions, so all projects share the Manager's session
+    with tracer.span("decompose") as span, request_priority("Manager"), prompt_session("Manager"):
+        response = chain.invoke({"user_query": user_query})
+        span.set(tasks=len(response.get("tasks", [])))
 
     return response.get("tasks", [])
 
-def orchestrate_agents(project_id: str, tasks: list, db_conn, llm, tavily_client, sandbox_executor: SandboxExecutor):
+def combine_research_results(tasks: list, results: dict, indices: list, query: str = "", max_tokens: int = None) -> str:
+    """
+    Combines the results of several Researcher tasks into a single research input.
+
+    With max_tokens, the reports are split into chunks, chunks that nearly
+    repeat an earlier one are dropped, and only the chunks most relevant to
+    the query that fit in max_tokens are kept, in their original order.
+
+    Args:
+        tasks (list): A list of task dictionaries from decompose_task.
+        results (dict): Maps task indices to the results of completed tasks.
+        indices (list): The indices of the tasks to consider.
+        query (str): What the research is for, e.g. the Writer's task description.
+        max_tokens (int, optional): The approximate maximum size of the combined research.
+
+    Returns:
+        str: The combined research results, or an empty string if none are available.
+    """
+    reports = [index for index in indices if tasks[index]['agent'] == 'Researcher' and results.get(index)]
+    if max_tokens is None:
+        return "\n\n".join(f"### Research: {tasks[index]['description']}\n{results[index]}" for index in reports)
+
+    # Chunk the reports, favouring their beginnings, where the summaries are
+    session = SearchSession()
+    chunks = [
+        Chunk(index, tasks[index]['description'], text, 0.5 / (1 + position), position)
+        for index in reports
+        for position, text in enumerate(chunk_text(results[index]))
+        if not session.is_duplicate(text)
+    ]
+    selected = sorted(iter_chunks(chunks, query, max_tokens), key=lambda chunk: (chunk.source, chunk.position))
+
+    sections = []
+    for index in reports:
+        texts = [chunk.text for chunk in selected if chunk.source == index]
+        if texts:
+            sections.append(f"### Research: {tasks[index]['description']}\n" + "\n".join(texts))
+    return "\n\n".join(sections)
+
+UPDATE_TASK_SQL = "UPDATE tasks SET status = ?, result = ?, result_blob = ? WHERE id = ?"
+
+def _insert_tasks(db_conn, project_id: str, tasks: list, start: int = 0) -> list:
+    """
+    Inserts the tasks as pending rows in a single transaction and returns their IDs.
+
+    Each row also stores the task's index in the plan, counting from start,
+    and its full definition, so the plan can be restored by load_checkpoint.
+    """
+    with tracer.span("db.insert_tasks", trace_id=project_id, rows=len(tasks)):
+        cursor = db_conn.cursor()
+        task_ids = []
+        for index, task in enumerate(tasks, start=start):
+            cursor.execute(
+                "INSERT INTO tasks (project_id, description, agent, status, result, task_index, spec) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (project_id, task['description'], task['agent'], 'pending', '', index, json.dumps(task))
+            )
+            task_ids.append(cursor.lastrowid)
+        db_conn.commit()
+    return task_ids
+
+def _make_on_complete(project_id: str, tasks: list, task_ids: list, memory: AgentMemory, event_queue=None, outcomes: dict = None):
+    """
+    Returns the scheduler callback that records a finished task in memory and the database.
+
+    If outcomes is given, the result of each finished task, or the exception
+    of a failed one, is also stored in it under the task's index.
+    """
+    def on_complete(index, status, result):
+        if outcomes is not None:
+            outcomes[index] = result
+        if status == 'failed':
+            result = f"Error executing task: {result}"
+            memory.save_entry(project_id, tasks[index]['agent'], "error", result)
+            print(result) # For debugging
+
+        # Update the task in the same transaction as its buffered memory entries,
+        # moving a large result to the blob store
+        stored_result, result_blob, writes = offload(result)
+        memory.write_buffer.add_many(writes + [(UPDATE_TASK_SQL, (status, stored_result, result_blob, task_ids[index]))])
+        try:
+            memory.write_buffer.flush()
+        except sqlite3.Error as e:
+            # The writes are still buffered, so retry once, e.g. after the database was locked,
+            # and otherwise fail the run rather than lose the task's status
+            print(f"Database error: {e}; retrying")
+            memory.write_buffer.flush()
+
+        emitter = TaskEventEmitter(event_queue, index)
+        emitter.result(result)
+        emitter.status(status)
+
+    return on_complete
+
+def _end_sandbox_session_when_idle(on_complete, tasks: list, outcomes: dict, project_sandbox: SandboxExecutor):
+    """
+    Wraps the scheduler callback to return the project's sandbox to the pool after its last Programmer task.
+
+    Otherwise the sandbox would stay checked out through the Writer and
+    refinement tasks. A Programmer task added later checks a sandbox out again.
+    """
+    def wrapped(index, status, result):
+        on_complete(index, status, result)
+        if tasks[index]['agent'] == 'Programmer' and all(i in outcomes for i, task in enumerate(tasks) if task['agent'] == 'Programmer'):
+            project_sandbox.end_session()
+
+    return wrapped
+
+# Agents whose tasks a Critic may add to the plan
+REFINABLE_AGENTS = ('Researcher', 'Programmer', 'Writer')
+
+def latest_report(tasks: list, results: dict, indices=None):
+    """
+    Returns the index of the latest completed Writer task.
+
+    Args:
+        tasks (list): A list of task dictionaries.
+        results (dict): Maps task indices to results, or to exceptions for failed tasks.
+        indices (iterable, optional): Only consider these tasks.
+
+    Returns:
+        int: The index of the task, or None if no Writer task has completed.
+    """
+    candidates = [
+        index for index in (range(len(tasks)) if indices is None else indices)
+        if tasks[index]['agent'] == 'Writer' and isinstance(results.get(index), str) and results[index]
+    ]
+    return max(candidates, default=None)
+
+def _task_ref(tasks: list, index: int):
+    """Returns the depends_on reference to a task: its id, or its index if it has none."""
+    task_id = tasks[index].get('id')
+    return index if task_id is None else str(task_id)
+
+def _refinement_task(tasks: list, task: dict) -> dict:
+    """Gives a task added to the plan at index len(tasks) an id, and refers to its dependencies by id."""
+    task['id'] = f"refinement-{len(tasks)}"
+    task['depends_on'] = [_task_ref(tasks, dep) for dep in task['depends_on']]
+    return task
+
+def _normalize_description(description: str) -> str:
+    return re.sub(r"\s+", " ", description).strip().lower()
+
+def plan_revision(tasks: list, report_index: int, feedback, max_new_tasks: int = 4) -> list:
+    """
+    Turns a Critic's feedback into the tasks of a refinement round.
+
+    Proposed Researcher and Programmer tasks are added as new tasks, and the
+    report is rewritten by a new Writer task that depends on every research
+    and programming task, old and new. Completed tasks are never re-run, so
+    the revision reuses all of the earlier research. Proposed Writer notes
+    that an earlier revision already addressed are dropped.
+
+    Args:
+        tasks (list): The tasks of the project so far.
+        report_index (int): The index of the Writer task whose report was reviewed.
+        feedback (dict): The Critic's output, with the proposed tasks under "tasks".
+        max_new_tasks (int): The maximum number of proposed tasks to accept.
+
+    Returns:
+        list: The new tasks, ending with the revised Writer task, or an empty list
+            if the feedback contains nothing that has not been done already.
+    """
+    proposed = feedback.get("tasks", []) if isinstance(feedback, dict) else []
+    seen = {(task['agent'], _normalize_description(task['description'])) for task in tasks}
+    seen.update(('Writer', _normalize_description(note)) for task in tasks if task['agent'] == 'Writer' for note in task.get('notes', []))
+    new_tasks = []
+    revisions = []
+    for task in proposed:
+        if not isinstance(task, dict) or task.get('agent') not in REFINABLE_AGENTS or not task.get('description'):
+            continue
+        key = (task['agent'], _normalize_description(task['description']))
+        if key in seen:
+            continue
+        seen.add(key)
+        if len(new_tasks) + len(revisions) >= max_new_tasks:
+            break
+        if task['agent'] == 'Writer':
+            revisions.append(task['description'])
+        else:
+            new_tasks.append({"agent": task['agent'], "description": task['description'], "tools": task.get('tools', [])})
+
+    if not new_tasks and not revisions:
+        return []
+
+    # New research is independent, new code may use any of the research, and
+    # the revised report depends on every research and programming task
+    base = len(tasks)
+    research = [index for index, task in enumerate(tasks) if task['agent'] == 'Researcher']
+    research += [base + i for i, task in enumerate(new_tasks) if task['agent'] == 'Researcher']
+    for task in new_tasks:
+        task['depends_on'] = [] if task['agent'] == 'Researcher' else list(research)
+    upstream = [index for index, task in enumerate(tasks) if task['agent'] in ('Researcher', 'Programmer')]
+    upstream += range(base, base + len(new_tasks))
+
+    report_task = tasks[report_index]
+    description = report_task.get('base_description', report_task['description'])
+    notes = revisions or ["Incorporate the new research into the report."]
+    new_tasks.append({
+        "agent": "Writer",
+        "description": description + "\n\nAddress the following review feedback:\n" + "\n".join(f"- {note}" for note in notes),
+        "base_description": description,
+        "notes": notes,
+        "revises": report_index,
+        "tools": [],
+        "depends_on": list(upstream),
+    })
+
+    # Refer to tasks by id, since the scheduler reads a reference as an id before an index
+    plan = list(tasks)
+    for task in new_tasks:
+        plan.append(_refinement_task(plan, task))
+    return new_tasks
+
+def reports_converged(previous: str, current: str, threshold: float) -> bool:
+    """Returns whether two versions of a report are at least threshold similar, word by word."""
+    return difflib.SequenceMatcher(None, previous.split(), current.split()).ratio() >= threshold
+
+def _extend_plan(db_conn, project_id: str, tasks: list, task_ids: list, new_tasks: list, memory: AgentMemory) -> list:
+    """Appends refinement tasks to the plan and the database, and returns the new dependencies."""
+    memory.save_entry(project_id, "Critic", "refinement_tasks", json.dumps(new_tasks))
+    task_ids.extend(_insert_tasks(db_conn, project_id, new_tasks, start=len(tasks)))
+    tasks.extend(new_tasks)
+    return resolve_dependencies(tasks)
+
+def _start_refinement(db_conn, project_id: str, new_tasks: list, refinements: int) -> int:
+    """Counts a refinement round once its revised report is planned, and saves the count and the reviewed report."""
+    if new_tasks[-1]['agent'] == 'Writer':
+        refinements += 1
+        save_checkpoint_state(db_conn, project_id, refinements=refinements, reviewed_report=new_tasks[-1]['revises'])
+    return refinements
+
+def _refinement_rounds(tasks: list, outcomes: dict, max_refinements: int, max_new_tasks: int, convergence_threshold: float, time_budget: float = None, reviewed_report: int = None):
+    """
+    Plans the Critic refinement loop one step at a time.
+
+    Yields lists of tasks to append to the plan. The caller runs them, with
+    their outcomes recorded in outcomes, before asking for the next step.
+    Each round first reviews the latest report, unless a Critic already did,
+    and then adds the proposed tasks and a revised report. The loop stops
+    after max_refinements rounds, when time_budget seconds have passed, when
+    the Critic proposes nothing new, or when a revision barely changed the report.
+    A resumed run passes the index of the last reviewed report as reviewed_report,
+    so its revision is still compared against it.
+    """
+    start = time.monotonic()
+    previous_report = outcomes.get(reviewed_report) if reviewed_report is not None else None
+    if not isinstance(previous_report, str):
+        previous_report = None
+    for round_number in range(1, max_refinements + 1):
+        if time_budget is not None and time.monotonic() - start > time_budget:
+            return
+        report_index = latest_report(tasks, outcomes)
+        if report_index is None:
+            return
+        report = outcomes[report_index]
+        if previous_report is not None and reports_converged(previous_report, report, convergence_threshold):
+            return
+
+        # Reuse a review of this report from the plan, or ask for one
+        dependencies = resolve_dependencies(tasks)
+        reviews = [
+            index for index, task in enumerate(tasks)
+            if task['agent'] == 'Critic' and index in outcomes
+            and latest_report(tasks, outcomes, ancestors(dependencies, index)) == report_index
+        ]
+        if not reviews:
+            yield [_refinement_task(tasks, {"agent": "Critic", "description": f"Review the report (refinement round {round_number}).", "tools": [], "depends_on": [report_index]})]
+            reviews = [len(tasks) - 1]
+
+        feedback = outcomes.get(reviews[-1])
+        if not isinstance(feedback, str):
+            return
+        new_tasks = plan_revision(tasks, report_index, json.loads(feedback), max_new_tasks)
+        if not new_tasks:
+            return
+        yield new_tasks
+        previous_report = report
+
+def _begin_project(db_conn, project_id: str, tasks: list, memory: AgentMemory, checkpoint: Checkpoint = None) -> tuple:
+    """
+    Returns the task IDs, the results of the finished tasks, the number of refinement
+    rounds started and the last reviewed report of a project.
+
+    A resumed project picks up where the interrupted run left off; otherwise the
+    plan is saved to memory and its tasks are inserted into the database.
+    """
+    if checkpoint is not None:
+        # Tasks that completed downstream of a task that runs again are run again
+        # too, so they see its new result
+        finished = dict(checkpoint.finished)
+        rerun = [index for index in range(len(tasks)) if index not in finished]
+        for index in dependents(resolve_dependencies(tasks), rerun):
+            finished.pop(index, None)
+        return list(checkpoint.task_ids), finished, checkpoint.state.get("refinements", 0), checkpoint.state.get("reviewed_report")
+
+    # Save the initial task list to memory
+    memory.save_entry(project_id, "Manager", "decomposed_tasks", json.dumps(tasks))
+
+    # Insert all the tasks into the database up front
+    return _insert_tasks(db_conn, project_id, tasks), {}, 0, None
+
+@contextlib.contextmanager
+def _task_scope(project_id: str, task: dict, index: int):
+    """Traces a task and tags its LLM calls with its agent's priority and prompt session."""
+    agent_name = task['agent']
+    with tracer.span("task", agent=agent_name, task_index=index, description=task['description']), \
+            request_priority(agent_name), prompt_session(project_id, agent_name):
+        yield
+
+def _start_task(project_id: str, task: dict, index: int, memory: AgentMemory, event_queue=None) -> tuple:
+    """
+    Records the start of a task and returns its memory context and event emitter.
+
+    Returns:
+        tuple: The project's recent memory, the memory entries relevant to the
+            task, and the TaskEventEmitter streaming the task's progress.
+    """
+    # Get the project's recent memory and the entries relevant to this task
+    context, relevant_context = memory.get_context_layers(project_id, agent_name=task['agent'], query=task['description'])
+
+    # Save the start of the task to memory
+    memory.save_entry(project_id, task['agent'], "started_task", task['description'])
+
+    # Stream the task's progress if anyone is listening
+    emitter = TaskEventEmitter(event_queue, index)
+    emitter.status("running")
+    return context, relevant_context, emitter
+
+# The sync and async entry points of each agent, called with the arguments from _agent_arguments
+AGENT_RUNNERS = {
+    'Researcher': (run_researcher, arun_researcher),
+    'Writer': (run_writer, arun_writer),
+    'Programmer': (run_programmer, arun_programmer),
+    'Critic': (run_critic, arun_critic),
+}
+
+def _agent_arguments(tasks: list, dependencies: list, index: int, results: dict, llm, tavily_client, search_cache, sandbox: SandboxExecutor, context: str, relevant_context: str, emitter: TaskEventEmitter, async_tavily_client=None) -> tuple:
+    """
+    Returns the positional and keyword arguments of the agent call that runs a task.
+
+    Raises:
+        ValueError: If a Writer or Critic task has no upstream results to work from.
+    """
+    task = tasks[index]
+    agent_name = task['agent']
+    task_description = task['description']
+    on_token = emitter.token if emitter.enabled else None
+    on_step = emitter.step if emitter.enabled else None
+
+    if agent_name == 'Researcher':
+        kwargs = {"search_cache": search_cache, "on_token": on_token, "on_step": on_step, "relevant_context": relevant_context}
+        if async_tavily_client is not None:
+            kwargs["async_tavily_client"] = async_tavily_client
+        return (task_description, llm, tavily_client, context), kwargs
+
+    if agent_name == 'Writer':
+        # Feed the results of every upstream Researcher into the writer
+        research_result = combine_research_results(
+            tasks, results, ancestors(dependencies, index), task_description, RESEARCH_TOKEN_BUDGET
+        )
+        if not research_result:
+            raise ValueError("Writer agent called before Researcher agent.")
+        return (task_description, llm, research_result, context, on_token), {"on_section": on_step, "relevant_context": relevant_context}
+
+    if agent_name == 'Programmer':
+        # Reuse the output of an identical run on the same upstream results
+        inputs = inputs_fingerprint(*(results[i] for i in ancestors(dependencies, index) if i in results))
+        return (task_description, llm, sandbox, context, on_token), {"inputs": inputs, "relevant_context": relevant_context}
+
+    # Review the latest upstream report
+    report_index = latest_report(tasks, results, ancestors(dependencies, index))
+    if report_index is None:
+        raise ValueError("Critic agent called before Writer agent.")
+    return (results[report_index], llm), {}
+
+def _task_result(agent_name: str, output) -> str:
+    """Returns an agent's output as the task's result; the Critic's feedback is stored as JSON."""
+    return json.dumps(output) if agent_name == 'Critic' else output
+
+def orchestrate_agents(project_id: str, tasks: list, db_conn, llm, tavily_client, sandbox_executor: SandboxExecutor, max_workers: int = 4, search_cache=None, memory: AgentMemory = None, event_queue=None, max_refinements: int = 1, max_new_tasks: int = 4, convergence_threshold: float = 0.95, refinement_budget: float = None, checkpoint: Checkpoint = None):
     """
     Orchestrates the execution of tasks by inserting them into the database and managing agent memory.
 
+    Tasks run concurrently on a bounded thread pool as soon as the tasks they
+    depend on have finished, so the total runtime follows the critical path of
+    the plan rather than the number of tasks.
+
+    Once the plan has run, a Critic reviews the report and the tasks it
+    proposes are appended to tasks and run, followed by a revised report,
+    for up to max_refinements rounds. Only the new tasks run; the results of
+    earlier tasks, including all earlier research, are reused.
+
     Args:
         project_id (str): The unique ID for the research project.
         tasks (list): A list of task dictionaries from decompose_task.
@@ -76,68 +502,158 @@ def orchestrate_agents(project_id: str, tasks: list, db_conn, llm, tavily_client
         llm (Ollama): The Ollama LLM instance.
         tavily_client (TavilyClient): The Tavily client instance.
         sandbox_executor (SandboxExecutor): The sandbox executor for running code.
+        max_workers (int): The maximum number of tasks running at the same time.
+        search_cache (SearchCache, optional): A cache for search results shared across tasks.
+        memory (AgentMemory, optional): The agent memory to use. Defaults to a new AgentMemory.
+        event_queue (queue.Queue, optional): Receives a TaskEvent for every status change,
+            streamed token and intermediate step of each task.
+        max_refinements (int): The maximum number of Critic refinement rounds; 0 disables them.
+        max_new_tasks (int): The maximum number of Critic-proposed tasks accepted per round.
+        convergence_threshold (float): Stop refining once a revision is at least this
+            similar to the previous report (0 to 1, by words).
+        refinement_budget (float, optional): The number of seconds after which no new
+            refinement round is started.
+        checkpoint (Checkpoint, optional): The saved progress of an interrupted run of the
+            project, from load_checkpoint. Its tasks must be passed as tasks; only
+            those that had not completed are run.
 
     Returns:
-        list: A list of task IDs that were inserted into the database.
+        list: A list of task IDs that were inserted into the database, including refinement tasks.
     """
-    cursor = db_conn.cursor()
-    task_ids = []
-    research_result = None
-    memory = AgentMemory()
+    memory = memory or AgentMemory()
+    dependencies = resolve_dependencies(tasks)
+    task_ids, finished, refinements, reviewed_report = _begin_project(db_conn, project_id, tasks, memory, checkpoint)
 
-    # Save the initial task list to memory
-    decomposed_tasks_str = json.dumps(tasks)
-    memory.save_entry(project_id, "Manager", "decomposed_tasks", decomposed_tasks_str)
-
-    for task in tasks:
-        # Insert the task into the database
-        cursor.execute(
-            "INSERT INTO tasks (description, agent, status, result) VALUES (?, ?, ?, ?)",
-            (task['description'], task['agent'], 'pending', '')
-        )
-        db_conn.commit()
-        task_id = cursor.lastrowid
-        task_ids.append(task_id)
+    # Run all of the project's code in one sandbox session
+    project_sandbox = sandbox_executor.for_session(project_id)
 
-        # Get the current memory context
-        context = memory.get_context(project_id)
+    def execute(index, results):
+        task = tasks[index]
         agent_name = task['agent']
-        task_description = task['description']
 
-        # Save the start of the task to memory
-        memory.save_entry(project_id, agent_name, "started_task", task_description)
+        with _task_scope(project_id, task, index):
+            context, relevant_context, emitter = _start_task(project_id, task, index, memory, event_queue)
 
-        result = ""
-        # Execute the task based on the agent
-        try:
-            if agent_name == 'Researcher':
-                result = run_researcher(task_description, llm, tavily_client, context)
-                research_result = result  # Store for the writer
+            result = ""
+            # Execute the task based on the agent
+            if agent_name in AGENT_RUNNERS:
+                args, kwargs = _agent_arguments(
+                    tasks, dependencies, index, results, llm, tavily_client, search_cache,
+                    project_sandbox, context, relevant_context, emitter,
+                )
+                run_agent, _ = AGENT_RUNNERS[agent_name]
+                result = _task_result(agent_name, run_agent(*args, **kwargs))
+
+            # Save the successful result to memory
+            memory.save_entry(project_id, agent_name, "completed_task", result)
+            return result
+
+    outcomes = dict(finished)
+    on_complete = _make_on_complete(project_id, tasks, task_ids, memory, event_queue, outcomes)
+    on_complete = _end_sandbox_session_when_idle(on_complete, tasks, outcomes, project_sandbox)
+
+    try:
+        with tracer.span("orchestrate", trace_id=project_id, tasks=len(tasks)):
+            run_task_graph(dependencies, execute, on_complete, max_workers=max_workers, finished=finished)
+
+            # Let the Critic refine the report, running only the tasks it adds
+            rounds = _refinement_rounds(tasks, outcomes, max_refinements - refinements, max_new_tasks, convergence_threshold, refinement_budget, reviewed_report)
+            for new_tasks in rounds:
+                with tracer.span("refine", tasks=len(new_tasks)):
+                    dependencies = _extend_plan(db_conn, project_id, tasks, task_ids, new_tasks, memory)
+                    refinements = _start_refinement(db_conn, project_id, new_tasks, refinements)
+                    run_task_graph(dependencies, execute, on_complete, max_workers=max_workers, finished=dict(outcomes))
+    finally:
+        project_sandbox.end_session()
+    memory.flush()
+
+    return task_ids
+
+async def aorchestrate_agents(project_id: str, tasks: list, db_conn, llm, tavily_client, sandbox_executor: SandboxExecutor, max_concurrency: int = 4, async_tavily_client=None, search_cache=None, memory: AgentMemory = None, event_queue=None, max_refinements: int = 1, max_new_tasks: int = 4, convergence_threshold: float = 0.95, refinement_budget: float = None, checkpoint: Checkpoint = None):
+    """
+    Asynchronously orchestrates the execution of tasks on the running event loop.
+
+    This is the async counterpart of orchestrate_agents. LLM, search and sandbox
+    calls are awaited, so many projects can be driven concurrently from a single
+    process without a thread per blocked call. The Critic refinement loop
+    works as in orchestrate_agents.
 
-            elif agent_name == 'Writer':
-                if research_result:
-                    result = run_writer(task_description, llm, research_result, context)
-                else:
-                    raise ValueError("Writer agent called before Researcher agent.")
+    Args:
+        project_id (str): The unique ID for the research project.
+        tasks (list): A list of task dictionaries from decompose_task.
+        db_conn (sqlite3.Connection): The database connection. It is used from worker threads,
+            so that writes do not block the event loop, and must be opened with check_same_thread=False.
+        llm (Ollama): The Ollama LLM instance.
+        tavily_client (TavilyClient): The Tavily client instance.
+        sandbox_executor (SandboxExecutor): The sandbox executor for running code.
+        max_concurrency (int): The maximum number of tasks running at the same time.
+        async_tavily_client (AsyncTavilyClient, optional): A native async Tavily client.
+        search_cache (SearchCache, optional): A cache for search results shared across tasks.
+        memory (AgentMemory, optional): The agent memory to use. Defaults to a new AgentMemory.
+        event_queue (queue.Queue, optional): Receives a TaskEvent for every status change,
+            streamed token and intermediate step of each task.
+        max_refinements (int): The maximum number of Critic refinement rounds; 0 disables them.
+        max_new_tasks (int): The maximum number of Critic-proposed tasks accepted per round.
+        convergence_threshold (float): Stop refining once a revision is at least this
+            similar to the previous report (0 to 1, by words).
+        refinement_budget (float, optional): The number of seconds after which no new
+            refinement round is started.
+        checkpoint (Checkpoint, optional): The saved progress of an interrupted run of the
+            project, from load_checkpoint. Its tasks must be passed as tasks; only
+            those that had not completed are run.
 
-            elif agent_name == 'Programmer':
-                result = run_programmer(task_description, llm, sandbox_executor, context)
+    Returns:
+        list: A list of task IDs that were inserted into the database, including refinement tasks.
+    """
+    memory = memory or AgentMemory()
+    dependencies = resolve_dependencies(tasks)
+    task_ids, finished, refinements, reviewed_report = await asyncio.to_thread(_begin_project, db_conn, project_id, tasks, memory, checkpoint)
+
+    # Run all of the project's code in one sandbox session
+    project_sandbox = sandbox_executor.for_session(project_id)
+
+    async def execute(index, results):
+        task = tasks[index]
+        agent_name = task['agent']
+
+        with _task_scope(project_id, task, index):
+            context, relevant_context, emitter = await asyncio.to_thread(_start_task, project_id, task, index, memory, event_queue)
+
+            result = ""
+            # Execute the task based on the agent
+            if agent_name in AGENT_RUNNERS:
+                args, kwargs = _agent_arguments(
+                    tasks, dependencies, index, results, llm, tavily_client, search_cache,
+                    project_sandbox, context, relevant_context, emitter, async_tavily_client,
+                )
+                _, arun_agent = AGENT_RUNNERS[agent_name]
+                result = _task_result(agent_name, await arun_agent(*args, **kwargs))
 
             # Save the successful result to memory
-            memory.save_entry(project_id, agent_name, "completed_task", result)
-            status = 'completed'
+            await asyncio.to_thread(memory.save_entry, project_id, agent_name, "completed_task", result)
+            return result
 
-        except Exception as e:
-            result = f"Error executing task: {e}"
-            memory.save_entry(project_id, agent_name, "error", result)
-            status = 'failed'
-            print(result) # For debugging
+    outcomes = dict(finished)
+    on_complete = _make_on_complete(project_id, tasks, task_ids, memory, event_queue, outcomes)
+    on_complete = _end_sandbox_session_when_idle(on_complete, tasks, outcomes, project_sandbox)
 
-        # Update the task in the database
-        cursor.execute(
-            "UPDATE tasks SET status = ?, result = ? WHERE id = ?",
-            (status, result, task_id)
-        )
-        db_conn.commit()
+    async def record_completion(index, status, result):
+        # Write the task's row without blocking the event loop
+        await asyncio.to_thread(on_complete, index, status, result)
+
+    try:
+        with tracer.span("orchestrate", trace_id=project_id, tasks=len(tasks)):
+            await arun_task_graph(dependencies, execute, record_completion, max_concurrency=max_concurrency, finished=finished)
+
+            # Let the Critic refine the report, running only the tasks it adds
+            rounds = _refinement_rounds(tasks, outcomes, max_refinements - refinements, max_new_tasks, convergence_threshold, refinement_budget, reviewed_report)
+            for new_tasks in rounds:
+                with tracer.span("refine", tasks=len(new_tasks)):
+                    dependencies = await asyncio.to_thread(_extend_plan, db_conn, project_id, tasks, task_ids, new_tasks, memory)
+                    refinements = await asyncio.to_thread(_start_refinement, db_conn, project_id, new_tasks, refinements)
+                    await arun_task_graph(dependencies, execute, record_completion, max_concurrency=max_concurrency, finished=dict(outcomes))
+    finally:
+        project_sandbox.end_session()
+    await asyncio.to_thread(memory.flush)
 
     return task_ids
@@ -1,80 +1,134 @@
 import sqlite3
-from datetime import datetime
+from agents.blob_store import offload
+from agents.context import AGENT_TOKEN_BUDGETS, DEFAULT_TOKEN_BUDGET, ContextBuilder, estimate_tokens, truncate_text
+from agents.storage import DEFAULT_DB_PATH, WriteBuffer, get_connection
+from agents.tracing import tracer
+
+INSERT_ENTRY_SQL = """
+    INSERT INTO agent_memory (project_id, agent_name, action, content, summary, content_blob)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
 
 class AgentMemory:
-    def __init__(self, db_path='research_agent.db'):
+    def __init__(self, db_path=DEFAULT_DB_PATH, write_buffer: WriteBuffer = None, summarizer=None, summary_tokens: int = 300, semantic_memory=None):
         """
         Initializes the AgentMemory instance.
 
         Args:
             db_path (str): The path to the SQLite database file.
+            write_buffer (WriteBuffer, optional): The buffer that batches new entries.
+                Pass a shared buffer to batch memory entries together with other writes.
+            summarizer (callable, optional): Called as summarizer(content, max_tokens) to
+                summarize entries larger than summary_tokens. Defaults to truncate_text.
+            summary_tokens (int): The size above which an entry is summarized when written.
+            semantic_memory (SemanticMemory, optional): A vector index used to add the entries
+                most relevant to the current task, from any project, to the context.
         """
         self.db_path = db_path
+        self.write_buffer = write_buffer or WriteBuffer(db_path)
+        self.summarizer = summarizer or truncate_text
+        self.summary_tokens = summary_tokens
+        self.context_builder = ContextBuilder()
+        self.semantic_memory = semantic_memory
 
     def _get_connection(self):
-        """Returns a new database connection."""
-        return sqlite3.connect(self.db_path)
+        """Returns the calling thread's database connection."""
+        return get_connection(self.db_path)
 
     def save_entry(self, project_id: str, agent_name: str, action: str, content: str):
         """
         Saves a new entry to the agent_memory table.
 
+        Large entries are summarized once here, and the summary is stored next
+        to the content for building contexts. Very large content is moved to
+        the blob store, leaving a preview in the row. The entry is buffered and
+        written together with other pending writes on the next flush.
+
         Args:
             project_id (str): The ID of the project.
             agent_name (str): The name of the agent.
             action (str): The action performed by the agent.
             content (str): The content related to the action.
         """
+        summary = None
+        if estimate_tokens(content) > self.summary_tokens:
+            summary = self.summarizer(content, self.summary_tokens)
+        try:
+            content, content_blob, writes = offload(content)
+            self.write_buffer.add_many(writes + [(INSERT_ENTRY_SQL, (project_id, agent_name, action, content, summary, content_blob))])
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    def flush(self):
+        """Writes all buffered entries to the database, keeping them buffered if that fails."""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO agent_memory (project_id, agent_name, action, content)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (project_id, agent_name, action, content)
-                )
-                conn.commit()
+            self.write_buffer.flush()
         except sqlite3.Error as e:
             print(f"Database error: {e}")
 
-    def get_context(self, project_id: str, limit: int = 10) -> str:
+    def get_context(self, project_id: str, limit: int = 10, agent_name: str = None, token_budget: int = None, query: str = None) -> str:
         """
         Retrieves the last N entries for a given project to form a context string.
 
+        When semantic memory is enabled and a query is given, half of the token
+        budget is spent on the older entries most relevant to the query.
+
         Args:
             project_id (str): The ID of the project.
             limit (int): The maximum number of memory entries to retrieve.
+            agent_name (str, optional): The agent the context is for, used to pick the token budget.
+            token_budget (int, optional): The maximum size of the context in tokens.
+            query (str, optional): The text to retrieve relevant entries for, e.g. the task description.
 
         Returns:
             str: A formatted string of recent memory entries.
         """
+        recent, relevant = self.get_context_layers(project_id, limit, agent_name, token_budget, query)
+        return relevant + recent
+
+    def get_context_layers(self, project_id: str, limit: int = 10, agent_name: str = None, token_budget: int = None, query: str = None) -> tuple:
+        """
+        Retrieves the recent and the relevant memory entries of a project as separate strings.
+
+        The recent entries are the same for every task of the project apart
+        from the entries added since, so they belong with the project material
+        of a prompt, while the relevant entries depend on the query and belong
+        with the task. When semantic memory is enabled and a query is given,
+        each gets a fixed half of the token budget, so the recent entries do
+        not change with the size of the relevant ones.
+
+        Args:
+            project_id (str): The ID of the project.
+            limit (int): The maximum number of recent memory entries to retrieve.
+            agent_name (str, optional): The agent the context is for, used to pick the token budget.
+            token_budget (int, optional): The maximum size of both parts together in tokens.
+            query (str, optional): The text to retrieve relevant entries for, e.g. the task description.
+
+        Returns:
+            tuple: The formatted recent entries and the formatted relevant entries,
+                which are empty if there are none.
+        """
+        # Make buffered entries visible to the query
+        self.flush()
+        if token_budget is None:
+            token_budget = AGENT_TOKEN_BUDGETS.get(agent_name, DEFAULT_TOKEN_BUDGET)
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    SELECT timestamp, agent_name, action, content
-                    FROM agent_memory
-                    WHERE project_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                    """,
-                    (project_id, limit)
-                )
-                rows = cursor.fetchall()
-
-            if not rows:
-                return "No recent memory entries found."
-
-            # Format the memories into a string
-            formatted_memory = "Recent Memory Entries (most recent first):\n"
-            for row in reversed(rows):  # Reverse to show oldest first in the context
-                timestamp, agent_name, action, content = row
-                formatted_memory += f"- [{timestamp}] {agent_name} {action}: {content}\n"
-
-            return formatted_memory
+            with tracer.span("db.get_context", agent=agent_name, token_budget=token_budget):
+                conn = self._get_connection()
+                relevant = ""
+                recent_budget = token_budget
+                if self.semantic_memory is not None and query:
+                    recent_budget = token_budget - token_budget // 2
+                    try:
+                        relevant = self.semantic_memory.relevant_context(
+                            conn, query, token_budget // 2,
+                            exclude_ids=self.context_builder.recent_ids(conn, project_id, limit),
+                        )
+                    except Exception as e:
+                        # Fall back to the recent entries, e.g. if the embedding model is unreachable
+                        print(f"Semantic memory error: {e}")
+                recent = self.context_builder.build(conn, project_id, limit, agent_name, recent_budget)
+                return recent, relevant
         except sqlite3.Error as e:
             print(f"Database error: {e}")
-            return "Error retrieving memory."
+            return "Error retrieving memory.", ""
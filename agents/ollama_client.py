@@ -0,0 +1,118 @@
+from typing import Any, AsyncIterator, Iterator, List, Mapping, Optional
+from langchain_community.llms import Ollama
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache
+from langchain_core.outputs import Generation, GenerationChunk
+
+class GatewayOllama(Ollama):
+    """
+    An Ollama client whose requests go through an LLMGateway.
+
+    Each generation waits for a slot from the gateway, which also picks the
+    host it is sent to, and holds the slot until the response has been fully
+    streamed. Responses served from the LLM cache never take a slot.
+
+    Streamed calls use the LLM cache too, which LangChain only consults for
+    non-streamed ones: a cached response is replayed as a single chunk, and a
+    streamed response is stored once it is complete.
+    """
+    gateway: Optional[Any] = None
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        # How long the model stays loaded does not change its output, so it
+        # is left out of the LLM cache key
+        params = dict(super()._identifying_params)
+        params.pop("keep_alive", None)
+        return params
+
+    def _response_cache(self) -> Optional[BaseCache]:
+        """Returns the cache a call would use without streaming, or None."""
+        if self.cache is False:
+            return None
+        return self.cache if isinstance(self.cache, BaseCache) else get_llm_cache()
+
+    def _llm_string(self, stop: Optional[List[str]]) -> str:
+        """Returns the cache key of the model and its parameters, as BaseLLM.generate builds it."""
+        params = self.dict()
+        params["stop"] = stop
+        return str(sorted(params.items()))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        cache = self._response_cache()
+        if cache is None:
+            yield from super()._stream(prompt, stop, run_manager, **kwargs)
+            return
+
+        llm_string = self._llm_string(stop)
+        cached = cache.lookup(prompt, llm_string)
+        if cached:
+            chunk = GenerationChunk(text="".join(generation.text for generation in cached))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+
+        response = None
+        for chunk in super()._stream(prompt, stop, run_manager, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            cache.update(prompt, llm_string, [Generation(text=response.text, generation_info=response.generation_info)])
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        cache = self._response_cache()
+        if cache is None:
+            async for chunk in super()._astream(prompt, stop, run_manager, **kwargs):
+                yield chunk
+            return
+
+        llm_string = self._llm_string(stop)
+        cached = await cache.alookup(prompt, llm_string)
+        if cached:
+            chunk = GenerationChunk(text="".join(generation.text for generation in cached))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+
+        response = None
+        async for chunk in super()._astream(prompt, stop, run_manager, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            await cache.aupdate(prompt, llm_string, [Generation(text=response.text, generation_info=response.generation_info)])
+
+    def _create_generate_stream(self, prompt: str, stop: Optional[List[str]] = None, images: Optional[List[str]] = None, **kwargs: Any) -> Iterator[str]:
+        if self.gateway is None:
+            yield from super()._create_generate_stream(prompt, stop, images, **kwargs)
+            return
+
+        host = self.gateway.acquire()
+        try:
+            yield from self._create_stream(
+                payload={"prompt": prompt, "images": images},
+                stop=stop,
+                api_url=f"{host}/api/generate",
+                **kwargs,
+            )
+        finally:
+            self.gateway.release(host)
+
+    async def _acreate_generate_stream(self, prompt: str, stop: Optional[List[str]] = None, images: Optional[List[str]] = None, **kwargs: Any) -> AsyncIterator[str]:
+        if self.gateway is None:
+            async for item in super()._acreate_generate_stream(prompt, stop, images, **kwargs):
+                yield item
+            return
+
+        host = await self.gateway.aacquire()
+        try:
+            async for item in self._acreate_stream(
+                payload={"prompt": prompt, "images": images},
+                stop=stop,
+                api_url=f"{host}/api/generate",
+                **kwargs,
+            ):
+                yield item
+        finally:
+            self.gateway.release(host)
@@ -1,48 +1,160 @@
-from langchain_core.prompts import PromptTemplate
+import asyncio
 from langchain_community.llms import Ollama
 from agents.tools import SandboxExecutor
+from agents.streaming import stream_chain, astream_chain
+from agents.prompts import layered_prompt
+from agents.registry import registry
+from agents.code_execution import CodeCompileError, check_code, extract_code, lookup_output
+from agents.tracing import tracer
 
-def run_programmer(task_description: str, llm: Ollama, sandbox: SandboxExecutor, context: str) -> str:
+# Appended to the task when the generated code does not compile
+FIX_TEMPLATE = """{task_description}
+
+Your previous code did not compile:
+{error}
+
+Your previous code was:
+{code}
+Return the corrected code."""
+
+def _build_programmer_chain(llm: Ollama):
+    """Builds the prompt | llm chain for the programmer agent."""
+    # Define the prompt template for the programmer agent
+    programmer_instructions = """
+    You are a Python programmer. Your task is to write a Python script to accomplish the task given at the end.
+    Review the recent memory entries to understand the context of the task.
+
+    Do not add any explanation, just the code.
+    Your code should be a single block of Python code.
+    """
+
+    prompt = layered_prompt(
+        programmer_instructions,
+        project="{context}",
+        task="""
+        {relevant_context}
+
+        Task: {task_description}
+        """,
+    )
+
+    # Create the chain
+    return prompt | llm
+
+def _check_generated_code(response: str, task_description: str) -> tuple:
+    """
+    Extracts the code from a response and compiles it in-process.
+
+    Returns:
+        tuple: The code, the compile error or None, and the task description
+            to re-prompt with if there was an error.
+    """
+    code = extract_code(response)
+    error = check_code(code)
+    if error is not None:
+        tracer.metrics.inc("programmer_compile_errors_total")
+        task_description = FIX_TEMPLATE.format(task_description=task_description, error=error, code=code)
+    return code, error, task_description
+
+def _store_output(sandbox: SandboxExecutor, code: str, inputs: str, result: str):
+    """Caches the output of a run, if the sandbox has an execution cache."""
+    if sandbox.execution_cache is not None:
+        sandbox.execution_cache.put(code, inputs, result)
+
+def run_programmer(task_description: str, llm: Ollama, sandbox: SandboxExecutor, context: str, on_token=None, inputs: str = "", max_fixes: int = 1, relevant_context: str = "") -> str:
     """
     Runs the programmer agent to generate and execute Python code.
 
+    The code is extracted from any Markdown fences and compiled in-process
+    first; code that does not compile is sent back to the LLM with the error,
+    up to max_fixes times, instead of to the sandbox. If the sandbox has an
+    execution cache, the output of an identical earlier run on the same
+    inputs is reused.
+
     Args:
         task_description (str): The description of the task for the programmer.
         llm (Ollama): The Ollama LLM instance.
         sandbox (SandboxExecutor): The sandbox executor for running the code.
         context (str): The memory context from previous steps.
+        on_token (callable, optional): Called with each chunk of the code as it is generated.
+        inputs (str): The fingerprint of the data the code's output depends on, from inputs_fingerprint.
+        max_fixes (int): The maximum number of times to ask for code that compiles.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
 
     Returns:
         str: The result of the code execution.
+
+    Raises:
+        CodeCompileError: If the generated code still does not compile after max_fixes attempts.
     """
-    # Define the prompt template for the programmer agent
-    programmer_template = \"\"\"
-    You are a Python programmer. Your task is to write a Python script to accomplish the following task.
-    Review the following recent memory entries to understand the context of the task:
-    {context}
+    chain = registry.get("programmer_chain", lambda: _build_programmer_chain(llm), llm)
 
-    Do not add any explanation, just the code.
+    request = task_description
+    for _ in range(max_fixes + 1):
+        # Invoke the chain to get the Python code
+        response = stream_chain(chain, {
+            "task_description": request,
+            "context": context,
+            "relevant_context": relevant_context,
+        }, on_token)
+        code, error, request = _check_generated_code(response, task_description)
+        if error is None:
+            break
+    else:
+        raise CodeCompileError(f"The generated code could not be compiled: {error}")
 
-    Task: {task_description}
+    cached = lookup_output(sandbox.execution_cache, code, inputs)
+    if cached is not None:
+        return cached
 
-    Your code should be a single block of Python code.
-    \"\"\"
+    # Execute the code in the sandbox
+    result = sandbox._run(code)
+    _store_output(sandbox, code, inputs, result)
 
-    prompt = PromptTemplate(
-        template=programmer_template,
-        input_variables=["task_description", "context"],
-    )
+    return result
 
-    # Create the chain
-    chain = prompt | llm
+async def arun_programmer(task_description: str, llm: Ollama, sandbox: SandboxExecutor, context: str, on_token=None, inputs: str = "", max_fixes: int = 1, relevant_context: str = "") -> str:
+    """
+    Asynchronously runs the programmer agent to generate and execute Python code.
+
+    Args:
+        task_description (str): The description of the task for the programmer.
+        llm (Ollama): The Ollama LLM instance.
+        sandbox (SandboxExecutor): The sandbox executor for running the code.
+        context (str): The memory context from previous steps.
+        on_token (callable, optional): Called with each chunk of the code as it is generated.
+        inputs (str): The fingerprint of the data the code's output depends on, from inputs_fingerprint.
+        max_fixes (int): The maximum number of times to ask for code that compiles.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
+
+    Returns:
+        str: The result of the code execution.
+
+    Raises:
+        CodeCompileError: If the generated code still does not compile after max_fixes attempts.
+    """
+    chain = registry.get("programmer_chain", lambda: _build_programmer_chain(llm), llm)
+
+    request = task_description
+    for _ in range(max_fixes + 1):
+        # Invoke the chain to get the Python code
+        response = await astream_chain(chain, {
+            "task_description": request,
+            "context": context,
+            "relevant_context": relevant_context,
+        }, on_token)
+        code, error, request = _check_generated_code(response, task_description)
+        if error is None:
+            break
+    else:
+        raise CodeCompileError(f"The generated code could not be compiled: {error}")
 
-    # Invoke the chain to get the Python code
-    python_code = chain.invoke({
-        "task_description": task_description,
-        "context": context
-    })
+    cached = await asyncio.to_thread(lookup_output, sandbox.execution_cache, code, inputs)
+    if cached is not None:
+        return cached
 
     # Execute the code in the sandbox
-    result = sandbox._run(python_code)
+    result = await sandbox._arun(code)
+    await asyncio.to_thread(_store_output, sandbox, code, inputs, result)
 
     return result
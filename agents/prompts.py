@@ -0,0 +1,47 @@
+import textwrap
+from langchain_core.prompts import PromptTemplate
+
+# The ReAct prompt published on the LangChain hub as "hwchase17/react",
+# vendored so the Researcher starts without a network round trip.
+REACT_TEMPLATE = """Answer the following questions as best you can. You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}"""
+
+REACT_PROMPT = PromptTemplate.from_template(REACT_TEMPLATE)
+
+def layered_prompt(instructions: str, project: str = "", task: str = "") -> PromptTemplate:
+    """
+    Builds a prompt template whose parts are ordered from most to least stable.
+
+    The fixed instructions come first, then the material shared by a
+    project's tasks, e.g. its memory context, and the task's own content
+    last. Prompts built this way share their longest possible prefix with
+    the agent's previous calls, so Ollama can reuse its cached KV state for
+    that prefix instead of prefilling it again.
+
+    Args:
+        instructions (str): The agent's instructions; they should not contain variables.
+        project (str): The template of the project-level material.
+        task (str): The template of the per-task content.
+
+    Returns:
+        PromptTemplate: The template, with its input variables taken from the parts.
+    """
+    parts = [textwrap.dedent(part).strip() for part in (instructions, project, task)]
+    return PromptTemplate.from_template("\n\n".join(part for part in parts if part) + "\n")
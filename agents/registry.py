@@ -0,0 +1,50 @@
+import threading
+
+class AgentRegistry:
+    """
+    Builds prompts, chains, tools and agent executors once and reuses them.
+
+    Objects are cached under a name and the identities of the components they
+    were built from, e.g. the LLM (its model and sampling parameters) and the
+    clients behind a tool set. The registry keeps those components alive, so
+    their identities stay unique for as long as the cached object exists.
+
+    Everything cached must be safe to invoke concurrently, which holds for
+    LangChain runnables and executors: per-run state such as callbacks and
+    intermediate steps is passed at invocation time.
+    """
+
+    def __init__(self):
+        """Initializes the AgentRegistry instance."""
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, build, *components):
+        """
+        Returns the cached object for a name and set of components, building it on first use.
+
+        Args:
+            name (str): What is being built, e.g. "writer_chain".
+            build (callable): Called with no arguments to build the object.
+            *components: The objects the result depends on, e.g. the LLM and clients.
+
+        Returns:
+            The cached object.
+        """
+        key = (name,) + tuple(id(component) for component in components)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (build(), components)
+            return entry[0]
+
+    def clear(self):
+        """Drops every cached object."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# The process-wide registry shared by every agent
+registry = AgentRegistry()
@@ -1,58 +1,149 @@
-from langchain.prompts import PromptTemplate
-from langchain import hub
 from langchain.agents import create_react_agent, AgentExecutor
 from agents.tools import TavilySearchTool
+from agents.streaming import TokenCallbackHandler
+from agents.prompts import REACT_PROMPT, layered_prompt
+from agents.registry import registry
+from agents.search_results import search_session
 
-def run_researcher(task: str, llm, tavily_client, context: str):
-    """
-    Runs the researcher agent for a given task.
-
-    Args:
-        task (str): The research task.
-        llm (Ollama): The Ollama LLM instance.
-        tavily_client (TavilyClient): The Tavily client instance.
-        context (str): The memory context from previous steps.
-
-    Returns:
-        str: The research report.
-    """
+def _build_researcher_executor(llm, tavily_client, async_tavily_client=None, search_cache=None):
+    """Builds the ReAct agent executor with the Tavily search tool."""
     # Initialize the Tavily search tool
-    tools = [TavilySearchTool(tavily_client=tavily_client)]
-
-    # Get the ReAct prompt
-    prompt = hub.pull("hwchase17/react")
+    tools = [TavilySearchTool(
+        tavily_client=tavily_client,
+        async_tavily_client=async_tavily_client,
+        search_cache=search_cache,
+    )]
 
     # Create the agent
-    agent = create_react_agent(llm, tools, prompt)
+    agent = create_react_agent(llm, tools, REACT_PROMPT)
 
     # Create the agent executor
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    return AgentExecutor(agent=agent, tools=tools, verbose=True)
 
+def _build_researcher_prompt():
+    """Builds the prompt template that turns a research task into the agent's input."""
     # Define the prompt template for the researcher agent
-    researcher_template = \"\"\"
+    researcher_instructions = """
     You are a researcher agent. Your goal is to gather information from the internet and synthesize it into a structured report.
-    Review the following recent memory entries to understand the context of the task:
-    {context}
+    Review the recent memory entries to understand the context of the task.
 
-    Based on the following research task, use the TavilySearch tool to gather information. Then, synthesize the information into a report with the following structure:
+    Based on the research task given at the end, use the TavilySearch tool to gather information. Then, synthesize the information into a report with the following structure:
 
     1.  **Summary**: A brief summary of the findings.
     2.  **Raw Data**: The raw data collected from the search, including snippets and content.
     3.  **Source URLs**: A list of the URLs of the sources used.
+    """
+
+    return layered_prompt(
+        researcher_instructions,
+        project="{context}",
+        task="""
+        {relevant_context}
+
+        Research Task: {task}
+
+        Begin!
+        """,
+    )
+
+def _build_researcher(task: str, llm, tavily_client, context: str, async_tavily_client=None, search_cache=None, relevant_context: str = ""):
+    """
+    Returns the ReAct agent executor and its input for a research task.
 
-    Research Task: {task}
+    The executor is built once per LLM and set of search clients and then
+    reused across tasks and projects.
 
-    Begin!
-    \"\"\"
+    Returns:
+        tuple: The AgentExecutor and the input dictionary to invoke it with.
+    """
+    agent_executor = registry.get(
+        "researcher_executor",
+        lambda: _build_researcher_executor(llm, tavily_client, async_tavily_client, search_cache),
+        llm, tavily_client, async_tavily_client, search_cache,
+    )
 
     # Create the prompt
-    prompt_with_task = PromptTemplate(
-        template=researcher_template,
-        input_variables=["task", "context"],
-    ).format(task=task, context=context)
+    prompt_with_task = registry.get("researcher_prompt", _build_researcher_prompt).format(
+        task=task, context=context, relevant_context=relevant_context
+    )
+
+    return agent_executor, {"input": prompt_with_task}
+
+def _streaming_config(on_token):
+    """Returns the run config that forwards the agent's LLM tokens to on_token."""
+    return {"callbacks": [TokenCallbackHandler(on_token)]} if on_token else None
+
+def _report_steps(chunk: dict, on_step):
+    """Forwards the ReAct actions and observations in an agent stream chunk to on_step."""
+    for action in chunk.get("actions", []):
+        on_step(action.log)
+    for step in chunk.get("steps", []):
+        on_step(f"Observation: {step.observation}")
+
+def run_researcher(task: str, llm, tavily_client, context: str, search_cache=None, on_token=None, on_step=None, relevant_context: str = ""):
+    """
+    Runs the researcher agent for a given task.
+
+    Args:
+        task (str): The research task.
+        llm (Ollama): The Ollama LLM instance.
+        tavily_client (TavilyClient): The Tavily client instance.
+        context (str): The memory context from previous steps.
+        search_cache (SearchCache, optional): A cache for search results shared across tasks.
+        on_token (callable, optional): Called with each token the agent's LLM generates.
+        on_step (callable, optional): Called with each ReAct action and observation.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
+
+    Returns:
+        str: The research report.
+    """
+    agent_executor, agent_input = _build_researcher(task, llm, tavily_client, context, search_cache=search_cache, relevant_context=relevant_context)
+
+    config = _streaming_config(on_token)
+    # Drop results the task's earlier searches already returned
+    with search_session():
+        if on_step is None:
+            # Invoke the agent
+            return agent_executor.invoke(agent_input, config=config)["output"]
 
+        # Stream the agent, reporting its intermediate steps
+        output = ""
+        for chunk in agent_executor.stream(agent_input, config=config):
+            _report_steps(chunk, on_step)
+            output = chunk.get("output", output)
+        return output
+
+async def arun_researcher(task: str, llm, tavily_client, context: str, async_tavily_client=None, search_cache=None, on_token=None, on_step=None, relevant_context: str = ""):
+    """
+    Asynchronously runs the researcher agent for a given task.
+
+    Args:
+        task (str): The research task.
+        llm (Ollama): The Ollama LLM instance.
+        tavily_client (TavilyClient): The Tavily client instance.
+        context (str): The memory context from previous steps.
+        async_tavily_client (AsyncTavilyClient, optional): A native async Tavily client.
+            Without it, searches are offloaded to a worker thread.
+        search_cache (SearchCache, optional): A cache for search results shared across tasks.
+        on_token (callable, optional): Called with each token the agent's LLM generates.
+        on_step (callable, optional): Called with each ReAct action and observation.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
+
+    Returns:
+        str: The research report.
+    """
+    agent_executor, agent_input = _build_researcher(task, llm, tavily_client, context, async_tavily_client, search_cache, relevant_context)
 
-    # Invoke the agent
-    response = agent_executor.invoke({"input": prompt_with_task})
+    config = _streaming_config(on_token)
+    # Drop results the task's earlier searches already returned
+    with search_session():
+        if on_step is None:
+            # Invoke the agent without blocking the event loop
+            return (await agent_executor.ainvoke(agent_input, config=config))["output"]
 
-    return response["output"]
+        # Stream the agent, reporting its intermediate steps
+        output = ""
+        async for chunk in agent_executor.astream(agent_input, config=config):
+            _report_steps(chunk, on_step)
+            output = chunk.get("output", output)
+        return output
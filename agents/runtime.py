@@ -0,0 +1,234 @@
+import os
+from agents.storage import DEFAULT_DB_PATH, get_connection, migrate
+from agents.tracing import DEFAULT_TRACE_PATH, tracer, start_metrics_server
+
+# LangChain, the Tavily and sandbox clients and numpy take about a second to
+# import, so the factories import them on first use. Importing this module
+# only costs the storage and tracing layers, which keeps the Streamlit app's
+# cold start fast.
+
+# Initialize the Ollama gateway
+def get_llm_gateway(host="http://ollama:11434"):
+    """
+    Initializes and returns the gateway that limits and routes requests to Ollama.
+
+    OLLAMA_HOSTS may list several comma-separated servers to spread the
+    requests over, and OLLAMA_MAX_IN_FLIGHT sets how many requests each of
+    them is sent at a time (4 by default).
+    """
+    from agents.gateway import LLMGateway
+    hosts = [h.strip() for h in os.getenv("OLLAMA_HOSTS", host).split(",") if h.strip()]
+    return LLMGateway(hosts, max_in_flight=int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "4")))
+
+# Initialize Ollama
+def get_ollama_llm(model="llama3", host="http://ollama:11434", cache=None, gateway=None):
+    """
+    Initializes and returns the Ollama LLM instance.
+
+    Responses are served from the given cache when the same model, sampling
+    parameters and rendered prompt have been seen before. Every call is
+    recorded as an "llm" span. With a gateway, requests wait for a slot and
+    are routed to one of its hosts. The model stays loaded for OLLAMA_KEEP_ALIVE
+    (30 minutes by default) after each request, so idle gaps between projects
+    do not cause reloads.
+    """
+    from agents.ollama_client import GatewayOllama
+    from agents.llm_tracing import LLMTracingHandler
+    return GatewayOllama(
+        model=model, base_url=host, cache=cache, gateway=gateway,
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"), callbacks=[LLMTracingHandler()],
+    )
+
+# Initialize the LLM response cache, stored next to research_agent.db
+def get_llm_cache():
+    """Initializes and returns the persistent LLM response cache."""
+    from agents.llm_cache import LLMResponseCache
+    return LLMResponseCache(db_path='llm_cache.db')
+
+# Initialize Tavily client
+def get_tavily_client():
+    """
+    Initializes and returns the Tavily client.
+
+    Raises:
+        ValueError: If the TAVILY_API_KEY environment variable is not set.
+    """
+    from tavily import TavilyClient
+    tavily_api_key = os.getenv("TAVILY_API_KEY")
+    if not tavily_api_key:
+        raise ValueError("Tavily API key not found. Please set the TAVILY_API_KEY environment variable.")
+    return TavilyClient(api_key=tavily_api_key)
+
+# Initialize the search result cache
+def get_search_cache():
+    """Initializes and returns the persistent search result cache."""
+    from agents.search_cache import SearchCache
+    return SearchCache(db_path='search_cache.db')
+
+# Initialize the Programmer's execution cache
+def get_execution_cache():
+    """Initializes and returns the persistent cache of program outputs."""
+    from agents.code_execution import ExecutionCache
+    return ExecutionCache(db_path='execution_cache.db')
+
+# Initialize SQLite database
+def init_db():
+    """Initializes the SQLite database and applies any pending schema migrations."""
+    conn = get_connection(DEFAULT_DB_PATH)
+    migrate(conn)
+    return conn
+
+# Initialize the sandbox pool
+def get_sandbox_pool(concurrency: int = 4):
+    """
+    Initializes and returns a pool of pre-warmed code sandboxes.
+
+    The pool has SANDBOX_POOL_SIZE sandboxes, by default one per project the
+    process runs at the same time, since each project holds one while its
+    Programmer tasks run.
+    """
+    from agents.sandbox_pool import SandboxPool
+    return SandboxPool(size=int(os.getenv("SANDBOX_POOL_SIZE", str(concurrency))))
+
+# Initialize tracing and metrics
+def init_tracing(metrics_port_offset: int = 0):
+    """
+    Exports spans to the JSONL file named by TRACE_PATH (traces.jsonl by default).
+
+    If METRICS_PORT is set, the metrics are also served in the Prometheus
+    format at http://<host>:<METRICS_PORT + metrics_port_offset>/metrics.
+    """
+    tracer.export_to(os.getenv("TRACE_PATH", DEFAULT_TRACE_PATH))
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(int(metrics_port) + metrics_port_offset)
+
+# Initialize semantic memory
+def get_semantic_memory():
+    """
+    Initializes and returns the semantic memory index.
+
+    Entries are embedded with the Ollama model named by OLLAMA_EMBED_MODEL,
+    or with the local hashing embedder if it is not set.
+    """
+    from agents.semantic_memory import SemanticMemory, get_ollama_embedder
+    embed_model = os.getenv("OLLAMA_EMBED_MODEL")
+    embedder = get_ollama_embedder(embed_model) if embed_model else None
+    return SemanticMemory(embedder)
+
+# Initialize agent memory with semantic retrieval
+def get_agent_memory(semantic_memory=None):
+    """Initializes and returns the agent memory, sharing the given semantic memory index."""
+    from agents.memory import AgentMemory
+    return AgentMemory(semantic_memory=semantic_memory or get_semantic_memory())
+
+class ProjectRunner:
+    """
+    Runs research projects end to end with one set of shared clients and caches.
+
+    A worker process creates a single ProjectRunner and calls it for every
+    job it claims, so the LLM gateway and cache, search cache, sandbox pool
+    and semantic index are shared by all of the process's projects. Unless
+    OLLAMA_WARM_UP is "0", the model is loaded on every Ollama host up front.
+    """
+
+    def __init__(self, max_workers: int = 4, concurrency: int = 4):
+        """
+        Initializes the ProjectRunner instance.
+
+        Args:
+            max_workers (int): The maximum number of tasks of one project running at the same time.
+            concurrency (int): The number of projects the process runs at the same time.
+        """
+        from agents.tools import SandboxExecutor
+        self.max_workers = max_workers
+        self.llm_cache = get_llm_cache()
+        self.llm_gateway = get_llm_gateway()
+        self.llm = get_ollama_llm(cache=self.llm_cache, gateway=self.llm_gateway)
+        if os.getenv("OLLAMA_WARM_UP", "1") != "0":
+            self.llm_gateway.warm_up(self.llm.model, self.llm.keep_alive)
+        self.tavily_client = get_tavily_client()
+        self.search_cache = get_search_cache()
+        self.sandbox_pool = get_sandbox_pool(concurrency)
+        self.execution_cache = get_execution_cache()
+        self.sandbox_executor = SandboxExecutor(pool=self.sandbox_pool, execution_cache=self.execution_cache)
+        self.semantic_memory = get_semantic_memory()
+
+    def __call__(self, project_id: str, query: str) -> list:
+        """
+        Runs a research project, resuming it if an earlier run was interrupted.
+
+        Args:
+            project_id (str): The unique ID for the research project.
+            query (str): The user's research query.
+
+        Returns:
+            list: The IDs of the project's tasks.
+
+        Raises:
+            ValueError: If the query could not be decomposed into tasks.
+        """
+        from agents.checkpoint import clear_checkpoint, load_checkpoint
+        from agents.manager import decompose_task
+        conn = get_connection(DEFAULT_DB_PATH)
+        with tracer.trace(project_id):
+            checkpoint = load_checkpoint(conn, project_id)
+            if checkpoint is not None:
+                return self._orchestrate(project_id, checkpoint.tasks, checkpoint)
+
+            # Drop whatever an earlier run left without a usable plan
+            clear_checkpoint(conn, project_id)
+            tasks = decompose_task(query, self.llm)
+            if not tasks:
+                raise ValueError("Failed to decompose the task.")
+            return self._orchestrate(project_id, tasks)
+
+    def resume(self, project_id: str) -> list:
+        """
+        Resumes an interrupted research project from its checkpoint.
+
+        The saved plan is reused and only the tasks that are pending or failed
+        are run again; the results of completed tasks are kept.
+
+        Args:
+            project_id (str): The unique ID for the research project.
+
+        Returns:
+            list: The IDs of the project's tasks.
+
+        Raises:
+            ValueError: If the project has no checkpoint.
+        """
+        from agents.checkpoint import load_checkpoint
+        with tracer.trace(project_id):
+            checkpoint = load_checkpoint(get_connection(DEFAULT_DB_PATH), project_id)
+            if checkpoint is None:
+                raise ValueError(f"No checkpoint found for project {project_id}.")
+            return self._orchestrate(project_id, checkpoint.tasks, checkpoint)
+
+    def _orchestrate(self, project_id: str, tasks: list, checkpoint=None) -> list:
+        """
+        Runs the agents for a plan, skipping the tasks the checkpoint has results for.
+
+        The tasks' streamed output and steps are logged for the UI while they
+        run, and dropped once the project has finished.
+        """
+        from agents.manager import orchestrate_agents
+        from agents.task_events import TaskEventLog
+        event_log = TaskEventLog(project_id)
+        event_log.clear()
+        try:
+            return orchestrate_agents(
+                project_id, tasks, get_connection(DEFAULT_DB_PATH), self.llm, self.tavily_client, self.sandbox_executor,
+                max_workers=self.max_workers, search_cache=self.search_cache,
+                memory=get_agent_memory(self.semantic_memory), event_queue=event_log, checkpoint=checkpoint,
+            )
+        finally:
+            event_log.clear()
+
+    def close(self):
+        """Shuts down the sandbox pool and closes the caches."""
+        self.sandbox_pool.close()
+        self.execution_cache.close()
+        self.search_cache.close()
+        self.llm_cache.close()
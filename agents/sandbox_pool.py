@@ -0,0 +1,224 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from ai_code_sandbox import AICodeSandbox
+
+class SandboxPool:
+    """
+    A pool of pre-warmed code sandboxes with checkout/return semantics.
+
+    Starting a sandbox container is slow, so the pool starts `size` of them up
+    front and hands them out to concurrent runs. A project can also hold a
+    persistent session: a sandbox pinned to that project until the session
+    ends, so files written by one run are still there for the next. When the
+    session ends its sandbox is replaced rather than reused, so the next
+    project cannot read those files. Sandboxes that fail a health check are
+    closed and replaced in the background too.
+    """
+
+    def __init__(self, size: int = 2, factory=None, health_check_code: str = "print('ok')", warm: bool = True, **sandbox_kwargs):
+        """
+        Initializes the SandboxPool instance.
+
+        Args:
+            size (int): The number of sandboxes kept in the pool.
+            factory (callable, optional): Called with sandbox_kwargs to create a sandbox.
+                Defaults to AICodeSandbox.
+            health_check_code (str): Code whose successful run marks a sandbox as healthy.
+            warm (bool): Whether to start all sandboxes immediately instead of on first use.
+            **sandbox_kwargs: Passed to the factory, e.g. packages=["pandas"] to
+                preinstall packages in the sandbox image.
+        """
+        self.size = size
+        self.factory = factory or AICodeSandbox
+        self.health_check_code = health_check_code
+        self.sandbox_kwargs = sandbox_kwargs
+        self.recycled = 0
+        self._idle = queue.Queue()
+        self._sessions = {}
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+        if warm:
+            with ThreadPoolExecutor(max_workers=size) as executor:
+                for sandbox in executor.map(lambda _: self._create(), range(size)):
+                    self._idle.put(sandbox)
+
+    def _create(self):
+        """Creates a new sandbox and counts it against the pool size."""
+        with self._lock:
+            self._created += 1
+        return self._start()
+
+    def _start(self):
+        """Creates a sandbox for a slot already counted against the pool size, freeing the slot if that fails."""
+        try:
+            return self.factory(**self.sandbox_kwargs)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def is_healthy(self, sandbox) -> bool:
+        """
+        Checks whether a sandbox can still run code.
+
+        Args:
+            sandbox (AICodeSandbox): The sandbox to check.
+
+        Returns:
+            bool: True if the health check code ran successfully.
+        """
+        try:
+            output = sandbox.run_code(self.health_check_code)
+            return "ok" in str(output)
+        except Exception:
+            return False
+
+    def checkout(self, timeout: float = None):
+        """
+        Takes a sandbox out of the pool, creating one if the pool is not full yet.
+
+        Args:
+            timeout (float, optional): The number of seconds to wait for a free sandbox.
+
+        Returns:
+            AICodeSandbox: The sandbox.
+
+        Raises:
+            queue.Empty: If no sandbox became free within the timeout.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        # Count the new sandbox while holding the lock, so concurrent callers cannot overfill the pool
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            return self._start()
+        return self._idle.get(timeout=timeout)
+
+    def release(self, sandbox, healthy: bool = True):
+        """
+        Returns a sandbox to the pool, replacing it if it is broken.
+
+        Args:
+            sandbox (AICodeSandbox): The sandbox to return.
+            healthy (bool): False if the last run failed, which triggers a health check.
+        """
+        if self._closed:
+            self._close_sandbox(sandbox)
+        elif healthy or self.is_healthy(sandbox):
+            self._idle.put(sandbox)
+        else:
+            threading.Thread(target=self._recycle, args=(sandbox,), daemon=True).start()
+
+    def _recycle(self, sandbox):
+        """Closes a sandbox and adds a fresh one to the pool in its slot."""
+        self._close_sandbox(sandbox)
+        with self._lock:
+            self.recycled += 1
+        try:
+            self._idle.put(self._start())
+        except Exception as e:
+            print(f"Failed to replace sandbox: {e}")
+
+    @staticmethod
+    def _close_sandbox(sandbox):
+        try:
+            sandbox.close()
+        except Exception as e:
+            print(f"Failed to close sandbox: {e}")
+
+    @contextmanager
+    def sandbox(self, timeout: float = None):
+        """
+        Checks out a sandbox for the duration of a with-block.
+
+        Args:
+            timeout (float, optional): The number of seconds to wait for a free sandbox.
+
+        Yields:
+            AICodeSandbox: The sandbox.
+        """
+        sandbox = self.checkout(timeout)
+        healthy = True
+        try:
+            yield sandbox
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.release(sandbox, healthy)
+
+    @contextmanager
+    def session(self, session_id: str, timeout: float = None):
+        """
+        Uses the sandbox pinned to a session for the duration of a with-block.
+
+        The first use of a session checks a sandbox out of the pool and keeps
+        it until end_session is called. Runs within a session are serialized.
+
+        Args:
+            session_id (str): The session ID, e.g. the project ID.
+            timeout (float, optional): The number of seconds to wait for a free sandbox.
+
+        Yields:
+            AICodeSandbox: The session's sandbox.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = {"sandbox": None, "lock": threading.Lock()}
+
+        with session["lock"]:
+            if session["sandbox"] is None:
+                session["sandbox"] = self.checkout(timeout)
+            try:
+                yield session["sandbox"]
+            except Exception:
+                # Replace the session's sandbox if the failure broke it
+                if not self.is_healthy(session["sandbox"]):
+                    self.release(session["sandbox"], healthy=False)
+                    session["sandbox"] = None
+                raise
+
+    def end_session(self, session_id: str):
+        """
+        Ends a session and replaces its sandbox with a fresh one in the background.
+
+        The sandbox still holds the session's files, so it is not handed to anyone else.
+
+        Args:
+            session_id (str): The session ID.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            with session["lock"]:
+                sandbox, session["sandbox"] = session["sandbox"], None
+            if sandbox is None:
+                return
+            if self._closed:
+                self._close_sandbox(sandbox)
+            else:
+                threading.Thread(target=self._recycle, args=(sandbox,), daemon=True).start()
+
+    def close(self):
+        """Closes every idle and session sandbox."""
+        self._closed = True
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            if session["sandbox"] is not None:
+                self._close_sandbox(session["sandbox"])
+        while True:
+            try:
+                self._close_sandbox(self._idle.get_nowait())
+            except queue.Empty:
+                break
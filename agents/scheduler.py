@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import inspect
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Agents whose output a given agent consumes when the plan gives no explicit edges
+DEFAULT_UPSTREAM_AGENTS = {
+    'Researcher': (),
+    'Programmer': ('Researcher',),
+    'Writer': ('Researcher', 'Programmer'),
+    'Critic': ('Writer', 'Programmer'),
+}
+
+def resolve_dependencies(tasks: list) -> list:
+    """
+    Resolves the dependency edges between decomposed tasks.
+
+    A task may declare its dependencies explicitly through a "depends_on" list,
+    whose items are the "id" values of other tasks or, where no task has that
+    id, task indices. Ids are compared as strings, so 1 and "1" match.
+    Otherwise the edges are inferred from the agent type: a task depends on
+    every earlier task whose agent it consumes (see DEFAULT_UPSTREAM_AGENTS).
+    Tasks for unknown agents depend on all earlier tasks.
+
+    Args:
+        tasks (list): A list of task dictionaries from decompose_task.
+
+    Returns:
+        list: For each task, a sorted list of the indices of the tasks it depends on.
+
+    Raises:
+        ValueError: If the dependencies contain a cycle.
+    """
+    ids = {str(task['id']): index for index, task in enumerate(tasks) if task.get('id') is not None}
+    dependencies = []
+
+    for index, task in enumerate(tasks):
+        if task.get('depends_on') is not None:
+            upstream = set()
+            for ref in task['depends_on']:
+                dep = ids.get(str(ref))
+                if dep is None and not isinstance(ref, bool) and str(ref).isdigit() and int(ref) < len(tasks):
+                    dep = int(ref)
+                if dep is None or dep == index:
+                    print(f"Ignoring dependency {ref!r} of task {index}: it is not another task of the plan.")
+                    continue
+                upstream.add(dep)
+        else:
+            agents = DEFAULT_UPSTREAM_AGENTS.get(task.get('agent'))
+            upstream = {
+                i for i in range(index)
+                if agents is None or tasks[i].get('agent') in agents
+            }
+            # A Critic without anything to review depends on everything before it
+            if not upstream and task.get('agent') == 'Critic':
+                upstream = set(range(index))
+        dependencies.append(sorted(upstream))
+
+    _check_acyclic(dependencies)
+    return dependencies
+
+def ancestors(dependencies: list, index: int) -> list:
+    """
+    Returns the indices of all direct and transitive dependencies of a task.
+
+    Args:
+        dependencies (list): The dependency lists returned by resolve_dependencies.
+        index (int): The index of the task.
+
+    Returns:
+        list: The sorted indices of every upstream task.
+    """
+    seen = set()
+    stack = list(dependencies[index])
+    while stack:
+        dep = stack.pop()
+        if dep not in seen:
+            seen.add(dep)
+            stack.extend(dependencies[dep])
+    return sorted(seen)
+
+def dependents(dependencies: list, indices) -> list:
+    """
+    Returns the indices of all tasks that directly or transitively depend on any of the given tasks.
+
+    Args:
+        dependencies (list): The dependency lists returned by resolve_dependencies.
+        indices (iterable): The indices of the upstream tasks.
+
+    Returns:
+        list: The sorted indices of every downstream task, excluding the given ones
+            unless they depend on each other.
+    """
+    downstream = {index: [] for index in range(len(dependencies))}
+    for index, deps in enumerate(dependencies):
+        for dep in deps:
+            downstream[dep].append(index)
+
+    seen = set()
+    stack = [dependent for index in indices for dependent in downstream[index]]
+    while stack:
+        index = stack.pop()
+        if index not in seen:
+            seen.add(index)
+            stack.extend(downstream[index])
+    return sorted(seen)
+
+def _check_acyclic(dependencies: list):
+    """Raises ValueError if the dependency graph contains a cycle."""
+    remaining = {index: set(deps) for index, deps in enumerate(dependencies)}
+    while remaining:
+        ready = [index for index, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Task dependencies contain a cycle between tasks {sorted(remaining)}.")
+        for index in ready:
+            del remaining[index]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+def _initial_state(dependencies: list, finished: dict = None) -> tuple:
+    """Returns the pending dependencies of the tasks still to run and the results of the finished ones."""
+    finished = finished or {}
+    pending = {
+        index: set(deps).difference(finished)
+        for index, deps in enumerate(dependencies) if index not in finished
+    }
+    results = {index: result for index, result in finished.items() if not isinstance(result, BaseException)}
+    return pending, results
+
+def run_task_graph(dependencies: list, execute, on_complete=None, max_workers: int = 4, finished: dict = None) -> dict:
+    """
+    Runs tasks concurrently in dependency order on a bounded thread pool.
+
+    A task is submitted as soon as all of its dependencies have finished,
+    whether they completed or failed; it is up to `execute` to decide whether
+    the available upstream results are sufficient.
+
+    Args:
+        dependencies (list): The dependency lists returned by resolve_dependencies.
+        execute (callable): Called as execute(index, results) in a worker thread,
+            where results maps the indices of completed tasks to their results.
+        on_complete (callable, optional): Called as on_complete(index, status, result)
+            in the calling thread whenever a task finishes. The status is either
+            'completed' or 'failed'; for failed tasks the result is the exception.
+        max_workers (int): The maximum number of tasks running at the same time.
+        finished (dict, optional): Maps the indices of tasks that already ran, e.g. in an
+            earlier round, to their results, or to the exception for failed tasks. They are
+            not run again, and their results are passed on to the tasks that depend on them.
+
+    Returns:
+        dict: Maps the index of every completed task, including those in finished, to its result.
+    """
+    _check_acyclic(dependencies)
+    pending, results = _initial_state(dependencies, finished)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Submit every task whose dependencies have all finished
+            for index in [i for i, deps in pending.items() if not deps]:
+                del pending[index]
+                # Run the task in a copy of the caller's context so it inherits the current trace span
+                future = executor.submit(contextvars.copy_context().run, execute, index, dict(results))
+                running[future] = index
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    result = future.result()
+                    results[index] = result
+                    status = 'completed'
+                except Exception as e:
+                    result = e
+                    status = 'failed'
+
+                if on_complete is not None:
+                    on_complete(index, status, result)
+
+                for deps in pending.values():
+                    deps.discard(index)
+
+    return results
+
+async def arun_task_graph(dependencies: list, execute, on_complete=None, max_concurrency: int = 4, finished: dict = None) -> dict:
+    """
+    Runs tasks concurrently in dependency order on the running event loop.
+
+    This is the asyncio counterpart of run_task_graph and follows the same
+    semantics, with a semaphore bounding the number of tasks in flight.
+
+    Args:
+        dependencies (list): The dependency lists returned by resolve_dependencies.
+        execute (callable): A coroutine function called as execute(index, results),
+            where results maps the indices of completed tasks to their results.
+        on_complete (callable, optional): Called as on_complete(index, status, result)
+            whenever a task finishes, and awaited if it returns an awaitable. The status
+            is either 'completed' or 'failed'; for failed tasks the result is the exception.
+        max_concurrency (int): The maximum number of tasks running at the same time.
+        finished (dict, optional): Maps the indices of tasks that already ran to their
+            results, or to the exception for failed tasks. They are not run again.
+
+    Returns:
+        dict: Maps the index of every completed task, including those in finished, to its result.
+    """
+    _check_acyclic(dependencies)
+    pending, results = _initial_state(dependencies, finished)
+    running = {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(index, snapshot):
+        async with semaphore:
+            return await execute(index, snapshot)
+
+    while pending or running:
+        # Schedule every task whose dependencies have all finished
+        for index in [i for i, deps in pending.items() if not deps]:
+            del pending[index]
+            running[asyncio.ensure_future(run(index, dict(results)))] = index
+
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            index = running.pop(future)
+            try:
+                result = future.result()
+                results[index] = result
+                status = 'completed'
+            except Exception as e:
+                result = e
+                status = 'failed'
+
+            if on_complete is not None:
+                outcome = on_complete(index, status, result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+            for deps in pending.values():
+                deps.discard(index)
+
+    return results
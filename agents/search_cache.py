@@ -0,0 +1,265 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+from agents.storage import configure_connection
+
+class SearchAbandoned(Exception):
+    """Raised to callers waiting on an in-flight search whose owner was cancelled."""
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so that trivially different queries share a cache entry.
+
+    Lowercases the query, collapses whitespace and strips surrounding quotes
+    and trailing punctuation.
+
+    Args:
+        query (str): The raw search query.
+
+    Returns:
+        str: The normalized query.
+    """
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip("\"'`").rstrip("?!.,;: ").strip()
+
+class SearchCache:
+    """
+    A two-tier cache for search results with in-flight request coalescing.
+
+    Results are kept in a bounded in-memory LRU tier backed by an on-disk
+    SQLite tier, both keyed by the normalized query and both honouring the
+    same time-to-live. Concurrent lookups for the same query while a search
+    is in flight wait for that search instead of issuing their own.
+    """
+
+    def __init__(self, db_path: str = 'search_cache.db', ttl: Optional[float] = 24 * 3600, max_memory_entries: int = 512):
+        """
+        Initializes the SearchCache instance.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            ttl (float, optional): The number of seconds after which a result expires.
+                None keeps results forever.
+            max_memory_entries (int): The maximum number of results kept in memory.
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._conn = configure_connection(sqlite3.connect(db_path, check_same_thread=False))
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS search_cache (
+                query TEXT PRIMARY KEY,
+                response TEXT,
+                created_at REAL
+            )
+        ''')
+        self._conn.commit()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, query: str) -> Optional[dict]:
+        """
+        Returns the cached result for a query, or None if there is no fresh entry.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            dict: The structured search result, or None.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            result = self._get_locked(key, now)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def _get_locked(self, key: str, now: float) -> Optional[dict]:
+        """Looks a normalized query up in the memory tier, then the disk tier."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, result = entry
+            if not self._expired(created_at, now):
+                self._memory.move_to_end(key)
+                return result
+            del self._memory[key]
+
+        row = self._conn.execute(
+            "SELECT response, created_at FROM search_cache WHERE query = ?", (key,)
+        ).fetchone()
+        if row is None or self._expired(row[1], now):
+            return None
+
+        # Promote the result to the memory tier
+        result = json.loads(row[0])
+        self._remember(key, row[1], result)
+        return result
+
+    def _remember(self, key: str, created_at: float, result: dict):
+        """Stores a result in the memory tier, evicting the least recently used entries."""
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, query: str, result: dict):
+        """
+        Stores the structured result for a query in both tiers.
+
+        Args:
+            query (str): The search query.
+            result (dict): The structured search result.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, result)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (query, response, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result), now)
+            )
+            self._conn.commit()
+
+    def _claim(self, query: str):
+        """
+        Returns (result, future, is_owner) for a query.
+
+        If a fresh result is cached it is returned directly. Otherwise the
+        caller either becomes the owner of a new in-flight search, or receives
+        the future of a search already in flight.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            result = self._get_locked(key, now)
+            if result is not None:
+                self.hits += 1
+                return result, None, False
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+
+            self.misses += 1
+            future = Future()
+            self._in_flight[key] = future
+            return None, future, True
+
+    def _settle(self, query: str, future: Future, result=None, error: BaseException = None):
+        """
+        Completes an owned in-flight search, releases waiting callers and caches its result.
+
+        The waiting callers are released before the result is written, so a
+        failed write cannot leave them waiting. If the owner was cancelled
+        rather than failed, they are told to search again themselves.
+        """
+        with self._lock:
+            self._in_flight.pop(normalize_query(query), None)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.set_exception(SearchAbandoned(f"The search for {query!r} was cancelled."))
+            return
+
+        if error is None:
+            try:
+                self.put(query, result)
+            except Exception as e:
+                print(f"Could not cache the search result: {e}")
+
+    def get_or_fetch(self, query: str, fetch) -> dict:
+        """
+        Returns the cached result for a query, fetching and caching it on a miss.
+
+        Args:
+            query (str): The search query.
+            fetch (callable): Called as fetch(query) to perform the actual search.
+
+        Returns:
+            dict: The structured search result.
+        """
+        result, future, is_owner = self._claim(query)
+        if future is None:
+            return result
+        if not is_owner:
+            try:
+                return future.result()
+            except SearchAbandoned:
+                return self.get_or_fetch(query, fetch)
+
+        try:
+            result = fetch(query)
+        except BaseException as e:
+            self._settle(query, future, error=e)
+            raise
+        self._settle(query, future, result)
+        return result
+
+    async def aget_or_fetch(self, query: str, afetch) -> dict:
+        """
+        Asynchronously returns the cached result for a query, fetching it on a miss.
+
+        Searches in flight are shared between sync and async callers.
+
+        Args:
+            query (str): The search query.
+            afetch (callable): A coroutine function called as afetch(query) to perform the search.
+
+        Returns:
+            dict: The structured search result.
+        """
+        result, future, is_owner = self._claim(query)
+        if future is None:
+            return result
+        if not is_owner:
+            try:
+                return await asyncio.wrap_future(future)
+            except SearchAbandoned:
+                return await self.aget_or_fetch(query, afetch)
+
+        try:
+            result = await afetch(query)
+        except BaseException as e:
+            self._settle(query, future, error=e)
+            raise
+        self._settle(query, future, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses and coalesced lookups, and the memory tier size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self):
+        """Closes the cache database."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,225 @@
+import contextlib
+import contextvars
+import re
+import threading
+import zlib
+from collections import deque, namedtuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from agents.context import estimate_tokens
+
+# One result of a web search
+SearchResult = namedtuple("SearchResult", ["url", "title", "content", "score"])
+
+# A piece of a result or report small enough to rank and pass on independently
+Chunk = namedtuple("Chunk", ["source", "title", "text", "score", "position"])
+
+# Target size of a chunk, in characters
+CHUNK_CHARS = 600
+
+# Results whose snippets share this fraction of their word shingles are duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+TRACKING_PARAM_RE = re.compile(r"^(utm_\w+|fbclid|gclid|ref|ref_src)$", re.IGNORECASE)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+WORD_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in is it its of on or that the this to was were will with
+    about into over than then these those what when which who why how
+""".split())
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL so that links to the same page compare equal.
+
+    Lowercases the scheme and host and drops the fragment, tracking
+    parameters, a leading "www." and a trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAM_RE.match(k)])
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), query, ""))
+
+def parse_search_response(response) -> list:
+    """
+    Parses a Tavily search response into SearchResult records.
+
+    Results without a URL or content are skipped.
+
+    Args:
+        response (dict): The response of TavilyClient.search.
+
+    Returns:
+        list: The SearchResult records.
+    """
+    if not isinstance(response, dict):
+        return []
+    results = []
+    for item in response.get("results") or []:
+        if not isinstance(item, dict) or not item.get("url") or not item.get("content"):
+            continue
+        try:
+            score = float(item.get("score") or 0.0)
+        except (TypeError, ValueError):
+            score = 0.0
+        results.append(SearchResult(item["url"], item.get("title") or item["url"], str(item["content"]), score))
+    return results
+
+def _terms(text: str) -> set:
+    return {word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS and len(word) > 2}
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    """Returns the hashed word n-grams of a text."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset([zlib.crc32(" ".join(words).encode("utf-8"))])
+    return frozenset(zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1))
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS) -> list:
+    """
+    Splits a text into chunks of about max_chars, at paragraph and then sentence boundaries.
+
+    Args:
+        text (str): The text to split.
+        max_chars (int): The target size of a chunk.
+
+    Returns:
+        list: The chunks, in order.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            # Hard-wrap sentences that are too long on their own
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+    chunks = []
+    current = ""
+    for piece in filter(None, pieces):
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def rank_chunks(chunks, query: str) -> list:
+    """
+    Orders chunks by relevance to a query.
+
+    A chunk's relevance is the share of the query's terms it contains plus
+    its own score, e.g. the search engine's score of the page it came from.
+    Ties keep the original order.
+    """
+    terms = _terms(query)
+
+    def relevance(chunk):
+        overlap = len(terms & _terms(chunk.text)) / len(terms) if terms else 0.0
+        return overlap + chunk.score
+
+    return sorted(chunks, key=relevance, reverse=True)
+
+def iter_chunks(chunks, query: str, max_tokens: int):
+    """
+    Yields the most relevant chunks, best first, until max_tokens is used up.
+
+    Args:
+        chunks (iterable): The candidate Chunks.
+        query (str): What the chunks are ranked against.
+        max_tokens (int): The approximate total size of the yielded chunks.
+
+    Yields:
+        Chunk: The chunks that fit in the budget.
+    """
+    remaining = max_tokens
+    for chunk in rank_chunks(chunks, query):
+        size = estimate_tokens(chunk.text)
+        if size > remaining:
+            continue
+        remaining -= size
+        yield chunk
+        if remaining <= 0:
+            break
+
+class SearchSession:
+    """
+    Remembers the results a research task has seen, to drop repeats across its queries.
+
+    A result is a repeat if its normalized URL was seen before, or if its
+    snippet is a near-duplicate of an earlier one, e.g. the same article
+    syndicated on another site. Only a bounded number of snippets is kept.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, max_snippets: int = 500):
+        """
+        Initializes the SearchSession instance.
+
+        Args:
+            threshold (float): The shingle similarity above which two snippets are duplicates.
+            max_snippets (int): The number of recent snippets compared against.
+        """
+        self.threshold = threshold
+        self._urls = set()
+        self._snippets = deque(maxlen=max_snippets)
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, text: str, source: str = None) -> bool:
+        """Checks a text against everything seen so far and remembers it if it is new."""
+        shingles = _shingles(text)
+        with self._lock:
+            url = normalize_url(source) if source else None
+            if url is not None and url in self._urls:
+                return True
+            if any(_similarity(shingles, seen) >= self.threshold for seen in self._snippets):
+                return True
+            if url is not None:
+                self._urls.add(url)
+            self._snippets.append(shingles)
+            return False
+
+    def filter(self, results: list) -> list:
+        """Returns the results that have not been seen before, and remembers them."""
+        return [result for result in results if not self.is_duplicate(result.content, result.url)]
+
+_current_session = contextvars.ContextVar("search_session", default=None)
+
+@contextlib.contextmanager
+def search_session(session: SearchSession = None):
+    """Makes the searches inside the block share a SearchSession, and yields it."""
+    session = session or SearchSession()
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+def current_search_session() -> SearchSession:
+    """Returns the SearchSession of the enclosing search_session block, or a new one."""
+    return _current_session.get() or SearchSession()
+
+def search_chunks(results: list, max_chars: int = CHUNK_CHARS):
+    """Yields the chunks of a list of SearchResults, lazily."""
+    for result in results:
+        for position, text in enumerate(chunk_text(result.content, max_chars)):
+            yield Chunk(result.url, result.title, text, result.score, position)
+
+def format_search_chunks(chunks) -> str:
+    """Formats search result chunks as a numbered list of sources for a prompt."""
+    sections = []
+    sources = {}
+    for chunk in chunks:
+        number = sources.setdefault(chunk.source, len(sources) + 1)
+        sections.append(f"[{number}] {chunk.title} ({chunk.source})\n{chunk.text}")
+    return "\n\n".join(sections)
@@ -0,0 +1,284 @@
+import hashlib
+import re
+import threading
+import numpy as np
+from agents.context import estimate_tokens, truncate_text
+
+try:
+    import hnswlib
+except ImportError:  # The ANN index is optional; exact search is used without it
+    hnswlib = None
+
+# Entries without an embedding from the given model, including those embedded by another model
+SELECT_UNINDEXED_SQL = """
+    SELECT m.id, m.project_id, COALESCE(m.summary, m.content)
+    FROM agent_memory m
+    LEFT JOIN memory_embeddings e ON e.memory_id = m.id AND e.model = ?
+    WHERE m.id > ? AND e.memory_id IS NULL
+    ORDER BY m.id
+    LIMIT ?
+"""
+
+INSERT_EMBEDDING_SQL = """
+    INSERT OR REPLACE INTO memory_embeddings (memory_id, project_id, vector, model, dim)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SELECT_EMBEDDINGS_SQL = """
+    SELECT memory_id, project_id, vector, dim
+    FROM memory_embeddings
+    WHERE memory_id > ? AND model = ?
+    ORDER BY memory_id
+"""
+
+SELECT_ENTRIES_SQL = """
+    SELECT id, timestamp, agent_name, action, COALESCE(summary, content)
+    FROM agent_memory
+    WHERE id IN ({placeholders})
+"""
+
+class HashingEmbedder:
+    """
+    A local embedder based on feature hashing of word unigrams and bigrams.
+
+    It needs no model or network access, which makes it a cheap fallback
+    when no Ollama embedding model is available.
+    """
+
+    def __init__(self, dim: int = 512):
+        """
+        Initializes the HashingEmbedder instance.
+
+        Args:
+            dim (int): The number of dimensions of the embeddings.
+        """
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        """Embeds a list of texts."""
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        """Embeds a single query."""
+        return self._embed(text)
+
+def get_ollama_embedder(model: str = "nomic-embed-text", host: str = "http://ollama:11434"):
+    """
+    Returns an embedder backed by an Ollama embedding model.
+
+    Args:
+        model (str): The name of the Ollama embedding model.
+        host (str): The URL of the Ollama server.
+
+    Returns:
+        OllamaEmbeddings: The embedder.
+    """
+    from langchain_community.embeddings import OllamaEmbeddings
+    return OllamaEmbeddings(model=model, base_url=host)
+
+class SemanticMemory:
+    """
+    A vector index over agent memory entries for relevance-based retrieval.
+
+    Entries are embedded in batches the first time they are needed, stored
+    as float32 blobs in the memory_embeddings table and kept in memory as a
+    normalized matrix for top-k search with NumPy. When hnswlib is installed
+    and the store grows beyond ann_threshold vectors, an approximate nearest
+    neighbour index is used instead of exact search.
+
+    Each vector is stored with the name of the model that produced it and
+    its dimension. Vectors from another model are ignored, and their entries
+    are embedded again, so the embedding model can be changed at any time.
+    """
+
+    def __init__(self, embedder=None, batch_size: int = 64, ann_threshold: int = 50000, min_score: float = 0.1, model: str = None):
+        """
+        Initializes the SemanticMemory instance.
+
+        Args:
+            embedder (optional): An object with embed_documents and embed_query methods,
+                such as OllamaEmbeddings. Defaults to a HashingEmbedder.
+            batch_size (int): The number of entries embedded per call.
+            ann_threshold (int): The store size above which the ANN index is used.
+            min_score (float): The minimum cosine similarity for an entry to be returned.
+            model (str, optional): The name the embeddings are stored under. Defaults to
+                the embedder's model attribute, or its class name.
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.model = model or getattr(self.embedder, "model", None) or type(self.embedder).__name__
+        self.batch_size = batch_size
+        self.ann_threshold = ann_threshold
+        self.min_score = min_score
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._projects = []
+        self._vectors = None
+        self._last_id = 0
+        self._scanned_id = 0
+        self._ann = None
+        self._ann_size = 0
+        self._lock = threading.Lock()
+
+    def index_pending(self, conn) -> int:
+        """
+        Embeds and stores every memory entry that has not been indexed yet.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+
+        Returns:
+            int: The number of newly embedded entries.
+        """
+        indexed = 0
+        with self._lock:
+            self._load(conn)
+            while True:
+                rows = conn.execute(SELECT_UNINDEXED_SQL, (self.model, self._scanned_id, self.batch_size)).fetchall()
+                if not rows:
+                    break
+                vectors = np.asarray(
+                    self.embedder.embed_documents([content or "" for _, _, content in rows]),
+                    dtype=np.float32,
+                )
+                with conn:
+                    conn.executemany(INSERT_EMBEDDING_SQL, [
+                        (memory_id, project_id, vector.tobytes(), self.model, len(vector))
+                        for (memory_id, project_id, _), vector in zip(rows, vectors)
+                    ])
+                self._append([row[0] for row in rows], [row[1] for row in rows], vectors)
+                self._scanned_id = rows[-1][0]
+                indexed += len(rows)
+        return indexed
+
+    def _load(self, conn):
+        """Loads this model's embeddings stored by other processes since the last load."""
+        rows = conn.execute(SELECT_EMBEDDINGS_SQL, (self._last_id, self.model)).fetchall()
+        if not rows:
+            return
+        # Vectors of another dimension cannot be compared, e.g. if the model was replaced under the same name
+        dim = self._vectors.shape[1] if self._vectors is not None else rows[-1][3]
+        rows = [row for row in rows if row[3] == dim]
+        if rows:
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, _, vector, _ in rows])
+            self._append([row[0] for row in rows], [row[1] for row in rows], vectors)
+
+    def _append(self, ids: list, projects: list, vectors: np.ndarray):
+        """Adds normalized vectors to the in-memory matrix."""
+        if self._vectors is not None and vectors.shape[1] != self._vectors.shape[1]:
+            # The model changed under the same name; its old vectors are dropped from the index
+            print(f"Embedding dimension of {self.model} changed from {self._vectors.shape[1]} to {vectors.shape[1]}.")
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._projects = []
+            self._vectors = None
+            self._ann = None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        self._vectors = vectors if self._vectors is None else np.vstack([self._vectors, vectors])
+        self._ids = np.concatenate([self._ids, np.asarray(ids, dtype=np.int64)])
+        self._projects.extend(projects)
+        self._last_id = max(self._last_id, int(self._ids[-1]))
+
+    def _ann_search(self, query: np.ndarray, k: int):
+        """Searches the ANN index, building or extending it as needed."""
+        size = len(self._ids)
+        if self._ann is None:
+            self._ann = hnswlib.Index(space="ip", dim=self._vectors.shape[1])
+            self._ann.init_index(max_elements=size * 2, ef_construction=200, M=16)
+            self._ann_size = 0
+        if size > self._ann.get_max_elements():
+            self._ann.resize_index(size * 2)
+        if size > self._ann_size:
+            self._ann.add_items(self._vectors[self._ann_size:size], np.arange(self._ann_size, size))
+            self._ann_size = size
+        self._ann.set_ef(max(k * 2, 50))
+        labels, distances = self._ann.knn_query(query, k=min(k, size))
+        return labels[0], 1.0 - distances[0]
+
+    def search(self, conn, query: str, k: int = 5, project_id: str = None, exclude_ids=()) -> list:
+        """
+        Returns the memory entries most similar to a query.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            query (str): The text to search for.
+            k (int): The maximum number of entries to return.
+            project_id (str, optional): Restricts the search to one project.
+            exclude_ids (iterable): Memory entry IDs to leave out of the results.
+
+        Returns:
+            list: (memory_id, score) tuples, most similar first.
+        """
+        self.index_pending(conn)
+        query_vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+        exclude_ids = set(exclude_ids)
+
+        with self._lock:
+            if self._vectors is None:
+                return []
+            candidates = k + len(exclude_ids)
+            if hnswlib is not None and project_id is None and len(self._ids) > self.ann_threshold:
+                positions, scores = self._ann_search(query_vector, candidates)
+            else:
+                scores = self._vectors @ query_vector
+                if project_id is not None:
+                    mask = np.fromiter((p == project_id for p in self._projects), dtype=bool, count=len(self._projects))
+                    scores = np.where(mask, scores, -np.inf)
+                candidates = min(candidates, len(scores))
+                positions = np.argpartition(-scores, candidates - 1)[:candidates]
+                positions = positions[np.argsort(-scores[positions])]
+                scores = scores[positions]
+
+            results = []
+            for position, score in zip(positions, scores):
+                memory_id = int(self._ids[position])
+                if score >= self.min_score and memory_id not in exclude_ids:
+                    results.append((memory_id, float(score)))
+            return results[:k]
+
+    def relevant_context(self, conn, query: str, token_budget: int, k: int = 5, project_id: str = None, exclude_ids=()) -> str:
+        """
+        Formats the memory entries most relevant to a query within a token budget.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            query (str): The text to search for.
+            token_budget (int): The maximum size of the formatted entries in tokens.
+            k (int): The maximum number of entries to include.
+            project_id (str, optional): Restricts the search to one project.
+            exclude_ids (iterable): Memory entry IDs to leave out, e.g. those already in the context.
+
+        Returns:
+            str: The formatted entries, or an empty string if none are relevant.
+        """
+        matches = self.search(conn, query, k, project_id, exclude_ids)
+        if not matches:
+            return ""
+
+        ids = [memory_id for memory_id, _ in matches]
+        rows = conn.execute(
+            SELECT_ENTRIES_SQL.format(placeholders=", ".join("?" * len(ids))), ids
+        ).fetchall()
+        rows_by_id = {row[0]: row for row in rows}
+
+        header = "Relevant Memory Entries (most relevant first):\n"
+        remaining = token_budget - estimate_tokens(header)
+        lines = []
+        for memory_id in ids:
+            if memory_id not in rows_by_id or remaining <= 0:
+                continue
+            _, timestamp, agent_name, action, content = rows_by_id[memory_id]
+            line = truncate_text(f"- [{timestamp}] {agent_name} {action}: {content}", remaining).rstrip("\n") + "\n"
+            lines.append(line)
+            remaining -= estimate_tokens(line)
+
+        return header + "".join(lines) if lines else ""
@@ -0,0 +1,285 @@
+import sqlite3
+import threading
+from agents.tracing import tracer
+
+DEFAULT_DB_PATH = 'research_agent.db'
+
+# Pragmas applied to every connection. WAL lets readers proceed while a writer
+# commits, and busy_timeout makes concurrent writers wait instead of failing
+# with "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+# Number of compiled statements each connection keeps. Statements are cached
+# by their SQL text, so callers should reuse the module-level SQL constants.
+CACHED_STATEMENTS = 256
+
+# Schema migrations, applied in order. The index of the last applied
+# migration is recorded in the database's user_version.
+MIGRATIONS = (
+    # 1: Initial schema
+    (
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            description TEXT,
+            status TEXT,
+            result TEXT,
+            agent TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS agent_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            agent_name TEXT,
+            action TEXT,
+            content TEXT
+        )
+        """,
+    ),
+    # 2: Project-scoped tasks and indexes for project-scoped retrieval
+    (
+        "ALTER TABLE tasks ADD COLUMN project_id TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_agent_memory_project ON agent_memory (project_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_project ON tasks (project_id, agent, status)",
+    ),
+    # 3: Write-time summaries of large memory entries
+    (
+        "ALTER TABLE agent_memory ADD COLUMN summary TEXT",
+    ),
+    # 4: Embeddings for semantic memory retrieval
+    (
+        """
+        CREATE TABLE IF NOT EXISTS memory_embeddings (
+            memory_id INTEGER PRIMARY KEY,
+            project_id TEXT,
+            vector BLOB
+        )
+        """,
+    ),
+    # 5: Durable job queue for background workers
+    (
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            project_id TEXT UNIQUE,
+            query TEXT,
+            status TEXT,
+            worker TEXT,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at REAL,
+            started_at REAL,
+            heartbeat_at REAL,
+            finished_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)",
+    ),
+    # 6: Checkpoints for resuming projects: each task's position and definition
+    # in the plan, and the orchestrator's state
+    (
+        "ALTER TABLE tasks ADD COLUMN task_index INTEGER",
+        "ALTER TABLE tasks ADD COLUMN spec TEXT",
+        """
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            project_id TEXT PRIMARY KEY,
+            state TEXT,
+            updated_at REAL
+        )
+        """,
+    ),
+    # 7: Compressed, deduplicated store for large task results and memory
+    # entries; their rows keep a preview and the blob's hash
+    (
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER,
+            data BLOB
+        )
+        """,
+        "ALTER TABLE tasks ADD COLUMN result_blob TEXT",
+        "ALTER TABLE agent_memory ADD COLUMN content_blob TEXT",
+    ),
+    # 8: The model and dimension of each embedding, so vectors from different
+    # embedding models are never compared
+    (
+        "ALTER TABLE memory_embeddings ADD COLUMN model TEXT",
+        "ALTER TABLE memory_embeddings ADD COLUMN dim INTEGER",
+    ),
+    # 9: Live progress of running tasks, written by workers and read by the UI
+    (
+        """
+        CREATE TABLE IF NOT EXISTS task_events (
+            id INTEGER PRIMARY KEY,
+            project_id TEXT,
+            task_index INTEGER,
+            kind TEXT,
+            text TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_task_events_project ON task_events (project_id, id)",
+    ),
+)
+
+_local = threading.local()
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """
+    Applies the storage pragmas to a connection.
+
+    Args:
+        conn (sqlite3.Connection): The connection to configure.
+
+    Returns:
+        sqlite3.Connection: The same connection.
+    """
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Applies every pending schema migration to a database.
+
+    Each migration runs in its own transaction, so a failed migration leaves
+    the database at the previous schema version.
+
+    Args:
+        conn (sqlite3.Connection): The database connection.
+
+    Returns:
+        int: The schema version of the database after migrating.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        version = number
+    return version
+
+def get_connection(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """
+    Returns the calling thread's long-lived connection to a database.
+
+    The connection is opened and configured on first use and then reused by
+    every later call from the same thread.
+
+    Args:
+        db_path (str): The path to the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    connections = _local.__dict__.setdefault('connections', {})
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = configure_connection(sqlite3.connect(db_path, cached_statements=CACHED_STATEMENTS))
+        connections[db_path] = conn
+    return conn
+
+def close_connection(db_path: str = DEFAULT_DB_PATH):
+    """
+    Closes the calling thread's connection to a database, if it has one.
+
+    Args:
+        db_path (str): The path to the SQLite database file.
+    """
+    connections = _local.__dict__.get('connections', {})
+    conn = connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
+
+class WriteBuffer:
+    """
+    A write-behind buffer that batches SQL writes into single transactions.
+
+    Statements are queued by add() and written together by flush(), which is
+    also triggered automatically once max_pending statements are queued.
+    The buffer is thread-safe; a flush uses the calling thread's connection.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_pending: int = 64):
+        """
+        Initializes the WriteBuffer instance.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            max_pending (int): The number of queued statements that triggers a flush.
+        """
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.flushes = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, sql: str, params: tuple):
+        """
+        Queues a write statement.
+
+        Args:
+            sql (str): The SQL statement.
+            params (tuple): The statement parameters.
+        """
+        self.add_many([(sql, params)])
+
+    def add_many(self, statements: list):
+        """
+        Queues write statements that must be written in the same transaction.
+
+        A flush triggered by a full buffer only happens once all of them are queued.
+
+        Args:
+            statements (list): (sql, params) tuples, in order.
+        """
+        with self._lock:
+            self._pending.extend(statements)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every queued statement in a single transaction.
+
+        Raises:
+            sqlite3.Error: If the transaction fails. The statements stay queued,
+                so the next flush writes them.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            conn = get_connection(self.db_path)
+            try:
+                with tracer.span("db.flush", statements=len(pending)), conn:
+                    # Group consecutive runs of the same statement into executemany calls
+                    start = 0
+                    for end in range(1, len(pending) + 1):
+                        if end == len(pending) or pending[end][0] != pending[start][0]:
+                            conn.executemany(pending[start][0], [params for _, params in pending[start:end]])
+                            start = end
+            except sqlite3.Error:
+                # The transaction was rolled back, so put the statements back in order
+                self._pending[:0] = pending
+                raise
+            self.flushes += 1
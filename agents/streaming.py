@@ -0,0 +1,135 @@
+import queue
+from collections import namedtuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+# An update about a running task. `kind` is one of:
+# - "status": the task changed state; `text` is "running", "completed" or "failed"
+# - "token": the agent's LLM produced more output; `text` is the new chunk
+# - "step": the agent took an intermediate step, e.g. a ReAct action or observation
+# - "result": the task finished; `text` is its final result
+TaskEvent = namedtuple("TaskEvent", ["task_index", "kind", "text"])
+
+class TaskEventEmitter:
+    """
+    Pushes the events of one task into a queue that the UI consumes.
+
+    Without a queue every method is a no-op, so agents can emit events
+    unconditionally.
+    """
+
+    def __init__(self, event_queue: queue.Queue = None, task_index: int = None):
+        """
+        Initializes the TaskEventEmitter instance.
+
+        Args:
+            event_queue (queue.Queue, optional): The queue to push TaskEvents into.
+            task_index (int, optional): The index of the task in the plan.
+        """
+        self.event_queue = event_queue
+        self.task_index = task_index
+
+    @property
+    def enabled(self) -> bool:
+        """Whether events are delivered anywhere."""
+        return self.event_queue is not None
+
+    def emit(self, kind: str, text: str):
+        """Pushes an event of the given kind for this task."""
+        if self.event_queue is not None:
+            self.event_queue.put(TaskEvent(self.task_index, kind, text))
+
+    def status(self, status: str):
+        """Reports that the task changed state."""
+        self.emit("status", status)
+
+    def token(self, text: str):
+        """Reports a new chunk of LLM output."""
+        self.emit("token", text)
+
+    def step(self, text: str):
+        """Reports an intermediate step of the agent."""
+        self.emit("step", text)
+
+    def result(self, text: str):
+        """Reports the final result of the task."""
+        self.emit("result", text)
+
+class TokenCallbackHandler(BaseCallbackHandler):
+    """A LangChain callback handler that forwards new LLM tokens to a function."""
+
+    def __init__(self, on_token):
+        """
+        Initializes the TokenCallbackHandler instance.
+
+        Args:
+            on_token (callable): Called with each new token.
+        """
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        """Forwards a new token."""
+        self.on_token(token)
+
+def stream_chain(chain, inputs: dict, on_token=None) -> str:
+    """
+    Invokes a chain, streaming its output to on_token as it is generated.
+
+    Args:
+        chain (Runnable): The chain to run; its output chunks must be strings.
+        inputs (dict): The chain inputs.
+        on_token (callable, optional): Called with each output chunk.
+            Without it, the chain is invoked normally.
+
+    Returns:
+        str: The complete output.
+    """
+    if on_token is None:
+        return chain.invoke(inputs)
+
+    chunks = []
+    for chunk in chain.stream(inputs):
+        on_token(chunk)
+        chunks.append(chunk)
+    return "".join(chunks)
+
+async def astream_chain(chain, inputs: dict, on_token=None) -> str:
+    """
+    Asynchronously invokes a chain, streaming its output to on_token as it is generated.
+
+    Args:
+        chain (Runnable): The chain to run; its output chunks must be strings.
+        inputs (dict): The chain inputs.
+        on_token (callable, optional): Called with each output chunk.
+            Without it, the chain is invoked normally.
+
+    Returns:
+        str: The complete output.
+    """
+    if on_token is None:
+        return await chain.ainvoke(inputs)
+
+    chunks = []
+    async for chunk in chain.astream(inputs):
+        on_token(chunk)
+        chunks.append(chunk)
+    return "".join(chunks)
+
+def drain_events(event_queue: queue.Queue, timeout: float = None) -> list:
+    """
+    Takes every event currently in a queue, waiting up to timeout for the first one.
+
+    Args:
+        event_queue (queue.Queue): The queue of TaskEvents.
+        timeout (float, optional): The number of seconds to wait for an event.
+
+    Returns:
+        list: The TaskEvents, oldest first. Empty if none arrived in time.
+    """
+    events = []
+    try:
+        events.append(event_queue.get(timeout=timeout))
+        while True:
+            events.append(event_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return events
@@ -0,0 +1,234 @@
+import json
+import re
+from langchain_core.utils.json import parse_partial_json
+from agents.tracing import tracer
+
+# The agents a task may be assigned to
+AGENTS = ('Researcher', 'Writer', 'Critic', 'Programmer')
+
+FENCE_RE = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+JSON_START_RE = re.compile(r"[{\[]")
+
+RETRY_TEMPLATE = """{prompt}
+
+Your previous response could not be used: {error}
+
+Your previous response was:
+{response}
+
+Respond again with only the corrected JSON object, without any other text."""
+
+class StructuredOutputError(ValueError):
+    """Raised when a model response cannot be turned into the expected structure."""
+
+def _json_candidates(text: str) -> list:
+    """Returns the pieces of a response that may hold the JSON value, most likely first."""
+    candidates = [match.group(1) for match in FENCE_RE.finditer(text)]
+    # Prose before the value may contain brackets too, e.g. a citation like [1],
+    # so the value may start at any of them
+    candidates.extend(text[match.start():] for match in JSON_START_RE.finditer(text))
+    return [candidate.strip() for candidate in candidates if candidate.strip()]
+
+def holds_tasks(value) -> bool:
+    """Returns whether a parsed value has the shape of a task list: an object with "tasks" or a list of objects."""
+    if isinstance(value, dict):
+        return 'tasks' in value
+    # An empty list is more likely a task's "tools" or "depends_on" than the output
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+def repair_json(text: str, accept=None):
+    """
+    Parses the JSON value in a model response, repairing common mistakes locally.
+
+    The value may be wrapped in a Markdown code fence or surrounded by prose,
+    contain trailing commas, or be cut off mid-way, in which case the complete
+    part of it is recovered.
+
+    Args:
+        text (str): The model response.
+        accept (callable, optional): Called with each decoded value; values it
+            rejects are skipped, e.g. a bracketed citation in prose before the value.
+
+    Returns:
+        tuple: The parsed value and whether it had to be recovered from truncated output.
+
+    Raises:
+        StructuredOutputError: If no JSON value could be recovered.
+    """
+    decoder = json.JSONDecoder(strict=False)
+    candidates = _json_candidates(text)
+    for candidate in candidates:
+        for attempt in (candidate, TRAILING_COMMA_RE.sub(r"\1", candidate)):
+            try:
+                value = decoder.raw_decode(attempt)[0]
+            except ValueError:
+                continue
+            if accept is None or accept(value):
+                return value, False
+
+    # Close the strings and brackets of output that was cut off
+    for candidate in candidates:
+        value = parse_partial_json(TRAILING_COMMA_RE.sub(r"\1", candidate))
+        if value is not None and (accept is None or accept(value)):
+            return value, True
+
+    raise StructuredOutputError("The response does not contain a JSON object.")
+
+def _normalize_task(task, index: int) -> dict:
+    """Checks one task against the task schema and returns it in canonical form."""
+    if not isinstance(task, dict):
+        raise StructuredOutputError(f"Task {index + 1} is not a JSON object.")
+
+    agent = task.get('agent')
+    agents = {name.lower(): name for name in AGENTS}
+    if not isinstance(agent, str) or agent.strip().lower() not in agents:
+        raise StructuredOutputError(f"Task {index + 1} has agent {agent!r}; it must be one of {', '.join(AGENTS)}.")
+
+    description = task.get('description')
+    if not isinstance(description, str) or not description.strip():
+        raise StructuredOutputError(f"Task {index + 1} has no description.")
+
+    tools = task.get('tools') or []
+    if isinstance(tools, str):
+        tools = [tools]
+
+    normalized = dict(task, agent=agents[agent.strip().lower()], description=description.strip(), tools=list(tools))
+    if 'id' in task:
+        normalized['id'] = str(task['id'])
+    # Keep a missing depends_on missing, so the scheduler infers the edges
+    depends_on = task.get('depends_on')
+    if depends_on is None:
+        normalized.pop('depends_on', None)
+    else:
+        depends_on = [depends_on] if isinstance(depends_on, (str, int)) else list(depends_on)
+        # Refer to tasks the same way as their ids, so references and ids always match
+        normalized['depends_on'] = [str(ref) for ref in depends_on]
+    return normalized
+
+def validate_tasks(value, truncated: bool = False, allow_empty: bool = True, skip_invalid: bool = False) -> list:
+    """
+    Checks parsed model output against the task schema.
+
+    The output is a JSON object with a "tasks" list (a bare list is accepted
+    too). Each task needs an "agent" from AGENTS and a "description", and may
+    have "id", "tools" and "depends_on". If the output was truncated, an
+    incomplete last task is dropped rather than rejected.
+
+    Args:
+        value: The parsed output.
+        truncated (bool): Whether the output was recovered from truncated text.
+        allow_empty (bool): Whether an empty task list is valid.
+        skip_invalid (bool): Drop tasks that do not match the schema instead of rejecting the output.
+
+    Returns:
+        list: The tasks in canonical form.
+
+    Raises:
+        StructuredOutputError: If the output does not match the schema.
+    """
+    tasks = value.get('tasks') if isinstance(value, dict) else value
+    if not isinstance(tasks, list):
+        raise StructuredOutputError('The response must be a JSON object with a "tasks" list.')
+
+    if truncated and tasks:
+        try:
+            _normalize_task(tasks[-1], len(tasks) - 1)
+        except StructuredOutputError:
+            tasks = tasks[:-1]
+
+    normalized = []
+    for index, task in enumerate(tasks):
+        try:
+            normalized.append(_normalize_task(task, index))
+        except StructuredOutputError:
+            if not skip_invalid:
+                raise
+    if not normalized and not allow_empty:
+        raise StructuredOutputError('The "tasks" list is empty.')
+    return normalized
+
+def json_mode(llm):
+    """Returns the LLM constrained to emit JSON, if it supports that (Ollama's format=json)."""
+    if hasattr(llm, "format"):
+        return llm.bind(format="json")
+    return llm
+
+class StructuredOutputChain:
+    """
+    Runs a prompt and parses the response into a structure, re-prompting on failure.
+
+    Malformed output is first repaired locally. Only if that fails is the
+    model asked again, with the parse error and its previous response, up to
+    max_retries times.
+    """
+
+    def __init__(self, prompt, llm, parse, max_retries: int = 2, name: str = "structured"):
+        """
+        Initializes the StructuredOutputChain instance.
+
+        Args:
+            prompt (PromptTemplate): The prompt template.
+            llm: The language model instance.
+            parse (callable): Turns a response into the structure, raising StructuredOutputError.
+            max_retries (int): The maximum number of times to re-prompt after a failed parse.
+            name (str): The name used in the metrics.
+        """
+        self.prompt = prompt
+        self.llm = json_mode(llm)
+        self.parse = parse
+        self.max_retries = max_retries
+        self.name = name
+
+    def _retry_prompt(self, prompt_text: str, response: str, error: Exception) -> str:
+        return RETRY_TEMPLATE.format(prompt=prompt_text, error=error, response=response[-4000:])
+
+    def _failed(self, attempt: int, error: Exception):
+        tracer.metrics.inc("structured_output_failures_total", chain=self.name)
+        if attempt == self.max_retries:
+            raise StructuredOutputError(f"Could not parse the {self.name} output after {attempt + 1} attempts: {error}") from error
+        tracer.metrics.inc("structured_output_retries_total", chain=self.name)
+
+    def invoke(self, inputs: dict):
+        """
+        Generates and parses a response for the inputs.
+
+        Raises:
+            StructuredOutputError: If no response could be parsed within the retries.
+        """
+        prompt_text = self.prompt.format(**inputs)
+        request = prompt_text
+        for attempt in range(self.max_retries + 1):
+            response = self.llm.invoke(request)
+            try:
+                return self.parse(response)
+            except StructuredOutputError as e:
+                self._failed(attempt, e)
+                request = self._retry_prompt(prompt_text, response, e)
+
+    async def ainvoke(self, inputs: dict):
+        """
+        Asynchronously generates and parses a response for the inputs.
+
+        Raises:
+            StructuredOutputError: If no response could be parsed within the retries.
+        """
+        prompt_text = self.prompt.format(**inputs)
+        request = prompt_text
+        for attempt in range(self.max_retries + 1):
+            response = await self.llm.ainvoke(request)
+            try:
+                return self.parse(response)
+            except StructuredOutputError as e:
+                self._failed(attempt, e)
+                request = self._retry_prompt(prompt_text, response, e)
+
+def parse_plan(text: str) -> dict:
+    """Parses a manager response into {"tasks": [...]}, requiring at least one task."""
+    value, truncated = repair_json(text, accept=holds_tasks)
+    return {"tasks": validate_tasks(value, truncated, allow_empty=False)}
+
+def parse_feedback(text: str) -> dict:
+    """Parses a critic response into {"tasks": [...]}, dropping proposals that do not match the schema."""
+    value, truncated = repair_json(text, accept=holds_tasks)
+    return {"tasks": validate_tasks(value, truncated, skip_invalid=True)}
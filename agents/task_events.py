@@ -0,0 +1,89 @@
+import threading
+import time
+from agents.storage import DEFAULT_DB_PATH, get_connection
+
+# Only the live progress of a task is logged; its status and result are in its row
+LOGGED_KINDS = ("token", "step")
+
+INSERT_EVENT_SQL = "INSERT INTO task_events (project_id, task_index, kind, text) VALUES (?, ?, ?, ?)"
+
+SELECT_EVENTS_SQL = """
+    SELECT id, task_index, kind, text FROM task_events
+    WHERE project_id = ? AND id > ?
+    ORDER BY id
+"""
+
+class TaskEventLog:
+    """
+    Persists the live progress of a project's tasks, so another process can show it.
+
+    It accepts TaskEvents through put, like the event queue of
+    orchestrate_agents. Consecutive tokens of a task are merged, and events
+    are written at most every flush_interval seconds, so streaming does not
+    cost a write per token.
+    """
+
+    def __init__(self, project_id: str, db_path: str = DEFAULT_DB_PATH, flush_interval: float = 0.5):
+        """
+        Initializes the TaskEventLog instance.
+
+        Args:
+            project_id (str): The ID of the project whose events are logged.
+            db_path (str): The path to the SQLite database file.
+            flush_interval (float): The number of seconds between writes.
+        """
+        self.project_id = project_id
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        """Queues a TaskEvent, writing the queued events if the flush interval has passed."""
+        if event.kind not in LOGGED_KINDS:
+            # A status change or result ends a burst of output, so write what is left of it
+            self.flush()
+            return
+        with self._lock:
+            last = self._pending[-1] if self._pending else None
+            if event.kind == "token" and last is not None and last[0] == event.task_index and last[1] == "token":
+                last[2] += event.text
+            else:
+                self._pending.append([event.task_index, event.kind, event.text])
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes the queued events."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.executemany(INSERT_EVENT_SQL, [(self.project_id, *event) for event in pending])
+
+    def clear(self):
+        """Drops the queued and logged events of the project, e.g. once it has finished."""
+        with self._lock:
+            self._pending = []
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute("DELETE FROM task_events WHERE project_id = ?", (self.project_id,))
+
+def load_task_events(db_conn, project_id: str, after_id: int = 0) -> list:
+    """
+    Returns the logged events of a project.
+
+    Args:
+        db_conn (sqlite3.Connection): The database connection.
+        project_id (str): The project ID.
+        after_id (int): Only events logged after the one with this ID are returned.
+
+    Returns:
+        list: (id, task_index, kind, text) tuples, oldest first.
+    """
+    return db_conn.execute(SELECT_EVENTS_SQL, (project_id, after_id)).fetchall()
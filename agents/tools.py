@@ -1,53 +1,140 @@
+import asyncio
+import queue
+from typing import Optional
 from langchain_core.tools import BaseTool
-from tavily import TavilyClient
+from tavily import TavilyClient, AsyncTavilyClient
 from ai_code_sandbox import AICodeSandbox
+from agents.sandbox_pool import SandboxPool
+from agents.search_cache import SearchCache
+from agents.search_results import current_search_session, format_search_chunks, iter_chunks, parse_search_response, search_chunks
+from agents.context import SEARCH_OBSERVATION_TOKENS
+from agents.code_execution import ExecutionCache
+from agents.tracing import tracer
 
 class TavilySearchTool(BaseTool):
     """
     A tool for performing searches using the Tavily API.
+
+    The agent is shown the most relevant chunks of the new results, bounded by
+    max_observation_tokens, rather than the raw response. Results already seen
+    in the enclosing search_session, by URL or near-identical snippet, are left out.
     """
     name: str = "TavilySearch"
     description: str = "A tool to search the internet for information. The input should be a search query."
     tavily_client: TavilyClient
+    async_tavily_client: Optional[AsyncTavilyClient] = None
+    search_cache: Optional[SearchCache] = None
+    max_observation_tokens: int = SEARCH_OBSERVATION_TOKENS
+
+    def _observation(self, query: str, response) -> str:
+        """Turns a search response into the ranked, size-bounded text the agent sees."""
+        results = current_search_session().filter(parse_search_response(response))
+        if not results:
+            return "No new results: everything this search found has been seen already. Try a different query."
+        return format_search_chunks(iter_chunks(search_chunks(results), query, self.max_observation_tokens))
 
     def _run(self, query: str) -> str:
         """
         Performs a search using the Tavily API.
+
+        When a search cache is configured, repeated and concurrent identical
+        queries are answered from the cache instead of calling the API.
         """
-        result = self.tavily_client.search(query)
-        return str(result)
+        def search(query):
+            with tracer.span("tavily.search", query=query):
+                return self.tavily_client.search(query)
+
+        if self.search_cache is not None:
+            result = self.search_cache.get_or_fetch(query, search)
+        else:
+            result = search(query)
+        return self._observation(query, result)
 
     async def _arun(self, query: str) -> str:
         """
         Performs an asynchronous search using the Tavily API.
+
+        Uses the native async client when one is configured, and otherwise
+        offloads the blocking client to a worker thread.
         """
-        result = await self.tavily_client.search(query)
-        return str(result)
+        async def search(query):
+            with tracer.span("tavily.search", query=query):
+                if self.async_tavily_client is not None:
+                    return await self.async_tavily_client.search(query)
+                return await asyncio.to_thread(self.tavily_client.search, query)
+
+        if self.search_cache is not None:
+            result = await self.search_cache.aget_or_fetch(query, search)
+        else:
+            result = await search(query)
+        return self._observation(query, result)
 
 class SandboxExecutor(BaseTool):
     """
     A tool for executing Python code in a sandboxed environment.
+
+    Code runs either in a single dedicated sandbox or in a sandbox checked out
+    of a SandboxPool. With a pool, an executor bound to a session through
+    for_session runs all of its code in that session's sandbox. A run that
+    waits longer than checkout_timeout for a free sandbox fails. The optional
+    execution cache is used by the Programmer to skip repeated runs.
     """
     name: str = "SandboxExecutor"
     description: str = "A tool to execute Python code in a sandboxed environment. The input should be a string of Python code."
-    sandbox: AICodeSandbox
+    sandbox: Optional[AICodeSandbox] = None
+    pool: Optional[SandboxPool] = None
+    session_id: Optional[str] = None
+    execution_cache: Optional[ExecutionCache] = None
+    checkout_timeout: Optional[float] = 300.0
+
+    def for_session(self, session_id: str) -> "SandboxExecutor":
+        """
+        Returns an executor whose runs share the pool's sandbox for a session.
+
+        Args:
+            session_id (str): The session ID, e.g. the project ID.
+
+        Returns:
+            SandboxExecutor: The session-bound executor, or this executor if it has no pool.
+        """
+        if self.pool is None:
+            return self
+        return self.model_copy(update={"session_id": session_id})
+
+    def end_session(self):
+        """Returns the session's sandbox to the pool."""
+        if self.pool is not None and self.session_id is not None:
+            self.pool.end_session(self.session_id)
 
     def _run(self, code: str) -> str:
         """
         Executes Python code in a sandboxed environment.
+
+        Raises:
+            TimeoutError: If no sandbox of the pool became free within checkout_timeout.
         """
-        try:
-            result = self.sandbox.run(code)
-            return str(result)
-        except Exception as e:
-            return f"An error occurred: {e}"
+        with tracer.span("sandbox.run", session_id=self.session_id, code_chars=len(code)) as span:
+            try:
+                if self.pool is None:
+                    result = self.sandbox.run_code(code)
+                elif self.session_id is not None:
+                    with self.pool.session(self.session_id, self.checkout_timeout) as sandbox:
+                        result = sandbox.run_code(code)
+                else:
+                    with self.pool.sandbox(self.checkout_timeout) as sandbox:
+                        result = sandbox.run_code(code)
+                return str(result)
+            except queue.Empty:
+                span.set(error="checkout timeout")
+                raise TimeoutError(f"No sandbox became free within {self.checkout_timeout} seconds.")
+            except Exception as e:
+                span.set(error=str(e))
+                return f"An error occurred: {e}"
 
-    def _arun(self, code: str) -> str:
+    async def _arun(self, code: str) -> str:
         """
-        Executes Python code in a sandboxed environment.
+        Asynchronously executes Python code in a sandboxed environment.
+
+        The sandbox client is blocking, so the run is offloaded to a worker thread.
         """
-        try:
-            result = self.sandbox.run(code)
-            return str(result)
-        except Exception as e:
-            return f"An error occurred: {e}"
+        return await asyncio.to_thread(self._run, code)
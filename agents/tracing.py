@@ -0,0 +1,358 @@
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TRACE_PATH = 'traces.jsonl'
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# The span that new spans in the current thread or task are nested under
+_current_span = ContextVar("current_span", default=None)
+
+# The trace that root spans in the current thread or task belong to
+_current_trace_id = ContextVar("current_trace_id", default=None)
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Spans form a tree through their parent IDs. Every span of a research
+    project carries the project ID as its trace ID.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, parent: "Span" = None, trace_id: str = None, attributes: dict = None):
+        """
+        Initializes and starts the Span.
+
+        Args:
+            tracer (Tracer): The tracer that records the span when it ends.
+            name (str): The operation, e.g. "task" or "llm".
+            parent (Span, optional): The enclosing span.
+            trace_id (str, optional): The trace ID. Defaults to the parent's, or to the current trace.
+            attributes (dict, optional): Details of the operation.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = trace_id or (parent.trace_id if parent is not None else _current_trace_id.get())
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        """Adds or updates attributes of the span."""
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        """Returns the number of seconds since the span started."""
+        return time.perf_counter() - self._start
+
+    def end(self, error: BaseException = None):
+        """
+        Ends the span and records it. Ending a span twice has no effect.
+
+        Args:
+            error (BaseException, optional): The exception the operation failed with.
+        """
+        if self.duration is not None:
+            return
+        self.duration = self.elapsed()
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.record(self)
+
+    def to_dict(self) -> dict:
+        """Returns the span as a JSON-serializable dictionary."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and histograms, exportable in the Prometheus text format.
+
+    Every metric is identified by its name and a set of labels.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+        Initializes the MetricsRegistry instance.
+
+        Args:
+            buckets (tuple): The upper bounds of the histogram buckets.
+        """
+        self.buckets = buckets
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increments a counter."""
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Sets a gauge to a value."""
+        with self._lock:
+            self._gauges[name, tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Records a value in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current value of every metric.
+
+        Returns:
+            dict: Lists of {"name", "labels", ...} entries under "counters", "gauges" and "histograms".
+        """
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._gauges.items()],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "buckets": dict(zip(self.buckets, h["buckets"])), "sum": h["sum"], "count": h["count"]}
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def render_prometheus(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        def label_str(labels, **extra):
+            items = list(labels) + list(extra.items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{key}="{str(value)}"' for key, value in items) + "}"
+
+        lines = []
+        typed = set()
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{label_str(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, count in zip(self.buckets, h["buckets"]):
+                    lines.append(f"{name}_bucket{label_str(labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{label_str(labels, le='+Inf')} {h['count']}")
+                lines.append(f"{name}_sum{label_str(labels)} {h['sum']}")
+                lines.append(f"{name}_count{label_str(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+class Tracer:
+    """
+    Records spans and their metrics, and optionally exports them to a JSONL file.
+
+    The most recent spans are also kept in memory so the UI can show the
+    trace of a project without reading the file back.
+    """
+
+    def __init__(self, trace_path: str = None, metrics: MetricsRegistry = None, max_spans: int = 10000):
+        """
+        Initializes the Tracer instance.
+
+        Args:
+            trace_path (str, optional): The JSONL file to append finished spans to.
+            metrics (MetricsRegistry, optional): The registry to record span metrics in.
+            max_spans (int): The maximum number of spans kept in memory.
+        """
+        self.trace_path = trace_path
+        self.metrics = metrics or MetricsRegistry()
+        self._spans = deque(maxlen=max_spans)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export_to(self, trace_path: str):
+        """Starts appending finished spans to the given JSONL file."""
+        with self._lock:
+            if trace_path == self.trace_path:
+                return
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.trace_path = trace_path
+
+    @contextmanager
+    def trace(self, trace_id: str):
+        """
+        Assigns the spans started in the enclosed block to a trace, e.g. a research project.
+
+        Args:
+            trace_id (str): The trace ID.
+        """
+        token = _current_trace_id.set(trace_id)
+        try:
+            yield
+        finally:
+            _current_trace_id.reset(token)
+
+    def start_span(self, name: str, trace_id: str = None, **attributes) -> Span:
+        """
+        Starts a span under the current span without making it current.
+
+        The caller must end the span. Use span() to nest operations under it.
+        """
+        return Span(self, name, _current_span.get(), trace_id, attributes)
+
+    @contextmanager
+    def span(self, name: str, trace_id: str = None, **attributes):
+        """
+        Times the enclosed block as a span nested under the current span.
+
+        Args:
+            name (str): The operation, e.g. "task" or "llm".
+            trace_id (str, optional): The trace ID, e.g. the project ID. Defaults to the parent's.
+            **attributes: Details of the operation.
+
+        Yields:
+            Span: The span, which the block can add attributes to.
+        """
+        span = self.start_span(name, trace_id, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record(self, span: Span):
+        """Records the metrics of a finished span and exports it."""
+        self.metrics.inc("agent_spans_total", span=span.name, status=span.status)
+        self.metrics.observe("agent_span_duration_seconds", span.duration, span=span.name)
+        with self._lock:
+            self._spans.append(span)
+            if self.trace_path is None:
+                return
+            if self._file is None:
+                # Line buffering writes each span in one append, so several
+                # worker processes can share a trace file
+                self._file = open(self.trace_path, "a", buffering=1, encoding="utf-8")
+            self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def spans(self, trace_id: str = None) -> list:
+        """
+        Returns the finished spans kept in memory, oldest first.
+
+        Args:
+            trace_id (str, optional): Only return the spans of this trace.
+
+        Returns:
+            list: The spans as dictionaries.
+        """
+        with self._lock:
+            spans = list(self._spans)
+        return [span.to_dict() for span in spans if trace_id is None or span.trace_id == trace_id]
+
+    def close(self):
+        """Flushes and closes the trace file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+# The process-wide tracer that the agents report to
+tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer."""
+    return tracer
+
+def load_trace(trace_path: str = DEFAULT_TRACE_PATH, trace_id: str = None) -> list:
+    """
+    Reads spans back from a JSONL trace file.
+
+    Args:
+        trace_path (str): The trace file.
+        trace_id (str, optional): Only return the spans of this trace.
+
+    Returns:
+        list: The spans as dictionaries, in the order they finished.
+    """
+    spans = []
+    with open(trace_path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if trace_id is None or span["trace_id"] == trace_id:
+                spans.append(span)
+    return spans
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of the process-wide tracer at /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_metrics_servers = {}
+_metrics_servers_lock = threading.Lock()
+
+def start_metrics_server(port: int, metrics: MetricsRegistry = None) -> ThreadingHTTPServer:
+    """
+    Serves the metrics at http://0.0.0.0:<port>/metrics from a background thread.
+
+    Starting a server on a port that is already being served returns the
+    existing server, so it is safe to call on every Streamlit rerun.
+
+    Args:
+        port (int): The port to listen on.
+        metrics (MetricsRegistry, optional): The registry to serve. Defaults to the process-wide tracer's.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    with _metrics_servers_lock:
+        server = _metrics_servers.get(port)
+        if server is None:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+            server.metrics = metrics or tracer.metrics
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _metrics_servers[port] = server
+        return server
@@ -1,44 +1,234 @@
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from agents.streaming import stream_chain, astream_chain
+from agents.prompts import layered_prompt
+from agents.registry import registry
+from agents.context import CHARS_PER_TOKEN, WRITER_MAP_CHUNK_TOKENS, WRITER_MAP_REDUCE_TOKENS, estimate_tokens
+from agents.search_results import chunk_text
+from agents.tracing import tracer
 
-def run_writer(task: str, llm, research_result: str, context: str) -> str:
+def _build_writer_chain(llm):
+    """Builds the prompt | llm chain for the writer agent."""
+    # Define the prompt template for the writer agent
+    writer_instructions = """
+    You are a writer agent. Your goal is to write a cohesive and well-structured report based on the provided research data.
+    Review the recent memory entries to understand the context of the task.
+
+    Based on the user's request and the research data given at the end, please generate a Markdown report that is well-structured, with a title, introduction, main body with sections, and a conclusion.
+    The report should be easy to read and understand.
+    """
+
+    prompt = layered_prompt(
+        writer_instructions,
+        project="{context}",
+        task="""
+        {relevant_context}
+
+        The research data is: {research_result}
+        The user's request is: {task}
+        """,
+    )
+
+    # Create the chain
+    return prompt | llm
+
+def _build_summary_chain(llm):
+    """Builds the prompt | llm chain that condenses one piece of research for the writer."""
+    # Define the prompt template for the map step of the writer agent
+    summary_instructions = """
+    You are a writer agent preparing the notes for one part of a report.
+
+    Condense the research given at the end into concise Markdown bullet points. Keep every fact, figure
+    and source URL that is relevant to the user's request, and do not add anything that is not in the research.
+    """
+
+    # The request is shared by every piece of the same report, so it comes before the piece
+    prompt = layered_prompt(
+        summary_instructions,
+        project="The user's request is: {task}",
+        task="""
+        The research is:
+        {research}
+        """,
+    )
+
+    # Create the chain
+    return prompt | llm
+
+def split_research(research_result: str, max_tokens: int = WRITER_MAP_CHUNK_TOKENS) -> list:
+    """
+    Splits research into pieces of at most about max_tokens for the map step.
+
+    Sections (starting with a "### " heading) are packed together while they
+    fit; larger sections are split into chunks that each repeat the heading.
+
+    Args:
+        research_result (str): The combined research.
+        max_tokens (int): The approximate maximum size of a piece.
+
+    Returns:
+        list: The pieces, in order.
+    """
+    pieces = []
+    for section in re.split(r"(?m)^(?=### )", research_result):
+        section = section.strip()
+        if not section:
+            continue
+        if estimate_tokens(section) <= max_tokens:
+            pieces.append(section)
+            continue
+        heading, _, body = section.partition("\n") if section.startswith("### ") else ("", "", section)
+        chunks = chunk_text(body, max_tokens * CHARS_PER_TOKEN - len(heading))
+        pieces.extend(f"{heading} (part {i + 1} of {len(chunks)})\n{chunk}" if heading else chunk for i, chunk in enumerate(chunks))
+
+    # Pack small neighbouring pieces together to save LLM calls
+    packed = []
+    for piece in pieces:
+        if packed and estimate_tokens(packed[-1]) + estimate_tokens(piece) <= max_tokens:
+            packed[-1] += "\n\n" + piece
+        else:
+            packed.append(piece)
+    return packed
+
+def _combine_notes(notes: list) -> str:
+    return "\n\n".join(f"### Notes {i + 1}\n{note}" for i, note in enumerate(notes))
+
+def _use_map_reduce(research_result: str, map_reduce) -> bool:
+    if map_reduce is None:
+        return estimate_tokens(research_result) > WRITER_MAP_REDUCE_TOKENS
+    return map_reduce
+
+def summarize_research(task: str, llm, research_result: str, map_width: int = 4, on_section=None) -> str:
+    """
+    Condenses research for the writer by summarizing its pieces in parallel (the map step).
+
+    Args:
+        task (str): The writing task.
+        llm (Ollama): The Ollama LLM instance.
+        research_result (str): The combined research.
+        map_width (int): The maximum number of pieces summarized at the same time.
+        on_section (callable, optional): Called with the notes of each piece as soon as they are done.
+
+    Returns:
+        str: The notes of all pieces, in the order of the research.
+    """
+    chain = registry.get("writer_summary_chain", lambda: _build_summary_chain(llm), llm)
+    pieces = split_research(research_result)
+
+    def summarize(piece):
+        note = chain.invoke({"task": task, "research": piece})
+        if on_section is not None:
+            on_section(note)
+        return note
+
+    with tracer.span("writer.map", pieces=len(pieces)):
+        with ThreadPoolExecutor(max_workers=max(1, min(map_width, len(pieces)))) as executor:
+            # Keep the caller's context, e.g. its span and LLM priority, in the threads
+            futures = [executor.submit(contextvars.copy_context().run, summarize, piece) for piece in pieces]
+            notes = [future.result() for future in futures]
+    return _combine_notes(notes)
+
+async def asummarize_research(task: str, llm, research_result: str, map_width: int = 4, on_section=None) -> str:
+    """
+    Asynchronously condenses research for the writer by summarizing its pieces concurrently.
+
+    Args:
+        task (str): The writing task.
+        llm (Ollama): The Ollama LLM instance.
+        research_result (str): The combined research.
+        map_width (int): The maximum number of pieces summarized at the same time.
+        on_section (callable, optional): Called with the notes of each piece as soon as they are done.
+
+    Returns:
+        str: The notes of all pieces, in the order of the research.
+    """
+    chain = registry.get("writer_summary_chain", lambda: _build_summary_chain(llm), llm)
+    pieces = split_research(research_result)
+    semaphore = asyncio.Semaphore(max(1, map_width))
+
+    async def summarize(piece):
+        async with semaphore:
+            note = await chain.ainvoke({"task": task, "research": piece})
+        if on_section is not None:
+            on_section(note)
+        return note
+
+    with tracer.span("writer.map", pieces=len(pieces)):
+        notes = await asyncio.gather(*(summarize(piece) for piece in pieces))
+    return _combine_notes(notes)
+
+def run_writer(task: str, llm, research_result: str, context: str, on_token=None, map_reduce: bool = None, map_width: int = 4, on_section=None, relevant_context: str = "") -> str:
     """
     Runs the writer agent for a given task.
 
+    Large research is written up map-reduce style: its pieces are condensed
+    in parallel and the report is written from the condensed notes, so the
+    report's prompt stays small however much research there is.
+
     Args:
         task (str): The writing task.
         llm (Ollama): The Ollama LLM instance.
         research_result (str): The research result from the researcher agent.
         context (str): The memory context from previous steps.
+        on_token (callable, optional): Called with each chunk of the report as it is generated.
+        map_reduce (bool, optional): Whether to condense the research first. By default,
+            only research larger than WRITER_MAP_REDUCE_TOKENS is condensed.
+        map_width (int): The maximum number of pieces condensed at the same time.
+        on_section (callable, optional): Called with the notes of each piece as soon as they are done.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
 
     Returns:
         str: The generated report.
     """
-    # Define the prompt template for the writer agent
-    writer_template = \"\"\"
-    You are a writer agent. Your goal is to write a cohesive and well-structured report based on the provided research data.
-    Review the following recent memory entries to understand the context of the task:
-    {context}
+    chain = registry.get("writer_chain", lambda: _build_writer_chain(llm), llm)
 
-    The user's request is: {task}
-    The research data is: {research_result}
+    if _use_map_reduce(research_result, map_reduce):
+        research_result = summarize_research(task, llm, research_result, map_width, on_section)
 
-    Based on the above, please generate a Markdown report that is well-structured, with a title, introduction, main body with sections, and a conclusion.
-    The report should be easy to read and understand.
-    \"\"\"
+    # Invoke the chain, streaming the report if requested
+    with tracer.span("writer.reduce"):
+        response = stream_chain(chain, {
+            "task": task,
+            "research_result": research_result,
+            "context": context,
+            "relevant_context": relevant_context,
+        }, on_token)
 
-    prompt = PromptTemplate(
-        template=writer_template,
-        input_variables=["task", "research_result", "context"],
-    )
+    return response
 
-    # Create the chain
-    chain = prompt | llm
-
-    # Invoke the chain
-    response = chain.invoke({
-        "task": task,
-        "research_result": research_result,
-        "context": context
-    })
+async def arun_writer(task: str, llm, research_result: str, context: str, on_token=None, map_reduce: bool = None, map_width: int = 4, on_section=None, relevant_context: str = "") -> str:
+    """
+    Asynchronously runs the writer agent for a given task.
+
+    Args:
+        task (str): The writing task.
+        llm (Ollama): The Ollama LLM instance.
+        research_result (str): The research result from the researcher agent.
+        context (str): The memory context from previous steps.
+        on_token (callable, optional): Called with each chunk of the report as it is generated.
+        map_reduce (bool, optional): Whether to condense the research first. By default,
+            only research larger than WRITER_MAP_REDUCE_TOKENS is condensed.
+        map_width (int): The maximum number of pieces condensed at the same time.
+        on_section (callable, optional): Called with the notes of each piece as soon as they are done.
+        relevant_context (str): Older memory entries relevant to this task, placed with the task in the prompt.
+
+    Returns:
+        str: The generated report.
+    """
+    chain = registry.get("writer_chain", lambda: _build_writer_chain(llm), llm)
+
+    if _use_map_reduce(research_result, map_reduce):
+        research_result = await asummarize_research(task, llm, research_result, map_width, on_section)
+
+    # Invoke the chain without blocking the event loop, streaming the report if requested
+    with tracer.span("writer.reduce"):
+        response = await astream_chain(chain, {
+            "task": task,
+            "research_result": research_result,
+            "context": context,
+            "relevant_context": relevant_context,
+        }, on_token)
 
     return response
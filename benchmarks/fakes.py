@@ -0,0 +1,157 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from tavily import TavilyClient
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def make_plan(size: int) -> list:
+    """
+    Returns a deterministic decomposition with `size` tasks.
+
+    Roughly two thirds of the tasks are independent Researcher tasks, a few
+    are Programmer tasks that depend on the research, and the last task is a
+    Writer that depends on everything before it.
+
+    Args:
+        size (int): The number of tasks.
+
+    Returns:
+        list: The task dictionaries, in the format decompose_task returns.
+    """
+    if size == 1:
+        return [{"id": "t1", "agent": "Researcher", "description": "Research topic 1.", "tools": ["Tavily Search API"], "depends_on": []}]
+
+    researchers = max(1, (size - 1) * 2 // 3)
+    tasks = []
+    for i in range(size - 1):
+        task_id = f"t{i + 1}"
+        if i < researchers:
+            tasks.append({"id": task_id, "agent": "Researcher", "description": f"Research topic {i + 1}.", "tools": ["Tavily Search API"], "depends_on": []})
+        else:
+            tasks.append({"id": task_id, "agent": "Programmer", "description": f"Analyse the data for topic {i + 1}.", "tools": [], "depends_on": [f"t{i - researchers + 1}"]})
+    tasks.append({"id": f"t{size}", "agent": "Writer", "description": "Write the final report.", "tools": [], "depends_on": [task["id"] for task in tasks]})
+    return tasks
+
+class ScriptedLLM(LLM):
+    """
+    A fake LLM that answers every agent prompt with a scripted response.
+
+    Each call waits `latency` seconds to model prompt prefill and then emits
+    the response at `tokens_per_second`, so scheduling and streaming behave
+    like they do against a real local model.
+    """
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    plan_size: int = 3
+    report_tokens: int = 200
+    research_tokens: int = 120
+    critic_tasks: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"latency": self.latency, "tokens_per_second": self.tokens_per_second, "plan_size": self.plan_size}
+
+    @staticmethod
+    def _words(prefix: str, count: int) -> str:
+        return " ".join(f"{prefix}{i}" for i in range(count))
+
+    def respond(self, prompt: str) -> str:
+        """Returns the scripted response for a rendered prompt."""
+        if "manager agent" in prompt:
+            return json.dumps({"tasks": make_plan(self.plan_size)})
+        if "critic agent" in prompt:
+            # Propose follow-up research and a revision of the report
+            tasks = [{"agent": "Researcher", "description": f"Research follow-up topic {i + 1}.", "tools": ["Tavily Search API"]} for i in range(self.critic_tasks)]
+            if tasks:
+                tasks.append({"agent": "Writer", "description": "Cover the follow-up topics.", "tools": []})
+            return json.dumps({"tasks": tasks})
+        if "Action Input:" in prompt and "Question:" in prompt:
+            # ReAct loop: search once, then answer
+            scratchpad = prompt.rsplit("Question:", 1)[1]
+            if "Observation:" not in scratchpad:
+                topic = re.search(r"Research Task: (.*)", scratchpad)
+                query = topic.group(1).strip() if topic else "research topic"
+                return f" I should search for this.\nAction: TavilySearch\nAction Input: {query}"
+            return " I now know the final answer\nFinal Answer: **Summary**: " + self._words("finding", self.research_tokens)
+        if "Python programmer" in prompt:
+            return "print(sum(range(10)))"
+        return "# Report\n\n" + self._words("word", self.report_tokens)
+
+    def _tokens(self, text: str) -> list:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        response = self.respond(prompt)
+        time.sleep(self.latency)
+        if self.tokens_per_second:
+            time.sleep(len(self._tokens(response)) / self.tokens_per_second)
+        return response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        response = self.respond(prompt)
+        time.sleep(self.latency)
+        for token in self._tokens(response):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+class FixtureTavilyClient(TavilyClient):
+    """
+    A Tavily client that serves recorded search responses from fixtures.
+
+    The fixture for a query is chosen deterministically from its hash, and
+    each search waits `latency` seconds to model the API round trip.
+    """
+
+    def __init__(self, fixtures_path: str = os.path.join(FIXTURES_DIR, "tavily_search.json"), latency: float = 0.0):
+        with open(fixtures_path) as f:
+            self.fixtures = json.load(f)
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query: str, **kwargs) -> dict:
+        self.calls += 1
+        time.sleep(self.latency)
+        digest = int(hashlib.sha256(query.encode("utf-8")).hexdigest(), 16)
+        return dict(self.fixtures[digest % len(self.fixtures)], query=query)
+
+class InProcessSandbox:
+    """A sandbox stand-in that runs code with exec in the current process."""
+
+    # Redirecting stdout is process-wide, so runs are serialized
+    _exec_lock = threading.Lock()
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        self.latency = latency
+
+    def run_code(self, code: str, env_vars=None) -> str:
+        time.sleep(self.latency)
+        output = io.StringIO()
+        with self._exec_lock:
+            try:
+                with contextlib.redirect_stdout(output):
+                    exec(code, {"__name__": "__sandbox__"})
+            except Exception:
+                return output.getvalue() + traceback.format_exc()
+        return output.getvalue()
+
+    def close(self):
+        pass
@@ -0,0 +1,80 @@
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points whose import cost is paid on every cold start
+DEFAULT_MODULES = ("agents.jobs", "agents.runtime", "worker", "agents.manager")
+
+def entry_point_imports(path: str) -> list:
+    """Returns the top-level import statements of a script, e.g. main.py."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def measure(statements: list, skip_missing: bool = True) -> dict:
+    """
+    Runs import statements in a fresh interpreter and measures them with -X importtime.
+
+    Args:
+        statements (list): The import statements, run in order.
+        skip_missing (bool): Skip statements whose module is not installed, e.g. streamlit.
+
+    Returns:
+        dict: The total wall time in seconds and the cumulative time of every imported module.
+    """
+    guarded = []
+    for statement in statements:
+        if skip_missing:
+            guarded.append(f"try:\n    {statement}\nexcept ModuleNotFoundError:\n    pass")
+        else:
+            guarded.append(statement)
+    code = "import time\nstart = time.perf_counter()\n" + "\n".join(guarded) + "\nprint(time.perf_counter() - start)"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+    modules = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1e6
+    return {"total": float(process.stdout.strip().splitlines()[-1]), "modules": modules}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the cold import time of the entry points.")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES), help="Modules to import.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest top-level imports to list.")
+    parser.add_argument("--budget", type=float, help="Exit with an error if main.py's imports take longer than this many seconds.")
+    args = parser.parse_args()
+
+    targets = [("main.py", entry_point_imports(os.path.join(ROOT, "main.py")))]
+    targets += [(module, [f"import {module}"]) for module in args.modules]
+
+    # Modules the interpreter imports at startup, before any of the statements run
+    startup = set(measure([])["modules"])
+
+    failed = False
+    for name, statements in targets:
+        result = measure(statements)
+        print(f"{name:<20} {result['total']:.3f}s")
+        top_level = {
+            module: seconds for module, seconds in result["modules"].items()
+            if "." not in module and module not in startup
+        }
+        for module, seconds in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {module:<32} {seconds:.3f}s")
+        if name == "main.py" and args.budget is not None and result["total"] > args.budget:
+            failed = True
+
+    if failed:
+        sys.exit(f"main.py imports exceed the budget of {args.budget:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+import agents.storage as storage
+from agents.manager import decompose_task, orchestrate_agents
+from agents.memory import AgentMemory
+from agents.programmer import run_programmer
+from agents.researcher import run_researcher
+from agents.writer import run_writer
+from agents.critic import run_critic
+from agents.sandbox_pool import SandboxPool
+from agents.tools import SandboxExecutor
+from benchmarks.fakes import ScriptedLLM, FixtureTavilyClient, InProcessSandbox
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+class DBWriteCounter:
+    """
+    Counts the write statements and commits issued through the storage layer.
+
+    Installs an SQLite trace callback on every connection that the storage
+    module configures while the counter is active.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+        self._original = None
+
+    def _trace(self, statement: str):
+        statement = statement.lstrip().upper()
+        with self._lock:
+            if statement.startswith(WRITE_PREFIXES):
+                self.writes += 1
+            elif statement.startswith("COMMIT"):
+                self.commits += 1
+
+    def __enter__(self):
+        self._original = storage.configure_connection
+
+        def configure_connection(conn):
+            conn = self._original(conn)
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        storage.configure_connection = configure_connection
+        return self
+
+    def __exit__(self, *exc_info):
+        storage.configure_connection = self._original
+
+class TimedQueue(queue.Queue):
+    """A queue that records when each item was put."""
+
+    def put(self, item, block=True, timeout=None):
+        super().put((time.perf_counter(), item), block, timeout)
+
+def stage_times(tasks: list, events: TimedQueue) -> dict:
+    """Sums the running time of the tasks of each agent from their status events."""
+    started = {}
+    totals = defaultdict(float)
+    while not events.empty():
+        timestamp, event = events.get_nowait()
+        if event.kind != "status":
+            continue
+        if event.text == "running":
+            started[event.task_index] = timestamp
+        elif event.task_index in started:
+            totals[tasks[event.task_index]["agent"]] += timestamp - started.pop(event.task_index)
+    return dict(totals)
+
+def run_project(db_path: str, llm, tavily_client, sandbox_executor) -> dict:
+    """Runs one research project end to end and returns its timings."""
+    project_id = str(uuid.uuid4())
+    start = time.perf_counter()
+    tasks = decompose_task("Topic: European solar market\nGoal: Write a market report.", llm)
+    decomposed = time.perf_counter()
+
+    events = TimedQueue()
+    orchestrate_agents(
+        project_id, tasks, storage.get_connection(db_path), llm, tavily_client, sandbox_executor,
+        memory=AgentMemory(db_path), event_queue=events,
+    )
+    end = time.perf_counter()
+
+    stages = {"decompose": decomposed - start}
+    stages.update(stage_times(tasks, events))
+    return {"latency": end - start, "stages": stages, "tasks": len(tasks)}
+
+def run_scenario(name: str, plan_size: int, projects: int, args) -> dict:
+    """
+    Runs `projects` concurrent projects of `plan_size` tasks each in a fresh database.
+
+    Returns:
+        dict: The end-to-end latency, summed per-stage times, DB write counts and peak memory.
+    """
+    llm = ScriptedLLM(latency=args.latency, tokens_per_second=args.tokens_per_second, plan_size=plan_size)
+    tavily_client = FixtureTavilyClient(latency=args.search_latency)
+    pool = SandboxPool(size=args.sandboxes, factory=InProcessSandbox, latency=args.sandbox_latency)
+    sandbox_executor = SandboxExecutor(pool=pool)
+
+    with tempfile.TemporaryDirectory() as tmp, DBWriteCounter() as counter:
+        db_path = os.path.join(tmp, "research_agent.db")
+        storage.migrate(storage.get_connection(db_path))
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = [None] * projects
+
+        def worker(i):
+            results[i] = run_project(db_path, llm, tavily_client, sandbox_executor)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(projects)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        storage.close_connection(db_path)
+
+    pool.close()
+    stages = defaultdict(float)
+    for result in results:
+        for stage, seconds in result["stages"].items():
+            stages[stage] += seconds
+
+    return {
+        "scenario": name,
+        "projects": projects,
+        "tasks_per_project": plan_size,
+        "wall_time": elapsed,
+        "mean_project_latency": sum(r["latency"] for r in results) / projects,
+        "stages": dict(stages),
+        "db_writes": counter.writes,
+        "db_commits": counter.commits,
+        "tavily_calls": tavily_client.calls,
+        "peak_memory_mb": peak / 2**20,
+    }
+
+def run_agent_benchmarks(args) -> list:
+    """Times each run_* agent function once on its own."""
+    llm = ScriptedLLM(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    tavily_client = FixtureTavilyClient(latency=args.search_latency)
+    pool = SandboxPool(size=1, factory=InProcessSandbox, latency=args.sandbox_latency)
+    sandbox_executor = SandboxExecutor(pool=pool)
+    context = "No recent memory entries found."
+    calls = {
+        "run_researcher": lambda: run_researcher("Research topic 1.", llm, tavily_client, context),
+        "run_writer": lambda: run_writer("Write the final report.", llm, "Some research.", context),
+        "run_programmer": lambda: run_programmer("Analyse the data.", llm, sandbox_executor, context),
+        "run_critic": lambda: run_critic("# Report", llm),
+    }
+
+    results = []
+    for name, call in calls.items():
+        start = time.perf_counter()
+        call()
+        results.append({"scenario": name, "wall_time": time.perf_counter() - start})
+    pool.close()
+    return results
+
+def format_result(result: dict) -> str:
+    """Formats one benchmark result as a single line."""
+    if "projects" not in result:
+        return f"{result['scenario']:<16} wall={result['wall_time']:.3f}s"
+    stages = " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in sorted(result["stages"].items()))
+    return (
+        f"{result['scenario']:<16} projects={result['projects']:<3} tasks={result['tasks_per_project']:<3} "
+        f"wall={result['wall_time']:.3f}s mean={result['mean_project_latency']:.3f}s "
+        f"writes={result['db_writes']} commits={result['db_commits']} searches={result['tavily_calls']} "
+        f"peak={result['peak_memory_mb']:.1f}MB [{stages}]"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the agent pipeline.")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 5, 10, 25, 50], help="Plan sizes for the single-project scenarios.")
+    parser.add_argument("--projects", type=int, nargs="+", default=[1, 5, 10, 20], help="Numbers of concurrent projects.")
+    parser.add_argument("--project-tasks", type=int, default=5, help="Plan size for the concurrent-project scenarios.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds of simulated prefill per LLM call.")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Simulated generation speed; 0 for instant.")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Seconds per simulated Tavily search.")
+    parser.add_argument("--sandbox-latency", type=float, default=0.01, help="Seconds per simulated sandbox run.")
+    parser.add_argument("--sandboxes", type=int, default=2, help="Size of the sandbox pool.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run_agent_benchmarks(args)
+    for size in args.tasks:
+        results.append(run_scenario("tasks", size, 1, args))
+    for projects in args.projects:
+        results.append(run_scenario("projects", args.project_tasks, projects, args))
+
+    for result in results:
+        print(format_result(result))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,177 @@
 import streamlit as st
 import os
-import sqlite3
-import uuid
-from langchain_community.llms import Ollama
-from tavily import TavilyClient
-from agents.manager import decompose_task, orchestrate_agents
-from agents.tools import SandboxExecutor
-from ai_code_sandbox import AICodeSandbox
+import time
+from agents.blob_store import resolve
+from agents.jobs import JobQueue
+from agents.runtime import init_db
+from agents.storage import DEFAULT_DB_PATH, get_connection, close_connection
+from agents.task_events import load_task_events
+from agents.tracing import DEFAULT_TRACE_PATH, load_trace
+
+# Research projects run in worker processes (see worker.py). This app only
+# submits them to the job queue and polls their progress from the database,
+# so it imports none of the agents' heavy dependencies.
+
+PROJECT_TASKS_SQL = "SELECT task_index, agent, description, status, result FROM tasks WHERE project_id = ? ORDER BY id"
+
+# This project's writer or programmer agent results, preferring the latest Writer
+REPORT_SQL = """
+    SELECT result, result_blob FROM tasks
+    WHERE project_id = ? AND agent IN ('Writer', 'Programmer') AND status = 'completed'
+    ORDER BY agent = 'Writer' DESC, id DESC
+    LIMIT 1
+"""
 
 # --- Initialization ---
 
-# Initialize Ollama
-def get_ollama_llm(model="llama3", host="http://ollama:11434"):
-    """Initializes and returns the Ollama LLM instance."""
-    return Ollama(model=model, base_url=host)
-
-# Initialize Tavily client
-def get_tavily_client():
-    """Initializes and returns the Tavily client."""
-    tavily_api_key = os.getenv("TAVILY_API_KEY")
-    if not tavily_api_key:
-        st.error("Tavily API key not found. Please set the TAVILY_API_KEY environment variable.")
-        st.stop()
-    return TavilyClient(api_key=tavily_api_key)
-
-# Initialize SQLite database
-def init_db():
-    """Initializes the SQLite database and creates tables if they don't exist."""
-    conn = sqlite3.connect('research_agent.db')
-    cursor = conn.cursor()
-
-    # Create a table for tasks
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY,
-            description TEXT,
-            status TEXT,
-            result TEXT,
-            agent TEXT
-        )
-    ''')
-
-    # Create a table for agent memory
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS agent_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project_id TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            agent_name TEXT,
-            action TEXT,
-            content TEXT
-        )
-    ''')
-
-    conn.commit()
-    return conn
+# Initialize the job queue once per server process
+@st.cache_resource
+def get_job_queue():
+    """Applies any pending schema migrations and returns the job queue."""
+    init_db()
+    return JobQueue()
+
+# Show where a project's time went
+def render_waterfall(project_id):
+    """Renders the spans of a project from the trace file as a waterfall chart, one bar per span."""
+    trace_path = os.getenv("TRACE_PATH", DEFAULT_TRACE_PATH)
+    if not os.path.exists(trace_path):
+        return
+    spans = sorted(load_trace(trace_path, project_id), key=lambda span: span["start_time"])
+    if not spans:
+        return
+
+    start = spans[0]["start_time"]
+    depths = {}
+    rows = []
+    for i, span in enumerate(spans):
+        depth = depths.get(span["parent_id"], -1) + 1
+        depths[span["span_id"]] = depth
+        detail = span["attributes"].get("agent") or span["attributes"].get("model") or ""
+        rows.append({
+            "span": f"{i:03d} {'· ' * depth}{span['name']} {detail}".rstrip(),
+            "name": span["name"],
+            "start": span["start_time"] - start,
+            "end": span["start_time"] - start + span["duration"],
+            "duration": round(span["duration"], 3),
+            "status": span["status"],
+        })
+
+    with st.expander("Trace"):
+        st.vega_lite_chart({
+            "data": {"values": rows},
+            "mark": "bar",
+            "encoding": {
+                "y": {"field": "span", "type": "nominal", "sort": None, "title": None},
+                "x": {"field": "start", "type": "quantitative", "title": "seconds"},
+                "x2": {"field": "end"},
+                "color": {"field": "name", "type": "nominal"},
+                "tooltip": [{"field": "span"}, {"field": "duration"}, {"field": "status"}],
+            },
+        }, use_container_width=True)
+
+# Poll a project until its job finishes
+def watch_project(job_queue, project_id, poll_interval=1.0):
+    """
+    Shows the progress of a project's tasks, refreshing until its job has finished.
+
+    Reloading the page resumes watching, since the project ID is kept in the URL.
+    """
+    conn = get_connection(DEFAULT_DB_PATH)
+    status_view = st.empty()
+    tasks_view = st.empty()
+
+    # The output and steps the worker has logged for each running task
+    last_event_id = 0
+    outputs = {}
+    steps = {}
+
+    while True:
+        job = job_queue.get(project_id)
+        if job is None:
+            st.error("Unknown research project.")
+            return
+
+        for last_event_id, task_index, kind, text in load_task_events(conn, project_id, last_event_id):
+            if kind == "token":
+                outputs[task_index] = outputs.get(task_index, "") + text
+            else:
+                steps.setdefault(task_index, []).append(text)
+
+        status_view.info(f"Project {project_id}: {job.status}")
+        rows = conn.execute(PROJECT_TASKS_SQL, (project_id,)).fetchall()
+        with tasks_view.container():
+            for task_index, agent, description, status, result in rows:
+                live = not result and (task_index in outputs or task_index in steps)
+                with st.expander(f"{agent}: {description} ({status})", expanded=live):
+                    if result:
+                        st.markdown(result)
+                    elif live:
+                        for step in steps.get(task_index, []):
+                            st.caption(step)
+                        st.markdown(outputs.get(task_index, ""))
+
+        if job.status in ("completed", "failed"):
+            break
+        time.sleep(poll_interval)
+
+    if job.status == "failed":
+        st.error(f"The research project failed: {job.error}")
+
+    # Completed tasks are kept, so resuming only runs the failed and unfinished ones
+    if job.status == "failed" or any(status == "failed" for _, _, _, status, _ in rows):
+        if st.button("Resume"):
+            job_queue.retry(project_id)
+            st.rerun()
+
+    report = conn.execute(REPORT_SQL, (project_id,)).fetchone()
+    if report:
+        st.subheader("Final Report:")
+        # Task rows only hold a preview of a large result
+        st.markdown(resolve(conn, *report))
+    elif job.status == "completed":
+        st.error("Could not retrieve the final report.")
+
+    render_waterfall(project_id)
 
 # --- Streamlit UI ---
 
-st.title("Autonomous AI Research Agent")
+def render_app():
+    """Renders the app for one script run."""
+    st.title("Autonomous AI Research Agent")
 
-# Get user input
-topic = st.text_input("Enter the research topic:")
-goal = st.text_area("Enter the research goal:")
-
-if st.button("Start Research"):
-    if topic and goal:
-        st.info("Starting the research process...")
+    try:
+        job_queue = get_job_queue()
+    except Exception as e:
+        st.error(f"An error occurred during initialization: {e}")
+        st.stop()
 
-        # Initialize everything
-        try:
-            llm = get_ollama_llm()
-            tavily = get_tavily_client()
-            db_conn = init_db()
-            sandbox = AICodeSandbox()
-            sandbox_executor = SandboxExecutor(sandbox=sandbox)
+    # List the recent projects so any of them can be reopened
+    with st.sidebar:
+        st.subheader("Recent Projects")
+        for job in job_queue.recent(limit=10):
+            label = job.query.split("\n", 1)[0].removeprefix("Topic: ")
+            if st.button(f"{label} ({job.status})", key=job.project_id):
+                st.query_params["project"] = job.project_id
 
-            st.success("Core components initialized successfully!")
+    # Get user input
+    topic = st.text_input("Enter the research topic:")
+    goal = st.text_area("Enter the research goal:")
 
-            # 1. Decompose the task
-            st.write("Decomposing the task...")
+    if st.button("Start Research"):
+        if topic and goal:
             user_query = f"Topic: {topic}\nGoal: {goal}"
-            tasks = decompose_task(user_query, llm)
-
-            if tasks:
-                st.write("Tasks decomposed successfully!")
-                st.subheader("Planned Tasks:")
-                for task in tasks:
-                    st.write(f"- **Agent:** {task['agent']}, **Task:** {task['description']}")
-
-                # 2. Orchestrate the agents
-                st.write("Orchestrating agents...")
-                project_id = str(uuid.uuid4())
-                task_ids = orchestrate_agents(project_id, tasks, db_conn, llm, tavily, sandbox_executor)
-                st.success(f"Tasks have been created and stored with IDs: {task_ids}")
-
-                # 3. Display the final report
-                st.write("Fetching the final report...")
-                cursor = db_conn.cursor()
-                # Check for writer or programmer agent results
-                cursor.execute("SELECT result FROM tasks WHERE agent IN ('Writer', 'Programmer') AND status = 'completed'")
-                report = cursor.fetchone()
-
-                if report:
-                    st.subheader("Final Report:")
-                    st.markdown(report[0])
-                else:
-                    st.error("Could not retrieve the final report.")
-
-            else:
-                st.error("Failed to decompose the task. Please try again.")
-
-            db_conn.close()
-            sandbox.close()
-
-        except Exception as e:
-            st.error(f"An error occurred during initialization: {e}")
-    else:
-        st.warning("Please provide both a topic and a goal.")
+            st.query_params["project"] = job_queue.submit(user_query)
+            st.info("The research project has been queued.")
+        else:
+            st.warning("Please provide both a topic and a goal.")
+
+    project_id = st.query_params.get("project")
+    if project_id:
+        watch_project(job_queue, project_id)
+
+try:
+    render_app()
+finally:
+    # Streamlit runs every rerun on a new thread, so close this thread's connection
+    close_connection(DEFAULT_DB_PATH)
@@ -0,0 +1,32 @@
+import pytest
+from langchain_community.llms.fake import FakeListLLM
+from agents.code_execution import CodeCompileError, ExecutionCache
+from agents.programmer import run_programmer
+from agents.registry import registry
+from agents.tools import SandboxExecutor
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ExecutionCache(db_path=str(tmp_path / "execution_cache.db"))
+    yield cache
+    cache.close()
+
+@pytest.mark.parametrize("output", [
+    "Error (exit code 1): ",
+    "Error: name 'x' is not defined",
+    "Traceback (most recent call last):\n  ...",
+])
+def test_failed_runs_are_not_cached(cache, output):
+    cache.put("print(x)", "", output)
+    assert cache.get("print(x)", "") is None
+
+def test_successful_runs_are_cached_by_normalized_code(cache):
+    cache.put("print(1)  # one", "inputs", "1\n")
+    assert cache.get("print( 1 )", "inputs") == "1\n"
+    assert cache.get("print(1)", "other inputs") is None
+
+def test_code_that_does_not_compile_fails_the_task(cache):
+    registry.clear()
+    llm = FakeListLLM(responses=["print(1", "print(1"])
+    with pytest.raises(CodeCompileError):
+        run_programmer("Print one.", llm, SandboxExecutor(execution_cache=cache), "")
@@ -0,0 +1,35 @@
+import asyncio
+import json
+from agents.llm_cache import LLMResponseCache
+from agents.ollama_client import GatewayOllama
+
+class FakeOllama(GatewayOllama):
+    """Answers every prompt with the same two chunks, counting the requests."""
+    requests: int = 0
+
+    def _create_generate_stream(self, prompt, stop=None, images=None, **kwargs):
+        self.requests += 1
+        yield json.dumps({"response": "Hello ", "done": False})
+        yield json.dumps({"response": "world", "done": True})
+
+    async def _acreate_generate_stream(self, prompt, stop=None, images=None, **kwargs):
+        for response in self._create_generate_stream(prompt, stop, images, **kwargs):
+            yield response
+
+def test_streamed_calls_use_the_response_cache(tmp_path):
+    cache = LLMResponseCache(db_path=str(tmp_path / "llm_cache.db"))
+    llm = FakeOllama(model="llama3", cache=cache)
+
+    assert "".join(llm.stream("prompt")) == "Hello world"
+    assert list(llm.stream("prompt")) == ["Hello world"]
+    assert llm.invoke("prompt") == "Hello world"
+    assert llm.requests == 1
+
+    async def astream(prompt):
+        return [chunk async for chunk in llm.astream(prompt)]
+
+    assert asyncio.run(astream("prompt")) == ["Hello world"]
+    assert "".join(asyncio.run(astream("other prompt"))) == "Hello world"
+    assert llm.invoke("other prompt") == "Hello world"
+    assert llm.requests == 2
+    cache.close()
@@ -0,0 +1,43 @@
+import json
+from agents.checkpoint import Checkpoint
+from agents.manager import _begin_project, _refinement_rounds, plan_revision
+from agents.scheduler import resolve_dependencies
+
+FEEDBACK = json.dumps({"tasks": [{"agent": "Writer", "description": "Cover the follow-up topics."}]})
+
+def _revised_plan():
+    tasks = [
+        {"agent": "Researcher", "description": "Research the topic.", "tools": [], "depends_on": []},
+        {"agent": "Writer", "description": "Write the report.", "tools": [], "depends_on": [0]},
+        {"agent": "Critic", "description": "Review the report.", "tools": [], "depends_on": [1]},
+    ]
+    tasks.extend(plan_revision(tasks, 1, json.loads(FEEDBACK)))
+    return tasks
+
+def test_revision_notes_are_not_repeated():
+    tasks = _revised_plan()
+    assert tasks[-1]["notes"] == ["Cover the follow-up topics."]
+    assert tasks[-1]["revises"] == 1
+    assert resolve_dependencies(tasks)[-1] == [0]
+    assert plan_revision(tasks, len(tasks) - 1, json.loads(FEEDBACK)) == []
+
+def test_resumed_rounds_compare_against_the_reviewed_report():
+    tasks = _revised_plan()
+    outcomes = {0: "research", 1: "The report.", 2: FEEDBACK, 3: "The report."}
+
+    # The revision did not change the report, so a resumed run stops here
+    assert list(_refinement_rounds(tasks, outcomes, 1, 4, 0.95, reviewed_report=1)) == []
+    # Without it, the revision is reviewed again as if it were the first report
+    assert next(_refinement_rounds(tasks, outcomes, 1, 4, 0.95))[0]["agent"] == "Critic"
+
+def test_resume_reruns_tasks_downstream_of_failed_ones():
+    tasks = [
+        {"id": "r1", "agent": "Researcher", "description": "First topic.", "depends_on": []},
+        {"id": "r2", "agent": "Researcher", "description": "Second topic.", "depends_on": []},
+        {"id": "w", "agent": "Writer", "description": "Write the report.", "depends_on": ["r1", "r2"]},
+        {"id": "c", "agent": "Critic", "description": "Review the report.", "depends_on": ["w"]},
+    ]
+    # The second Researcher failed, and the report was written without it
+    checkpoint = Checkpoint(tasks, [1, 2, 3, 4], {0: "research", 2: "The report.", 3: FEEDBACK}, {})
+    _, finished, _, _ = _begin_project(None, "project", tasks, None, checkpoint)
+    assert finished == {0: "research"}
@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from agents.sandbox_pool import SandboxPool
+from agents.tools import SandboxExecutor
+from benchmarks.fakes import InProcessSandbox
+
+def test_busy_pool_times_out():
+    pool = SandboxPool(size=1, factory=InProcessSandbox)
+    executor = SandboxExecutor(pool=pool, checkout_timeout=0.1)
+    first = executor.for_session("p1")
+    assert first._run("print('hi')") == "hi\n"
+
+    with pytest.raises(TimeoutError):
+        executor.for_session("p2")._run("print('hi')")
+
+    first.end_session()
+    assert executor.for_session("p2")._run("print('hi')") == "hi\n"
+    pool.close()
+
+def test_ended_session_sandbox_is_not_reused():
+    pool = SandboxPool(size=1, factory=InProcessSandbox)
+    with pool.session("p1") as pinned:
+        pass
+    pool.end_session("p1")
+
+    with pool.sandbox(timeout=5) as sandbox:
+        assert sandbox is not pinned
+    assert pool.recycled == 1
+    pool.close()
+
+def test_concurrent_checkouts_do_not_overfill_the_pool():
+    def slow_sandbox(**kwargs):
+        time.sleep(0.05)
+        return InProcessSandbox()
+
+    pool = SandboxPool(size=2, factory=slow_sandbox, warm=False)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(pool.checkout, 0.2) for _ in range(8)]
+        checked_out = [future.result() for future in futures if future.exception() is None]
+    assert len(checked_out) == 2
+    assert pool._created == 2
+    pool.close()
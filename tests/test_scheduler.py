@@ -0,0 +1,30 @@
+import asyncio
+from agents.scheduler import arun_task_graph, resolve_dependencies
+
+def test_async_on_complete_is_awaited_before_dependents_run():
+    recorded = []
+
+    async def execute(index, results):
+        return sorted(recorded)
+
+    async def on_complete(index, status, result):
+        await asyncio.sleep(0)
+        recorded.append(index)
+
+    results = asyncio.run(arun_task_graph([[], [0]], execute, on_complete))
+    assert results == {0: [], 1: [0]}
+    assert recorded == [0, 1]
+
+def test_depends_on_prefers_ids_over_indices():
+    tasks = [
+        {"id": 1, "agent": "Researcher", "depends_on": []},
+        {"id": 2, "agent": "Researcher", "depends_on": []},
+        {"id": 3, "agent": "Writer", "depends_on": [1, "2"]},
+        {"agent": "Critic", "depends_on": [3]},
+    ]
+    assert resolve_dependencies(tasks) == [[], [], [0, 1], [2]]
+
+def test_unresolvable_dependencies_are_reported(capsys):
+    tasks = [{"id": "a", "agent": "Researcher", "depends_on": ["a", "missing", 5]}]
+    assert resolve_dependencies(tasks) == [[]]
+    assert capsys.readouterr().out.count("Ignoring dependency") == 3
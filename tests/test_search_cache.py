@@ -0,0 +1,62 @@
+import asyncio
+import sqlite3
+import threading
+import pytest
+from agents.search_cache import SearchCache
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SearchCache(db_path=str(tmp_path / "search_cache.db"))
+    yield cache
+    cache.close()
+
+def test_cancelled_owner_does_not_block_later_callers(cache):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow(query):
+            started.set()
+            await asyncio.sleep(60)
+
+        async def fast(query):
+            return {"query": query}
+
+        owner = asyncio.ensure_future(cache.aget_or_fetch("q", slow))
+        await started.wait()
+        waiter = asyncio.ensure_future(cache.aget_or_fetch("q", fast))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+
+        assert not cache._in_flight
+        # The waiter searches again itself, and later callers are served from the cache
+        assert await asyncio.wait_for(waiter, 1) == {"query": "q"}
+        assert await asyncio.wait_for(cache.aget_or_fetch("q", slow), 1) == {"query": "q"}
+
+    asyncio.run(scenario())
+
+def test_failing_put_releases_waiters(cache, monkeypatch):
+    def failing_put(query, result):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "put", failing_put)
+    release = threading.Event()
+    results = []
+
+    def fetch(query):
+        release.wait(5)
+        return {"query": query}
+
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_fetch("q", fetch)))
+    owner.start()
+    while not cache._in_flight:
+        pass
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_fetch("q", fetch)))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert results == [{"query": "q"}, {"query": "q"}]
+    assert not cache._in_flight
@@ -0,0 +1,34 @@
+from agents.memory import AgentMemory
+from agents.semantic_memory import HashingEmbedder, SemanticMemory
+from agents.storage import get_connection, migrate
+
+def test_changing_the_embedder_reembeds_entries(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    conn = get_connection(db_path)
+    migrate(conn)
+    for i in range(3):
+        conn.execute(
+            "INSERT INTO agent_memory (project_id, agent_name, action, content) VALUES (?, ?, ?, ?)",
+            ("p", "Researcher", "completed_task", f"solar panel market report {i}"),
+        )
+    conn.commit()
+
+    assert SemanticMemory(HashingEmbedder(512)).index_pending(conn) == 3
+    semantic_memory = SemanticMemory(HashingEmbedder(768))
+    assert semantic_memory.index_pending(conn) == 3
+    assert semantic_memory.search(conn, "solar panel market", k=3)
+
+    memory = AgentMemory(db_path, semantic_memory=semantic_memory)
+    assert "Relevant Memory Entries" in memory.get_context("p", limit=1, query="solar panel market report")
+
+def test_unusable_embedder_falls_back_to_recent_entries(tmp_path):
+    class BrokenEmbedder:
+        def embed_documents(self, texts):
+            raise ConnectionError("embedding model is unreachable")
+
+    db_path = str(tmp_path / "memory.db")
+    migrate(get_connection(db_path))
+    memory = AgentMemory(db_path, semantic_memory=SemanticMemory(BrokenEmbedder()))
+    memory.save_entry("p", "Writer", "completed_task", "report")
+
+    assert "Writer completed_task: report" in memory.get_context("p", query="report")
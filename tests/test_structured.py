@@ -0,0 +1,27 @@
+from agents.scheduler import resolve_dependencies
+from agents.structured import parse_feedback, parse_plan
+
+def test_brackets_in_prose_before_the_plan_are_skipped():
+    plan = parse_plan(
+        'Here [1] is the plan {"tasks": ['
+        '{"id": 1, "agent": "Researcher", "description": "Research.", "depends_on": []}, '
+        '{"id": 2, "agent": "Writer", "description": "Write.", "depends_on": [1]}]}'
+    )
+    assert [task["agent"] for task in plan["tasks"]] == ["Researcher", "Writer"]
+
+def test_numeric_ids_and_references_match():
+    plan = parse_plan(
+        '{"tasks": ['
+        '{"id": 1, "agent": "Researcher", "description": "First topic."}, '
+        '{"id": 2, "agent": "Researcher", "description": "Second topic."}, '
+        '{"id": 3, "agent": "Writer", "description": "Write.", "depends_on": [1, 2]}]}'
+    )
+    assert plan["tasks"][2]["depends_on"] == ["1", "2"]
+    assert resolve_dependencies(plan["tasks"]) == [[], [], [0, 1]]
+
+def test_truncated_plan_keeps_its_complete_tasks():
+    plan = parse_plan('{"tasks": [{"id": "t1", "agent": "Researcher", "description": "Research.", "tools": [], "depends_on": []}, {"id": "t2", "agent": "Wri')
+    assert [task["id"] for task in plan["tasks"]] == ["t1"]
+
+def test_empty_feedback():
+    assert parse_feedback('```json\n{"tasks": []}\n```') == {"tasks": []}
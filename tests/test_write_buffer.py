@@ -0,0 +1,45 @@
+import sqlite3
+import pytest
+from agents.blob_store import load_blob, offload
+from agents.storage import WriteBuffer, close_connection, get_connection
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / "buffer.db")
+    conn = get_connection(db_path)
+    conn.execute("CREATE TABLE items (name TEXT NOT NULL)")
+    conn.commit()
+    yield db_path
+    close_connection(db_path)
+
+def test_failed_flush_keeps_the_statements(db_path):
+    buffer = WriteBuffer(db_path)
+    buffer.add("INSERT INTO items (name) VALUES (?)", ("first",))
+    buffer.add("INSERT INTO missing (name) VALUES (?)", ("second",))
+    with pytest.raises(sqlite3.Error):
+        buffer.flush()
+    assert len(buffer) == 2
+
+    # Once the cause is fixed, the next flush writes everything in order
+    conn = get_connection(db_path)
+    conn.execute("CREATE TABLE missing (name TEXT NOT NULL)")
+    conn.commit()
+    buffer.flush()
+    assert len(buffer) == 0
+    assert conn.execute("SELECT name FROM items").fetchall() == [("first",)]
+    assert conn.execute("SELECT name FROM missing").fetchall() == [("second",)]
+
+def test_blob_and_its_row_are_flushed_together(db_path):
+    conn = get_connection(db_path)
+    conn.execute("CREATE TABLE blobs (hash TEXT PRIMARY KEY, size INTEGER, data BLOB)")
+    conn.commit()
+    buffer = WriteBuffer(db_path, max_pending=2)
+    buffer.add("INSERT INTO items (name) VALUES (?)", ("first",))
+
+    text, blob_hash, writes = offload("x" * 10, threshold=5)
+    buffer.add_many(writes + [("INSERT INTO items (name) VALUES (?)", (blob_hash,))])
+
+    # The buffer filled up with the blob, but it is only flushed once the row is queued too
+    assert len(buffer) == 0
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+    assert load_blob(conn, blob_hash) == "x" * 10
@@ -0,0 +1,69 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+from agents.jobs import JobQueue, Worker
+from agents.runtime import ProjectRunner, init_db, init_tracing
+from agents.storage import DEFAULT_DB_PATH, close_connection
+
+def run_worker_process(index: int, concurrency: int, poll_interval: float):
+    """
+    Runs one worker process until it receives SIGTERM or SIGINT.
+
+    Args:
+        index (int): The index of the process, used to give it its own metrics port.
+        concurrency (int): The maximum number of jobs the process runs at the same time.
+        poll_interval (float): The number of seconds between checks for new jobs.
+    """
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+    init_tracing(metrics_port_offset=index)
+    runner = ProjectRunner(concurrency=concurrency)
+    try:
+        Worker(JobQueue(), runner, concurrency=concurrency, poll_interval=poll_interval).run(stop_event)
+    finally:
+        runner.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Processes queued research projects.")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")), help="Number of worker processes.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")), help="Projects run at the same time by each process.")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between checks for new jobs.")
+    args = parser.parse_args()
+
+    # Apply any pending migrations once, before the processes start claiming jobs
+    init_db()
+    # A SQLite connection must not be shared across a fork, so each process opens its own
+    close_connection(DEFAULT_DB_PATH)
+
+    processes = {}
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, lambda *args: stopping.set())
+
+    def start(index):
+        process = multiprocessing.Process(target=run_worker_process, args=(index, args.concurrency, args.poll_interval))
+        process.start()
+        processes[index] = process
+
+    for index in range(args.processes):
+        start(index)
+    print(f"Started {args.processes} worker processes with {args.concurrency} projects each.")
+
+    # Restart processes that die; their jobs are requeued once their heartbeats go stale
+    while not stopping.wait(5.0):
+        for index, process in list(processes.items()):
+            if not process.is_alive():
+                print(f"Worker process {index} exited with code {process.exitcode}; restarting it.")
+                start(index)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join()
+
+if __name__ == "__main__":
+    main()